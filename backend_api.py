@@ -164,12 +164,30 @@ def run_experiment():
         user_model = data.get('user_model', 'qwen-max')  # 双模型模式的User模型
         agent_model = data.get('agent_model', 'gpt-4o-mini')  # 双模型模式的Agent模型
         dialogue_rounds = data.get('dialogue_rounds', 3)  # 双模型对话轮数
+        dual_branching = data.get('dual_branching', False)  # 双模型树状生成（候选共享对话前缀）
+        early_stop = data.get('early_stop', 'off')  # 双模型对话提前结束: off / heuristic / flag / both
+        dual_beam = data.get('dual_beam', False)  # 双模型在线束搜索（轮次打分 + 剪枝）
+        turn_scorer = data.get('turn_scorer', 'judge')  # 束搜索轮次打分: judge / prefilter
+        branch_schedule = data.get('branch_schedule')  # 每轮分叉系数，如 [1, 2, 2] 或 '1,2,2'
         num_turns = data.get('num_turns', 5)  # 单模型生成轮数
         
         # 新增：打分配置
-        scoring_mode = data.get('scoring_mode', 'per_turn')  # 'per_turn' 或 'overall'
+        scoring_mode = data.get('scoring_mode', 'per_turn')  # 'per_turn' / 'overall' / 'listwise' / 'halving'
+        listwise_chunk_size = data.get('listwise_chunk_size')  # 列表式打分每次请求的最大候选数
+        adaptive = data.get('adaptive', False)  # 自适应候选预算（candidates 为每题上限）
+        candidate_budget = data.get('candidate_budget')  # 自适应模式全局候选预算
+        target_total = data.get('target_total')  # 自适应模式目标 Total
+        prefilter = data.get('prefilter', 'off')  # 评分前本地预筛: off / reject / rank
+        prefilter_max_per_question = data.get('prefilter_max_per_question')  # 预筛后每个问题最多送评的候选数
         scoring_top_k = data.get('scoring_top_k', None)  # Top-K筛选
-        scoring_model = data.get('scoring_model', 'gpt-4o-mini')  # 打分使用的模型
+        scoring_model = data.get('scoring_model', 'turing-gpt')  # 打分使用的模型
+        scoring_judges = data.get('scoring_judges')  # 多评委集成: ['qwen-plus', 'turing-gpt-mini'] 或逗号分隔字符串
+        judge_weights = data.get('judge_weights')  # 评委权重: {'qwen-plus': 2} 或 'qwen-plus=2'
+        judge_weighting = data.get('judge_weighting', 'fixed')  # fixed / agreement
+        async_log = data.get('async_log', False)  # 异步日志（后台批量写入）
+        use_mlflow = data.get('mlflow', True)  # 关闭后不导入 mlflow，启动更快
+        tracking = data.get('tracking', 'both')  # 追踪后端: sqlite / mlflow / both / none
+        from_version = data.get('from_version')  # 只重新评分：复用该版本的候选
         
         # 确保输出目录存在
         output_dir = Path(f'Outputs/{version}')
@@ -187,6 +205,39 @@ def run_experiment():
             '--scoring-model', scoring_model
         ]
         
+        if async_log:
+            cmd.append('--async-log')
+        cmd.extend(['--tracking', tracking])
+        if not use_mlflow:
+            cmd.append('--no-mlflow')
+        
+        if from_version:
+            cmd.extend(['--from-version', from_version])
+        
+        if adaptive:
+            cmd.append('--adaptive')
+            if candidate_budget:
+                cmd.extend(['--candidate-budget', str(candidate_budget)])
+            if target_total is not None:
+                cmd.extend(['--target-total', str(target_total)])
+        
+        cmd.extend(['--prefilter', prefilter])
+        if prefilter_max_per_question:
+            cmd.extend(['--prefilter-max-per-question', str(prefilter_max_per_question)])
+        
+        if scoring_mode == 'listwise' and listwise_chunk_size:
+            cmd.extend(['--listwise-chunk-size', str(listwise_chunk_size)])
+        
+        # 多评委集成打分
+        if scoring_judges:
+            if isinstance(scoring_judges, list):
+                scoring_judges = ','.join(scoring_judges)
+            cmd.extend(['--scoring-judges', scoring_judges, '--judge-weighting', judge_weighting])
+            if judge_weights:
+                if isinstance(judge_weights, dict):
+                    judge_weights = ','.join(f"{k}={v}" for k, v in judge_weights.items())
+                cmd.extend(['--judge-weights', judge_weights])
+        
         # 添加Top-K参数（如果指定）
         if scoring_top_k is not None:
             cmd.extend(['--scoring-top-k', str(scoring_top_k)])
@@ -197,8 +248,17 @@ def run_experiment():
             cmd.extend([
                 '--user-model', user_model,
                 '--agent-model', agent_model,
-                '--dialogue-rounds', str(dialogue_rounds)
+                '--dialogue-rounds', str(dialogue_rounds),
+                '--early-stop', early_stop
             ])
+            if dual_beam:
+                cmd.extend(['--dual-beam', '--turn-scorer', turn_scorer])
+            elif dual_branching:
+                cmd.append('--dual-branching')
+                if branch_schedule:
+                    if isinstance(branch_schedule, list):
+                        branch_schedule = ','.join(str(x) for x in branch_schedule)
+                    cmd.extend(['--branch-schedule', branch_schedule])
         else:
             # 单模型模式：添加生成轮数
             cmd.extend([
@@ -215,14 +275,16 @@ def run_experiment():
         if score_prompt_file.exists():
             cmd.extend(['--scoring-prompt-file', str(score_prompt_file)])
         
-        # 记录日志
+        # 记录日志：实验日志由子进程直接写入 experiment.log（不再经终端转写一份）
         log_file = output_dir / 'experiment.log'
+        stdout_file = output_dir / 'stdout.log'
+        cmd.extend(['--log', str(log_file), '--no-console'])
         
         print(f"[API] 启动实验: {' '.join(cmd)}")
         print(f"[API] 日志文件: {log_file}")
         
-        # 后台运行，输出重定向到日志文件
-        with open(log_file, 'w') as f:
+        # 后台运行，日志之外的终端输出（进度条、异常堆栈）重定向到 stdout.log
+        with open(stdout_file, 'w') as f:
             process = subprocess.Popen(
                 cmd,
                 stdout=f,
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+实验流水线端到端基准
+使用离线 Mock 后端（utils/mock_llm.py）按多个规模（问题数 × 候选数 × 评分轮次）
+运行 main_async 的各个阶段，测量：
+
+- 每阶段耗时、请求吞吐
+- 峰值 RSS（每个规模在独立子进程中运行，互不累计）
+- 事件循环延迟（p50 / p99 / max）
+- SQLite 写入耗时、JSON 序列化耗时
+
+结果保存为 JSON，可与基线对比，超过阈值视为回归（退出码 1）。
+
+用法:
+    python benchmarks/bench_pipeline.py --scales 10x2x3,100x4x3
+    python benchmarks/bench_pipeline.py --save-baseline
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+RESULTS_DIR = PROJECT_ROOT / 'benchmarks' / 'results'
+DEFAULT_BASELINE = PROJECT_ROOT / 'benchmarks' / 'baseline.json'
+
+# 越小越好的指标；throughput 越大越好
+TIME_METRICS = [
+    'step1_seconds', 'step2_seconds', 'step3_seconds', 'total_seconds',
+    'sqlite_write_seconds', 'json_serialize_seconds', 'loop_lag_p99_ms', 'peak_rss_mb'
+]
+RATE_METRICS = ['requests_per_second', 'candidates_per_second']
+
+# 绝对变化低于该值时视为噪声，不判定为回归
+MIN_ABS_DELTA = {
+    'loop_lag_p99_ms': 5.0,
+    'peak_rss_mb': 10.0,
+}
+DEFAULT_MIN_ABS_DELTA = 0.05
+
+
+def parse_scales(spec: str) -> List[Dict]:
+    """解析规模参数，如 '10x2x3,100x4x3' → 问题数 × 候选数 × 评分轮次"""
+    scales = []
+    for item in spec.split(','):
+        q, c, r = (int(x) for x in item.lower().split('x'))
+        scales.append({"questions": q, "candidates": c, "score_rounds": r, "name": item})
+    return scales
+
+
+def peak_rss_mb() -> float:
+    """进程峰值 RSS（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+def load_benchmark_questions(n: int) -> List[str]:
+    """从 inputs/questions.txt 循环取 n 个问题"""
+    from utils.io_handler import load_questions
+    base = load_questions(str(PROJECT_ROOT / 'inputs' / 'questions.txt'))
+    return [f"{base[i % len(base)]}（{i + 1}）" for i in range(n)]
+
+
+async def run_scale(scale: Dict, mode: str, scoring_mode: str, workdir: Path, profile_loop: bool = False) -> Dict:
+    """按 main_async 的阶段顺序运行一个规模，返回指标"""
+    import config_async
+    from utils.io_handler import save_json, format_generation_output, format_scoring_output, format_final_output
+    from pipeline.generation_async import step1_qwen_generation_async
+    from pipeline.generation_dual_async import step1_dual_generation_async
+    from pipeline.scoring_async import step2_gpt_scoring_async
+    from pipeline.scoring_overall_async import step2_overall_scoring_async
+    from sqlite_handler import SQLiteHandler
+    from utils.loop_profiler import LoopLagSampler, LoopProfiler, set_stage
+
+    questions = load_benchmark_questions(scale["questions"])
+    stats_before = dict(getattr(config_async.client, 'stats', {}))
+    if profile_loop:
+        sampler = LoopProfiler()
+    else:
+        sampler = LoopLagSampler()
+    sampler.start()
+    metrics = {}
+    total_start = time.perf_counter()
+
+    # Step 1
+    set_stage('generation')
+    start = time.perf_counter()
+    if mode == 'dual':
+        candidates = await step1_dual_generation_async(
+            questions, 'qwen-max', 'turing-gpt', scale["candidates"], 3)
+    else:
+        candidates = await step1_qwen_generation_async(questions, scale["candidates"], 5)
+    metrics['step1_seconds'] = time.perf_counter() - start
+
+    # Step 2
+    set_stage('scoring')
+    start = time.perf_counter()
+    if scoring_mode == 'overall':
+        scored = await step2_overall_scoring_async(candidates, score_rounds=scale["score_rounds"])
+    else:
+        scored = await step2_gpt_scoring_async(candidates, scale["score_rounds"])
+    metrics['step2_seconds'] = time.perf_counter() - start
+
+    # Step 3
+    set_stage('selection')
+    start = time.perf_counter()
+    final_results = format_final_output(scored)
+    metrics['step3_seconds'] = time.perf_counter() - start
+    metrics['total_seconds'] = time.perf_counter() - total_start
+    report = await sampler.stop()
+    if profile_loop:
+        metrics['loop_profile'] = {k: v for k, v in report.items() if k != 'slow_callbacks'}
+        report = {k: v for k, v in report.items() if k.startswith('loop_lag_')}
+    metrics.update(report)
+
+    # JSON 序列化（与 main_async 保存的文件相同）
+    start = time.perf_counter()
+    formatted_gen = format_generation_output(candidates)
+    formatted_scores = format_scoring_output(scored)
+    save_json(candidates, str(workdir / 'raw_candidates.json'))
+    save_json(formatted_gen, str(workdir / 'generation.json'))
+    save_json(scored, str(workdir / 'raw_scores.json'))
+    save_json(formatted_scores, str(workdir / 'scores.json'))
+    save_json(final_results, str(workdir / 'final.json'))
+    metrics['json_serialize_seconds'] = time.perf_counter() - start
+
+    # SQLite 写入（与 main_async 的写入序列相同）
+    start = time.perf_counter()
+    db = SQLiteHandler(str(workdir / 'bench.db'))
+    version = f"bench_{scale['name']}"
+    db.save_experiment(version=version, config=scale, input_questions=questions)
+    db.update_experiment_outputs(version=version, step1_generation=formatted_gen)
+    db.update_experiment_outputs(version=version, step2_scores=formatted_scores)
+    db.update_experiment_outputs(version=version, step3_final=final_results, statistics={}, status='completed')
+    db.close()
+    metrics['sqlite_write_seconds'] = time.perf_counter() - start
+
+    stats_after = dict(getattr(config_async.client, 'stats', {}))
+    requests = stats_after.get('requests', 0) - stats_before.get('requests', 0)
+    metrics['requests'] = requests
+    metrics['num_candidates'] = len(candidates)
+    metrics['num_scored'] = len(scored)
+    metrics['requests_per_second'] = requests / metrics['total_seconds'] if metrics['total_seconds'] else 0.0
+    metrics['candidates_per_second'] = len(candidates) / metrics['total_seconds'] if metrics['total_seconds'] else 0.0
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return metrics
+
+
+def run_scale_isolated(scale: Dict, mode: str, scoring_mode: str, profile_loop: bool, verbose: bool) -> Dict:
+    """在全新子进程中运行一个规模：ru_maxrss 是进程级高水位，同进程内会累计之前规模的峰值"""
+    logging.basicConfig(level=logging.INFO if verbose else logging.ERROR, format='%(message)s')
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(run_scale(scale, mode, scoring_mode, Path(tmp), profile_loop))
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """与基线对比，返回回归描述列表"""
+    regressions = []
+    for name, current in results["scales"].items():
+        base = baseline.get("scales", {}).get(name)
+        if not base:
+            continue
+        for metric in TIME_METRICS:
+            delta = current.get(metric, 0) - base.get(metric, 0)
+            if delta < MIN_ABS_DELTA.get(metric, DEFAULT_MIN_ABS_DELTA):
+                continue
+            if metric in base and base[metric] > 0 and current.get(metric, 0) > base[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {base[metric]:.4f} → {current[metric]:.4f}")
+        for metric in RATE_METRICS:
+            if metric in base and base[metric] > 0 and current.get(metric, 0) < base[metric] * (1 - threshold):
+                regressions.append(f"{name} {metric}: {base[metric]:.2f} → {current[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='实验流水线端到端基准（Mock 后端）')
+    parser.add_argument('--scales', type=str, default='10x2x3,50x4x3,200x8x3', help='规模列表: 问题数x候选数x评分轮次')
+    parser.add_argument('--mode', type=str, default='single', choices=['single', 'dual'], help='生成模式')
+    parser.add_argument('--scoring-mode', type=str, default='overall', choices=['per_turn', 'overall'], help='打分模式')
+    parser.add_argument('--latency-median', type=float, default=0.05, help='Mock 延迟中位数（秒）')
+    parser.add_argument('--latency-sigma', type=float, default=0.3, help='Mock 延迟对数正态 sigma')
+    parser.add_argument('--baseline', type=str, default=None, help='基线 JSON 路径')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值（相对变化）')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 路径')
+    parser.add_argument('--profile-loop', action='store_true', help='记录每阶段事件循环 CPU 时间和慢回调')
+    parser.add_argument('--verbose', action='store_true', help='输出流水线日志')
+    args = parser.parse_args()
+
+    # 必须在导入 config_async 之前设置
+    os.environ['LLM_BACKEND'] = 'mock'
+    os.environ.setdefault('MOCK_LLM_CONFIG', json.dumps({
+        "latency": {"distribution": "lognormal", "median": args.latency_median, "sigma": args.latency_sigma}
+    }))
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "mode": args.mode,
+        "scoring_mode": args.scoring_mode,
+        "mock_config": json.loads(os.environ['MOCK_LLM_CONFIG']),
+        "python": sys.version.split()[0],
+        "scales": {}
+    }
+
+    print(f"{'Scale':<14} {'Step1(s)':<10} {'Step2(s)':<10} {'Req/s':<10} {'Lag p99(ms)':<12} {'RSS(MB)':<10} {'SQLite(s)':<10} {'JSON(s)':<10}")
+    print("-" * 90)
+    for scale in parse_scales(args.scales):
+        # spawn：子进程不继承父进程内存，峰值 RSS 只反映本规模
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            metrics = pool.submit(run_scale_isolated, scale, args.mode, args.scoring_mode,
+                                  args.profile_loop, args.verbose).result()
+        results["scales"][scale["name"]] = metrics
+        print(f"{scale['name']:<14} {metrics['step1_seconds']:<10.2f} {metrics['step2_seconds']:<10.2f} "
+              f"{metrics['requests_per_second']:<10.1f} {metrics['loop_lag_p99_ms']:<12.2f} "
+              f"{metrics['peak_rss_mb']:<10.1f} {metrics['sqlite_write_seconds']:<10.3f} "
+              f"{metrics['json_serialize_seconds']:<10.3f}")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存: {output}")
+
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 基线已保存: {DEFAULT_BASELINE}")
+
+    baseline_path = Path(args.baseline) if args.baseline else None
+    if baseline_path and baseline_path.exists():
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 检测到 {len(regressions)} 项性能回归 (阈值 {args.threshold:.0%}):")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print(f"\n✅ 与基线对比无回归 (阈值 {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 """
 实验配置文件 - 异步版本
+
+客户端和 prompts.json 均为按需加载：导入本模块不会导入 openai，也不会读文件，
+首次访问 client / get_client() / Prompt 常量时才初始化。
 """
 import os
 import json
+from functools import lru_cache
 from pathlib import Path
-from openai import AsyncOpenAI  # 改用 AsyncOpenAI
 
 # ================================
 # API配置
@@ -12,11 +15,99 @@ from openai import AsyncOpenAI  # 改用 AsyncOpenAI
 API_KEY = "sk-CFDseWkWcsHiMu6mDlQc8elM3sJTFQyMEsJxhFb6qJ8"
 API_BASE_URL = "https://live-turing.cn.llm.tcljd.com/api/v1"
 
-# 初始化异步客户端
-client = AsyncOpenAI(
-    api_key=API_KEY,
-    base_url=API_BASE_URL
-)
+# LLM 后端: openai=真实 API, mock=离线 Mock（压测/复现用，见 utils/mock_llm.py）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# Mock 后端参数，可通过环境变量 MOCK_LLM_CONFIG 传入 JSON 字符串或 JSON 文件路径覆盖
+MOCK_LLM_CONFIG = {
+    "latency": {"distribution": "lognormal", "median": 0.8, "sigma": 0.5},
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "malformed_json_rate": 0.0,
+    "completion_tokens": None,
+    "seed": 42
+}
+
+
+def load_mock_config() -> dict:
+    """合并默认 Mock 配置和 MOCK_LLM_CONFIG 覆盖项"""
+    config = dict(MOCK_LLM_CONFIG)
+    override = os.getenv("MOCK_LLM_CONFIG")
+    if override:
+        if Path(override).exists():
+            with open(override, 'r', encoding='utf-8') as f:
+                config.update(json.load(f))
+        else:
+            config.update(json.loads(override))
+    return config
+
+
+def build_client():
+    """根据 LLM_BACKEND 构建异步客户端"""
+    if LLM_BACKEND == "mock":
+        from utils.mock_llm import MockAsyncOpenAI
+        return MockAsyncOpenAI(**load_mock_config())
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=API_KEY,
+        base_url=API_BASE_URL
+    )
+
+
+_client = None
+
+
+def get_client():
+    """获取共享异步客户端（首次调用时构建）"""
+    global _client
+    if _client is None:
+        _client = build_client()
+    return _client
+
+# ================================
+# 解析/渲染卸载配置（见 utils/offload.py）
+# ================================
+# none=在事件循环上执行, thread=线程池, process=进程池
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "none")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "4"))
+PARSE_BATCH_SIZE = 32
+PARSE_BATCH_WAIT_MS = 2.0
+
+# ================================
+# 全局限流配置（见 utils/api_client.py）
+# ================================
+# 0 表示不限
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "0"))
+REQUESTS_PER_MINUTE = float(os.getenv("REQUESTS_PER_MINUTE", "0"))
+
+# 按模型的独立限流 {模型键或模型ID: {"max_concurrency": N, "rpm": M}}，
+# 可通过环境变量 MODEL_RATE_LIMITS 传入 JSON 覆盖
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+
+# 单次请求超时（秒，只计请求本身，不含限流排队；0 表示不限）
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+# 对冲请求：请求耗时超过该模型近期延迟的 HEDGE_QUANTILE 分位数时再发一个副本，取先返回的有效响应
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0") == "1"
+HEDGE_QUANTILE = 0.95
+# 对冲请求占总请求的比例上限（避免服务整体变慢时对冲放大负载）
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))
+# 某模型累计足够的延迟样本后才开始对冲
+HEDGE_MIN_SAMPLES = 20
+# 在途请求重新检查对冲条件的间隔（秒）：同批并发发出的请求开始时还没有延迟样本
+HEDGE_POLL_INTERVAL = 0.5
+# 每个模型保留的最近延迟样本数
+LATENCY_WINDOW = 200
+
+# 自适应并发（AIMD）：每个模型的并发上限在延迟和错误率正常时加性增长，
+# 遇到 429/5xx/超时或延迟突增时乘性下降
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "0") == "1"
+ADAPTIVE_INITIAL_LIMIT = int(os.getenv("ADAPTIVE_INITIAL_LIMIT", "8"))
+ADAPTIVE_MIN_LIMIT = 1
+ADAPTIVE_MAX_LIMIT = int(os.getenv("ADAPTIVE_MAX_LIMIT", "64"))
+# 乘性下降系数
+ADAPTIVE_DECREASE = 0.5
+# 请求延迟超过基线（健康延迟的滑动平均）的该倍数时视为延迟突增
+ADAPTIVE_LATENCY_FACTOR = 2.0
 
 # ================================
 # 模型配置
@@ -32,6 +123,11 @@ AVAILABLE_MODELS = {
     "turing-gpt-mini": "turing/gpt-4o-mini"
 }
 
+
+def resolve_model(name: str) -> str:
+    """模型键名（如 turing-gpt）→ 实际模型 ID；未登记的名称原样返回"""
+    return AVAILABLE_MODELS.get(name, name)
+
 # 对话生成模式
 DIALOGUE_MODES = {
     "single": "单模型生成",
@@ -41,7 +137,9 @@ DIALOGUE_MODES = {
 # 打分模式
 SCORING_MODES = {
     "per_turn": "逐轮打分",
-    "overall": "整体打分"
+    "overall": "整体打分",
+    "listwise": "列表式打分",
+    "halving": "逐次减半排序"
 }
 
 # ================================
@@ -52,7 +150,6 @@ GENERATION_NUM_TURNS = 5
 # ================================
 # 评估阶段配置
 # ================================
-EVALUATION_DIMENSIONS = ["Empathy", "Supportiveness", "Guidance", "Safety"]
 SCORE_RANGE = (0, 10)
 
 # ================================
@@ -64,32 +161,48 @@ def load_prompts():
     with open(prompts_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-# 加载prompts
-_PROMPTS = load_prompts()
+@lru_cache(maxsize=1)
+def get_prompts():
+    """按需加载 prompts（只读一次）"""
+    return load_prompts()
+
+
+# Prompt 组件常量 → (阶段, 字段)，按需从 prompts.json 读取
+_PROMPT_FIELDS = {
+    # 生成阶段 - 组件
+    "GENERATION_ROLE": ("generation", "role"),
+    "GENERATION_TASK": ("generation", "task"),
+    "GENERATION_INSTRUCTIONS": ("generation", "instructions"),
+    "GENERATION_INPUT_TEMPLATE": ("generation", "input_template"),
+    # 评估阶段 - 组件
+    "EVALUATION_ROLE": ("evaluation", "role"),
+    "EVALUATION_TASK": ("evaluation", "task"),
+    "EVALUATION_DIMENSIONS": ("evaluation", "dimensions"),
+    "EVALUATION_INPUT_TEMPLATE": ("evaluation", "input_template"),
+}
 
-# 生成阶段 - 组件
-GENERATION_ROLE = _PROMPTS['generation']['role']
-GENERATION_TASK = _PROMPTS['generation']['task']
-GENERATION_INSTRUCTIONS = _PROMPTS['generation']['instructions']
-GENERATION_INPUT_TEMPLATE = _PROMPTS['generation']['input_template']
 
-# 评估阶段 - 组件
-EVALUATION_ROLE = _PROMPTS['evaluation']['role']
-EVALUATION_TASK = _PROMPTS['evaluation']['task']
-EVALUATION_DIMENSIONS = _PROMPTS['evaluation']['dimensions']
-EVALUATION_INPUT_TEMPLATE = _PROMPTS['evaluation']['input_template']
+def __getattr__(name):
+    """模块级懒加载：client 和 Prompt 组件常量在首次访问时初始化"""
+    if name == "client":
+        return get_client()
+    if name in _PROMPT_FIELDS:
+        stage, field = _PROMPT_FIELDS[name]
+        return get_prompts()[stage][field]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ================================
 # 组装完整 Prompt
 # ================================
 def build_generation_prompt(question: str, num_turns: int = GENERATION_NUM_TURNS) -> str:
     """构建生成阶段 Prompt"""
-    task = GENERATION_TASK.format(num_turns=num_turns, total_messages=num_turns * 2)
-    instructions = GENERATION_INSTRUCTIONS.format(num_turns=num_turns, total_messages=num_turns * 2)
-    input_part = GENERATION_INPUT_TEMPLATE.format(question=question)
+    p = get_prompts()['generation']
+    task = p['task'].format(num_turns=num_turns, total_messages=num_turns * 2)
+    instructions = p['instructions'].format(num_turns=num_turns, total_messages=num_turns * 2)
+    input_part = p['input_template'].format(question=question)
     
     return f"""
-{GENERATION_ROLE}
+{p['role']}
 
 {task}
 
@@ -102,13 +215,14 @@ def build_generation_prompt(question: str, num_turns: int = GENERATION_NUM_TURNS
 
 def build_evaluation_prompt(dialogue: str) -> str:
     """构建评估阶段 Prompt（逐轮打分）"""
-    dims = EVALUATION_DIMENSIONS.format(min_score=SCORE_RANGE[0], max_score=SCORE_RANGE[1])
-    input_part = EVALUATION_INPUT_TEMPLATE.format(dialogue=dialogue)
+    p = get_prompts()['evaluation']
+    dims = p['dimensions'].format(min_score=SCORE_RANGE[0], max_score=SCORE_RANGE[1])
+    input_part = p['input_template'].format(dialogue=dialogue)
     
     return f"""
-{EVALUATION_ROLE}
+{p['role']}
 
-{EVALUATION_TASK}
+{p['task']}
 
 {dims}
 
@@ -136,3 +250,42 @@ def build_overall_evaluation_prompt(dialogue_json: str) -> str:
 请基于整个对话的连贯性、深度和专业性进行综合评分。
 以 JSON 格式输出，包含 Empathy、Supportiveness、Guidance 和 Safety 四个字段。
 """
+
+def build_listwise_evaluation_prompt(question: str, candidates_text: str, labels: list) -> str:
+    """构建列表式评估 Prompt（同一问题的多个候选放在一次请求中）"""
+    return f"""
+你是一位专业的心理咨询质量评估专家。
+
+以下是针对同一个求助问题的 {len(labels)} 段心理咨询对话，请分别独立评估每一段对话。
+候选的先后顺序是随机的，与质量无关，请不要受顺序影响。
+
+评估维度（每项评分范围 {SCORE_RANGE[0]}-{SCORE_RANGE[1]}）：
+1. Empathy (共情度): 咨询师是否真正理解并感受用户的情绪
+2. Supportiveness (支持性): 是否提供了情感支持和鼓励
+3. Guidance (引导性): 是否给出了有效的建议和解决方向
+4. Safety (安全性): 是否避免了不当言论，保护了用户的心理安全
+
+求助问题：
+{question}
+
+{candidates_text}
+
+请以 JSON 格式输出 {{"scores": [...]}}，scores 中每个元素对应一个候选，
+包含 id（候选编号：{'、'.join(labels)}）以及 Empathy、Supportiveness、Guidance 和 Safety 四个字段。
+"""
+
+def build_turn_evaluation_prompt(question: str, context: str, reply: str) -> str:
+    """构建单轮评估 Prompt（在线打分：只评估咨询师最新一轮回复）"""
+    return f"""
+你是一位专业的心理咨询质量评估专家。请只评估咨询师的最新一轮回复。
+
+求助问题：{question}
+
+之前的对话：
+{context or '（无）'}
+
+咨询师最新回复：
+{reply}
+
+评分范围 {SCORE_RANGE[0]}-{SCORE_RANGE[1]}，以 JSON 格式输出 Empathy、Supportiveness、Guidance 和 Safety 四个字段。
+"""
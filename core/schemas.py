@@ -54,3 +54,17 @@ class EvaluationOutput(BaseModel):
     class Config:
         # 允许额外字段以提高兼容性
         extra = 'allow'
+
+
+class CandidateEvaluation(EvaluationOutput):
+    """列表式评分中单个候选的评分"""
+    id: str = Field(description="候选编号（prompt 中的 A、B、C ...）")
+
+
+class ListwiseEvaluationOutput(BaseModel):
+    """列表式评分输出：一次请求对同一问题的多个候选打分"""
+    scores: List[CandidateEvaluation] = Field(description="每个候选的评分，按编号对应")
+    
+    class Config:
+        # 允许额外字段以提高兼容性
+        extra = 'allow'
@@ -0,0 +1,217 @@
+"""
+Step 1+2: 自适应候选预算 - 异步版本
+每个问题先生成少量候选，边生成边评分（流式），只对最高分低于目标或分数分歧较大的问题追加候选，
+所有追加都受全局候选预算约束。简单的问题早停，预算留给难的问题。
+"""
+import logging
+import asyncio
+import statistics
+from typing import List, Dict, Tuple
+
+from config_async import QWEN_MODEL, GPT_MODEL, AVAILABLE_MODELS
+from pipeline.generation_async import generate_one_async
+from pipeline.generation_dual_async import generate_one_dual_async
+from pipeline.scoring_ensemble import score_with_judge_async
+from pipeline.prefilter import check_dialogue
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+
+class CandidateBudget:
+    """全局候选预算（事件循环内单线程访问，无需加锁）"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.used = 0
+
+    def take(self, n: int) -> int:
+        """申请 n 个候选额度，返回实际获得的数量"""
+        granted = max(0, min(n, self.total - self.used))
+        self.used += granted
+        return granted
+
+
+async def step12_adaptive_async(
+    questions: List[str],
+    max_candidates: int,
+    initial_candidates: int = 2,
+    step_candidates: int = 2,
+    budget: int = None,
+    target_total: float = 32.0,
+    max_spread: float = 3.0,
+    mode: str = 'single',
+    num_turns: int = 5,
+    user_model: str = 'qwen-max',
+    agent_model: str = 'gpt-4o-mini',
+    dialogue_rounds: int = 3,
+    scoring_mode: str = 'overall',
+    scoring_prompt: str = None,
+    score_rounds: int = 1,
+    scoring_model: str = GPT_MODEL,
+    prefilter: str = 'off',
+    top_k: int = None
+) -> Tuple[List[Dict], List[Dict], Dict]:
+    """
+    自适应生成 + 流式评分
+
+    Args:
+        questions: 问题列表
+        max_candidates: 每个问题最多生成的候选数
+        initial_candidates: 每个问题首批候选数
+        step_candidates: 每次追加的候选数
+        budget: 全局候选预算（None 表示 问题数 × max_candidates）
+        target_total: 最高 Total 达到该值且分歧不大时停止追加
+        max_spread: 候选 Total 的标准差超过该值时视为分歧较大，继续追加
+        mode: 'single' 或 'dual'
+        num_turns: 单模型生成对话轮数
+        user_model / agent_model / dialogue_rounds: 双模型参数
+        scoring_mode: 'per_turn' 或 'overall'
+        scoring_prompt: 自定义评分prompt（仅 overall）
+        score_rounds: 每个候选评分轮次
+        scoring_model: 评分模型 ID
+        prefilter: 'off' 关闭本地预筛，否则硬性问题的候选不送评（仍计入预算）
+        top_k: 每个问题保留前K个评分结果（None表示保留全部）
+
+    Returns:
+        (生成的候选, 评分后的候选, 统计信息)
+    """
+    budget = CandidateBudget(budget if budget is not None else len(questions) * max_candidates)
+    expected_turns = dialogue_rounds if mode == 'dual' else num_turns
+    user_model = AVAILABLE_MODELS.get(user_model, user_model)
+    agent_model = AVAILABLE_MODELS.get(agent_model, agent_model)
+
+    logger.info("\n" + "="*80)
+    logger.info("Step 1+2: Adaptive Candidate Budget (Async)")
+    logger.info("="*80)
+    logger.info(f"问题数: {len(questions)} | 首批: {initial_candidates} | 追加: {step_candidates} | "
+                f"每题上限: {max_candidates} | 全局预算: {budget.total}")
+    logger.info(f"目标 Total: {target_total} | 分歧阈值(标准差): {max_spread} | 打分: {scoring_mode} ({scoring_model})")
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Status':<10} {'Total':<7}")
+    logger.info("-"*80)
+
+    rejected_count = 0
+
+    async def generate_and_score(qid: int, question: str, cand_id: int):
+        nonlocal rejected_count
+        if mode == 'dual':
+            _, _, _, output = await generate_one_dual_async((qid, question, cand_id, user_model, agent_model, dialogue_rounds))
+            if output:
+                output.pop('termination', None)
+            candidate = {"question_id": qid, "question": question, "candidate_id": cand_id, "mode": "dual",
+                         "models": {"user": user_model, "agent": agent_model}, "output": output}
+        else:
+            _, _, _, output = await generate_one_async((qid, question, cand_id, num_turns))
+            candidate = {"question_id": qid, "question": question, "candidate_id": cand_id,
+                         "output": output, "model": QWEN_MODEL}
+
+        if not output:
+            logger.info(f"{qid:<5} {cand_id:<5} {'✗ Failed':<10} {'-':<7}")
+            log_event('generation', question_id=qid, candidate_id=cand_id, status='failed', turns=0)
+            return None, None
+        log_event('generation', question_id=qid, candidate_id=cand_id, status='success',
+                  turns=len(output.get('dialogue', [])))
+
+        if prefilter != 'off':
+            hard, _ = check_dialogue(output, expected_turns)
+            if hard:
+                rejected_count += 1
+                logger.info(f"{qid:<5} {cand_id:<5} {'✗ Filter':<10} {'-':<7}")
+                return candidate, None
+
+        result = await score_with_judge_async(candidate, scoring_model, scoring_mode, scoring_prompt, score_rounds)
+        if result is None:
+            logger.info(f"{qid:<5} {cand_id:<5} {'✗ Score':<10} {'-':<7}")
+            return candidate, None
+        scored = {**candidate, 'scores': result['scores'], 'score_details': result['rounds']}
+        logger.info(f"{qid:<5} {cand_id:<5} {'✓ Scored':<10} {scored['scores']['Total']:<7.2f}")
+        log_event('scoring', question_id=qid, candidate_id=cand_id,
+                  rounds=len(result['rounds']), **result['scores'])
+        return candidate, scored
+
+    async def run_question(qid: int, question: str, first_batch: int) -> Dict:
+        candidates, scored = [], []
+        next_id = 1
+        batch = first_batch
+        stop_reason = 'budget'
+        while batch > 0:
+            results = await asyncio.gather(*[generate_and_score(qid, question, next_id + i) for i in range(batch)])
+            next_id += batch
+            for candidate, item in results:
+                if candidate is not None:
+                    candidates.append(candidate)
+                if item is not None:
+                    scored.append(item)
+
+            totals = [s['scores']['Total'] for s in scored]
+            best = max(totals) if totals else None
+            spread = statistics.pstdev(totals) if len(totals) >= 2 else 0.0
+            if best is not None and best >= target_total and spread <= max_spread:
+                stop_reason = 'target'
+                break
+            remaining = max_candidates - (next_id - 1)
+            if remaining <= 0:
+                stop_reason = 'max'
+                break
+            batch = budget.take(min(step_candidates, remaining))
+            stop_reason = 'budget'
+
+        totals = [s['scores']['Total'] for s in scored]
+        return {
+            "question_id": qid,
+            "candidates": candidates,
+            "scored": scored,
+            "generated": next_id - 1,
+            "best_total": max(totals) if totals else None,
+            "spread": statistics.pstdev(totals) if len(totals) >= 2 else 0.0,
+            "stop_reason": stop_reason
+        }
+
+    # 先为所有问题预留首批额度，再并发运行，追加额度先到先得
+    first_batches = [budget.take(min(initial_candidates, max_candidates)) for _ in questions]
+    per_question = await asyncio.gather(*[
+        run_question(qid, question, first_batches[qid - 1])
+        for qid, question in enumerate(questions, 1)
+    ])
+
+    candidates = [c for q in per_question for c in q['candidates']]
+    scored_candidates = [s for q in per_question for s in q['scored']]
+
+    logger.info("-"*80)
+    logger.info(f"\n{'QID':<5} {'N':<5} {'Best':<7} {'Spread':<7} {'Stop':<8}")
+    logger.info("-"*80)
+    for q in per_question:
+        best = f"{q['best_total']:.2f}" if q['best_total'] is not None else "-"
+        logger.info(f"{q['question_id']:<5} {q['generated']:<5} {best:<7} {q['spread']:<7.2f} {q['stop_reason']:<8}")
+    logger.info("-"*80)
+
+    fixed_candidates = len(questions) * max_candidates
+    met_target = sum(1 for q in per_question if q['best_total'] is not None and q['best_total'] >= target_total)
+    stats = {
+        "budget": budget.total,
+        "generated": budget.used,
+        "fixed_equivalent": fixed_candidates,
+        "saved_ratio": 1 - budget.used / fixed_candidates if fixed_candidates else 0.0,
+        "prefilter_rejected": rejected_count,
+        "questions_met_target": met_target,
+        "stop_reasons": {r: sum(1 for q in per_question if q['stop_reason'] == r) for r in ('target', 'max', 'budget')},
+        "per_question": [
+            {k: q[k] for k in ('question_id', 'generated', 'best_total', 'spread', 'stop_reason')}
+            for q in per_question
+        ]
+    }
+    logger.info(f"💰 候选: {budget.used}/{budget.total} (固定 {fixed_candidates}，节省 {stats['saved_ratio']:.0%}) | "
+                f"达标问题: {met_target}/{len(questions)}")
+    log_event('adaptive', **{k: v for k, v in stats.items() if k != 'per_question'})
+    logger.info(f"✅ 自适应生成+评分完成: {len(candidates)} 个候选，{len(scored_candidates)} 个评分\n")
+
+    # Top-K筛选（如果指定）
+    if top_k is not None and top_k > 0:
+        filtered_results = []
+        for q in per_question:
+            sorted_items = sorted(q['scored'], key=lambda x: x['scores']['Total'], reverse=True)
+            filtered_results.extend(sorted_items[:top_k])
+        logger.info(f"📊 Top-K筛选: {len(scored_candidates)} → {len(filtered_results)}")
+        scored_candidates = filtered_results
+
+    return candidates, scored_candidates, stats
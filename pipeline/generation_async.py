@@ -5,8 +5,11 @@ import logging
 import asyncio
 from typing import List, Dict
 
-from config_async import client, QWEN_MODEL, build_generation_prompt
+from config_async import QWEN_MODEL, build_generation_prompt
+from utils.api_client import chat_completion
 from core.schemas import GenerationOutput
+from utils.offload import parse_json_async
+from utils.log_writer import log_event
 
 logger = logging.getLogger('experiment')
 
@@ -16,7 +19,7 @@ async def call_api_structured_async(model: str, prompt: str, schema_class, max_r
     for attempt in range(max_retries):
         try:
             # 使用异步 API
-            response = await client.chat.completions.create(
+            response = await chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -27,7 +30,7 @@ async def call_api_structured_async(model: str, prompt: str, schema_class, max_r
             json_str = response.choices[0].message.content
             logger.debug(f"LLM 返回: {json_str[:200]}...")
             
-            result = schema_class.model_validate_json(json_str)
+            result = await parse_json_async(schema_class, json_str)
             logger.debug(f"API调用成功 [{model}]: JSON 输出已验证")
             return result
                 
@@ -98,8 +101,10 @@ async def step1_qwen_generation_async(questions: List[str], num_candidates: int,
             })
             dialogue_len = len(output.get('dialogue', []))
             logger.info(f"{idx:<5} {cand_id:<5} {'✓ Success':<10} {dialogue_len:<10}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='success', turns=dialogue_len)
         else:
             logger.info(f"{idx:<5} {cand_id:<5} {'✗ Failed':<10} {0:<10}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='failed', turns=0)
     
     logger.info("-"*80)
     logger.info(f"✅ Step 1 完成: {len(results)}/{len(tasks)} 成功\n")
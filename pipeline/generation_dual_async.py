@@ -1,16 +1,64 @@
 """
 Step 1B: 双模型对话生成 - 异步版本
 User模型和Agent模型交替对话
+
+树状生成（step1_dual_tree_generation_async）：同一问题的候选共享对话前缀，
+开场的用户发言只生成一次，在靠后的轮次按分叉系数展开，请求数与不同分支数成正比。
+
+在线束搜索（step1_dual_beam_generation_async）：每条 Agent 回复生成后立即打分
+（短评分 prompt 或本地预筛），每个问题只保留得分最高的若干部分对话继续生成。
+
+提前结束（early_stop）：用户道别或咨询师收尾后不再继续生成剩余轮次，
+依据发言最后一个分句中的明确道别用语（再见 / 拜拜 / 今天就先到这…）和/或模型在发言末尾输出的 [END] 标记。
 """
+import re
+import math
 import logging
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from config_async import client, AVAILABLE_MODELS, GENERATION_NUM_TURNS
+from config_async import AVAILABLE_MODELS, GENERATION_NUM_TURNS, GPT_MODEL, build_turn_evaluation_prompt
+from utils.api_client import chat_completion
+from pipeline.prefilter import check_dialogue, PENALTIES
+from pipeline.scoring_overall_async import call_scoring_api_async
 from core.schemas import GenerationOutput
+from utils.log_writer import log_event
 
 logger = logging.getLogger('experiment')
 
+EARLY_STOP_MODES = ["off", "heuristic", "flag", "both"]
+
+# 结构化结束标记（flag 模式下要求模型在想结束时输出）
+END_MARKER = "[END]"
+
+# 道别用语：只认明确的告别，且必须出现在发言的最后一个分句
+# （"我感觉好一点了，但是…"、"上次我和他说了再见，可是后来…" 这类不算；漏判只是多生成几轮）
+FAREWELL_PHRASES = ["再见", "拜拜", "今天就先到这", "今天先聊到这", "先聊到这里"]
+_CLAUSE_END_RE = re.compile(r"[。！？!?…\n，,；;：:]+")
+
+_END_INSTRUCTION = f"\n如果你认为这次对话可以自然结束了，请在发言末尾加上 {END_MARKER}。"
+
+
+def strip_end_marker(text: str):
+    """去掉结束标记，返回 (文本, 是否带标记)"""
+    if END_MARKER in text:
+        return text.replace(END_MARKER, '').strip(), True
+    return text, False
+
+
+def detect_termination(turn: Dict, early_stop: str, flagged: bool = False) -> bool:
+    """判断一条发言是否表示对话可以结束"""
+    if early_stop in ("flag", "both") and flagged:
+        return True
+    if early_stop in ("heuristic", "both"):
+        content = turn['content'].strip()
+        # 以问句结尾说明还在等对方回应
+        if not content or content[-1] in "？?":
+            return False
+        clauses = [s for s in _CLAUSE_END_RE.split(content) if s.strip()]
+        return bool(clauses) and any(p in clauses[-1] for p in FAREWELL_PHRASES)
+    return False
+
 
 def build_user_prompt(question: str, conversation_history: List[Dict] = None) -> str:
     """构建User模型的prompt"""
@@ -77,7 +125,7 @@ async def call_model_async(model: str, prompt: str, max_retries: int = 3) -> str
     """异步调用模型生成文本"""
     for attempt in range(max_retries):
         try:
-            response = await client.chat.completions.create(
+            response = await chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.7,
@@ -106,7 +154,9 @@ async def generate_dual_dialogue_async(
     question: str, 
     user_model: str, 
     agent_model: str, 
-    num_rounds: int = 3
+    num_rounds: int = 3,
+    early_stop: str = "off",
+    min_rounds: int = 1
 ) -> Dict:
     """
     双模型对话生成
@@ -115,59 +165,83 @@ async def generate_dual_dialogue_async(
         question: 用户问题
         user_model: User模型名称
         agent_model: Agent模型名称
-        num_rounds: 对话轮数
+        num_rounds: 对话轮数（上限）
+        early_stop: 提前结束检测 off / heuristic / flag / both
+        min_rounds: 至少进行的轮数
     
     Returns:
-        包含完整对话的字典
+        包含完整对话的字典，另带 termination（提前结束原因，未提前结束为 None）
     """
     conversation = []
     
     # CoT: 记录对话生成思路
     cot = f"使用双模型对话模式生成，User模型: {user_model}, Agent模型: {agent_model}, 轮数: {num_rounds}"
     
+    use_flag = early_stop in ("flag", "both")
+    termination = None
+    
     for round_num in range(num_rounds):
         # User发言
         user_prompt = build_user_prompt(question, conversation)
+        if use_flag:
+            user_prompt += _END_INSTRUCTION
         user_response = await call_model_async(user_model, user_prompt)
         
         if user_response is None:
             logger.error(f"User模型生成失败 (Round {round_num + 1})")
             break
         
+        user_response, user_flagged = strip_end_marker(user_response)
         conversation.append({
             "speaker": "user",
             "content": user_response
         })
+        # 用户道别：咨询师再回复一次后结束
+        user_closing = detect_termination(conversation[-1], early_stop, user_flagged)
         
         # Agent回复
         agent_prompt = build_agent_prompt(question, conversation)
+        if use_flag:
+            agent_prompt += _END_INSTRUCTION
         agent_response = await call_model_async(agent_model, agent_prompt)
         
         if agent_response is None:
             logger.error(f"Agent模型生成失败 (Round {round_num + 1})")
             break
         
+        agent_response, agent_flagged = strip_end_marker(agent_response)
         conversation.append({
             "speaker": "agent",
             "content": agent_response
         })
+        
+        if early_stop != "off" and round_num + 1 >= min_rounds and round_num + 1 < num_rounds:
+            if user_closing:
+                termination = "user_closing"
+            elif detect_termination(conversation[-1], early_stop, agent_flagged):
+                termination = "agent_closing"
+            if termination:
+                break
     
     return {
         "question": question,
         "cot": cot,
-        "dialogue": conversation
+        "dialogue": conversation,
+        "termination": termination
     }
 
 
-async def generate_one_dual_async(task):
-    """异步生成单个双模型对话候选"""
+async def generate_one_dual_async(task, early_stop: str = "off", min_rounds: int = 1):
+    """异步生成单个双模型对话候选（提前结束时，对话槽位和并发额度随即释放给其他候选）"""
     idx, question, cand_id, user_model, agent_model, num_rounds = task
     
     result = await generate_dual_dialogue_async(
         question, 
         user_model, 
         agent_model, 
-        num_rounds
+        num_rounds,
+        early_stop,
+        min_rounds
     )
     
     if result and len(result['dialogue']) > 0:
@@ -181,7 +255,9 @@ async def step1_dual_generation_async(
     user_model_name: str,
     agent_model_name: str,
     num_candidates: int,
-    num_rounds: int = 3
+    num_rounds: int = 3,
+    early_stop: str = "off",
+    min_rounds: int = 1
 ) -> List[Dict]:
     """
     Step 1: 使用双模型异步生成候选对话
@@ -191,7 +267,9 @@ async def step1_dual_generation_async(
         user_model_name: User模型键名
         agent_model_name: Agent模型键名
         num_candidates: 每个问题生成的候选数
-        num_rounds: 每个对话的轮数
+        num_rounds: 每个对话的轮数（上限）
+        early_stop: 提前结束检测 off / heuristic / flag / both
+        min_rounds: 提前结束前至少进行的轮数
     """
     # 获取实际模型名称
     user_model = AVAILABLE_MODELS.get(user_model_name, user_model_name)
@@ -201,12 +279,14 @@ async def step1_dual_generation_async(
     logger.info("Step 1: Dual-Model Dialogue Generation (Async)")
     logger.info("="*80)
     logger.info(f"问题数: {len(questions)} | 每题候选: {num_candidates}")
-    logger.info(f"User模型: {user_model} | Agent模型: {agent_model} | 对话轮数: {num_rounds}")
+    logger.info(f"User模型: {user_model} | Agent模型: {agent_model} | 对话轮数: {num_rounds} | 提前结束: {early_stop}")
     logger.info(f"\n{'QID':<5} {'CID':<5} {'Status':<10} {'Turns':<10}")
     logger.info("-"*80)
     
     results = []
     tasks = []
+    length_histogram = {}
+    terminations = {}
     
     # 构建任务列表
     for idx, question in enumerate(questions, 1):
@@ -214,12 +294,17 @@ async def step1_dual_generation_async(
             tasks.append((idx, question, cand_idx + 1, user_model, agent_model, num_rounds))
     
     # 异步并发执行
-    coroutines = [generate_one_dual_async(task) for task in tasks]
+    coroutines = [generate_one_dual_async(task, early_stop, min_rounds) for task in tasks]
     completed_results = await asyncio.gather(*coroutines)
     
     # 处理结果
     for idx, question, cand_id, output in completed_results:
         if output:
+            termination = output.pop('termination', None)
+            rounds = (len(output['dialogue']) + 1) // 2
+            length_histogram[rounds] = length_histogram.get(rounds, 0) + 1
+            if termination:
+                terminations[termination] = terminations.get(termination, 0) + 1
             results.append({
                 "question_id": idx,
                 "question": question,
@@ -229,13 +314,352 @@ async def step1_dual_generation_async(
                     "user": user_model,
                     "agent": agent_model
                 },
+                "rounds": rounds,
+                "termination": termination,
                 "output": output
             })
             turns = len(output.get('dialogue', []))
             logger.info(f"{idx:<5} {cand_id:<5} {'✓ Success':<10} {turns:<10}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='success', turns=turns,
+                      termination=termination)
         else:
             logger.info(f"{idx:<5} {cand_id:<5} {'✗ Failed':<10} {0:<10}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='failed', turns=0)
     
     logger.info("-"*80)
+    
+    # 对话长度分布（轮数 → 候选数）及节省的轮次
+    if results:
+        total_rounds = sum(r * n for r, n in length_histogram.items())
+        max_rounds = len(results) * num_rounds
+        logger.info("📏 对话长度分布: " + " | ".join(f"{r}轮={n}" for r, n in sorted(length_histogram.items())))
+        logger.info(f"  平均 {total_rounds / len(results):.2f} 轮 | 节省 {max_rounds - total_rounds}/{max_rounds} 轮"
+                    + (f" | 提前结束: {terminations}" if terminations else ""))
+        log_event('dialogue_length', histogram={str(r): n for r, n in sorted(length_histogram.items())},
+                  terminations=terminations, rounds=total_rounds, max_rounds=max_rounds, early_stop=early_stop)
+    
     logger.info(f"✅ Step 1 完成: {len(results)}/{len(tasks)} 成功\n")
-    return results
\ No newline at end of file
+    return results
+
+
+def plan_branching(num_candidates: int, num_rounds: int, schedule: Optional[List[int]] = None) -> List[int]:
+    """
+    每轮 Agent 回复的分叉系数（乘积 >= 候选数）
+
+    未指定时尽量晚分叉：从最后一轮往前每轮翻倍，直到叶子数够用。
+    例如 4 个候选、3 轮 → [1, 2, 2]
+    """
+    if schedule:
+        factors = (list(schedule) + [1] * num_rounds)[:num_rounds]
+        if math.prod(factors) < num_candidates:
+            raise ValueError(f"分叉系数 {factors} 的叶子数 {math.prod(factors)} 少于候选数 {num_candidates}")
+        return factors
+
+    factors = [1] * num_rounds
+    r = num_rounds - 1
+    while math.prod(factors) < num_candidates:
+        factors[r] *= 2
+        r = r - 1 if r > 0 else num_rounds - 1
+    return factors
+
+
+async def generate_dual_tree_async(
+    question: str,
+    user_model: str,
+    agent_model: str,
+    num_candidates: int,
+    num_rounds: int,
+    factors: List[int]
+) -> Dict:
+    """
+    树状双模型对话生成：每层先为每个前缀生成一条 User 发言，再分叉出多条 Agent 回复
+
+    Returns:
+        {"leaves": [(分支路径, 对话)], "requests": 实际请求数}
+    """
+    nodes = [((), [])]  # (分支路径, 对话前缀)
+    requests = 0
+
+    async def expand(path, conversation, factor):
+        nonlocal requests
+        requests += 1
+        user_response = await call_model_async(user_model, build_user_prompt(question, conversation))
+        if user_response is None:
+            return []
+        prefix = conversation + [{"speaker": "user", "content": user_response}]
+        agent_prompt = build_agent_prompt(question, prefix)
+        requests += factor
+        replies = await asyncio.gather(*[call_model_async(agent_model, agent_prompt) for _ in range(factor)])
+        return [
+            (path + (i,), prefix + [{"speaker": "agent", "content": reply}])
+            for i, reply in enumerate(replies) if reply is not None
+        ]
+
+    for round_num, factor in enumerate(factors):
+        # 只保留后续分叉足以覆盖候选数的前缀，避免生成用不到的分支
+        needed = math.ceil(num_candidates / math.prod(factors[round_num + 1:]))
+        needed_now = math.ceil(needed / factor)
+        expanded = await asyncio.gather(*[expand(path, conv, factor) for path, conv in nodes[:needed_now]])
+        nodes = [child for children in expanded for child in children]
+        if not nodes:
+            logger.error(f"树状生成失败: 第 {round_num + 1} 轮没有可用分支")
+            break
+
+    return {"leaves": nodes[:num_candidates], "requests": requests}
+
+
+async def step1_dual_tree_generation_async(
+    questions: List[str],
+    user_model_name: str,
+    agent_model_name: str,
+    num_candidates: int,
+    num_rounds: int = 3,
+    branch_schedule: Optional[List[int]] = None
+) -> List[Dict]:
+    """
+    Step 1: 树状双模型生成（候选共享对话前缀）
+
+    Args:
+        questions: 问题列表
+        user_model_name: User模型键名
+        agent_model_name: Agent模型键名
+        num_candidates: 每个问题生成的候选数（叶子数）
+        num_rounds: 每个对话的轮数
+        branch_schedule: 每轮 Agent 回复的分叉系数（None 表示自动，尽量晚分叉）
+    """
+    user_model = AVAILABLE_MODELS.get(user_model_name, user_model_name)
+    agent_model = AVAILABLE_MODELS.get(agent_model_name, agent_model_name)
+    factors = plan_branching(num_candidates, num_rounds, branch_schedule)
+
+    logger.info("\n" + "="*80)
+    logger.info("Step 1: Dual-Model Branching Generation (Async)")
+    logger.info("="*80)
+    logger.info(f"问题数: {len(questions)} | 每题候选: {num_candidates} | 分叉系数: {factors}")
+    logger.info(f"User模型: {user_model} | Agent模型: {agent_model} | 对话轮数: {num_rounds}")
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Branch':<10} {'Turns':<10}")
+    logger.info("-"*80)
+
+    trees = await asyncio.gather(*[
+        generate_dual_tree_async(question, user_model, agent_model, num_candidates, num_rounds, factors)
+        for question in questions
+    ])
+
+    results = []
+    total_requests = 0
+    for idx, (question, tree) in enumerate(zip(questions, trees), 1):
+        total_requests += tree['requests']
+        for cand_id, (path, conversation) in enumerate(tree['leaves'], 1):
+            branch = '.'.join(str(i) for i in path)
+            results.append({
+                "question_id": idx,
+                "question": question,
+                "candidate_id": cand_id,
+                "mode": "dual",
+                "models": {
+                    "user": user_model,
+                    "agent": agent_model
+                },
+                "branch": branch,
+                "output": {
+                    "question": question,
+                    "cot": f"使用双模型树状生成，User模型: {user_model}, Agent模型: {agent_model}, 轮数: {num_rounds}, 分支: {branch}",
+                    "dialogue": conversation
+                }
+            })
+            logger.info(f"{idx:<5} {cand_id:<5} {branch:<10} {len(conversation):<10}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='success',
+                      turns=len(conversation), branch=branch)
+        if len(tree['leaves']) < num_candidates:
+            logger.info(f"{idx:<5} {'-':<5} {'✗ Failed':<10} {num_candidates - len(tree['leaves'])} 个分支缺失")
+
+    linear_requests = len(questions) * num_candidates * num_rounds * 2
+    logger.info("-"*80)
+    logger.info(f"🌳 请求数: {total_requests} (逐候选生成需 {linear_requests}，"
+                f"{total_requests / max(linear_requests, 1):.0%})")
+    log_event('branching', factors=factors, requests=total_requests, linear_requests=linear_requests,
+              candidates=len(results))
+    logger.info(f"✅ Step 1 完成: {len(results)}/{len(questions) * num_candidates} 成功\n")
+    return results
+
+
+async def score_turn_async(question: str, conversation: List[Dict], turn_scorer: str = 'judge',
+                           judge_model: str = GPT_MODEL) -> Optional[Dict]:
+    """
+    对部分对话的最新一轮 Agent 回复打分
+
+    Returns:
+        {Empathy, Supportiveness, Guidance, Safety, Total} 或 {local, Total}；本地预筛淘汰时返回 None
+    """
+    hard, soft = check_dialogue({"dialogue": conversation})
+    if hard:
+        return None
+    if turn_scorer == 'prefilter':
+        local = max(0.0, 1.0 - sum(PENALTIES.get(r, 0.0) for r in soft))
+        return {"local": local, "Total": local}
+
+    context = "\n".join(
+        f"{'用户' if t['speaker'] == 'user' else '咨询师'}: {t['content']}" for t in conversation[:-1]
+    )
+    result = await call_scoring_api_async(
+        judge_model, build_turn_evaluation_prompt(question, context, conversation[-1]['content'])
+    )
+    if result is None:
+        # 评委失败不淘汰分支，按本轮无分处理
+        return {}
+    scores = {k: getattr(result, k) for k in ['Empathy', 'Supportiveness', 'Guidance', 'Safety']}
+    scores['Total'] = sum(scores.values())
+    return scores
+
+
+async def generate_dual_beam_async(
+    question: str,
+    user_model: str,
+    agent_model: str,
+    beam_width: int,
+    num_rounds: int,
+    beam_expand: int = 2,
+    turn_scorer: str = 'judge',
+    judge_model: str = GPT_MODEL
+) -> Dict:
+    """
+    在线束搜索双模型对话生成
+
+    每轮：束中每个部分对话生成一条 User 发言和 beam_expand 条 Agent 回复
+    （束未满时多展开，使子节点数至少为 beam_width，第一轮即从根节点展开 beam_width 条），
+    每条回复立即打分，淘汰本地预筛不通过的分支，再按平均轮次 Total 保留前 beam_width 个。
+
+    评委失败的轮次不计入平均分：子节点沿用父节点的平均分，第一轮无分的子节点取同轮有分子节点的均值（中性）。
+    turn_scorer='prefilter' 时干净回复都得 1.0，同分按生成顺序保留，
+    效果相当于随机采样并剔除违规分支，而不是按质量择优。
+
+    Returns:
+        {"beam": [(分支路径, 对话, 轮次分数列表)], "requests": 生成请求数, "judge_requests": 评分请求数,
+         "pruned_prefilter": 预筛淘汰数, "pruned_beam": 束外淘汰数}
+    """
+    beam = [((), [], [])]  # (分支路径, 对话, 轮次分数)
+    stats = {"requests": 0, "judge_requests": 0, "pruned_prefilter": 0, "pruned_beam": 0}
+
+    def mean_total(turn_scores):
+        totals = [t['Total'] for t in turn_scores if 'Total' in t]
+        return sum(totals) / len(totals) if totals else None
+
+    async def expand(path, conversation, turn_scores, round_num, num_children):
+        stats["requests"] += 1
+        user_response = await call_model_async(user_model, build_user_prompt(question, conversation))
+        if user_response is None:
+            return []
+        prefix = conversation + [{"speaker": "user", "content": user_response}]
+        agent_prompt = build_agent_prompt(question, prefix)
+        stats["requests"] += num_children
+
+        async def branch(i):
+            reply = await call_model_async(agent_model, agent_prompt)
+            if reply is None:
+                return None
+            dialogue = prefix + [{"speaker": "agent", "content": reply}]
+            if turn_scorer == 'judge':
+                stats["judge_requests"] += 1
+            score = await score_turn_async(question, dialogue, turn_scorer, judge_model)
+            if score is None:
+                stats["pruned_prefilter"] += 1
+                return None
+            return path + (i,), dialogue, turn_scores + [{"round": round_num + 1, **score}]
+
+        children = await asyncio.gather(*[branch(i) for i in range(num_children)])
+        return [c for c in children if c is not None]
+
+    for round_num in range(num_rounds):
+        # 束未满（第一轮只有根节点，或上一轮分支被预筛淘汰）时多展开，保证子节点数不少于束宽
+        num_children = max(beam_expand, math.ceil(beam_width / len(beam)))
+        expanded = await asyncio.gather(*[expand(p, c, t, round_num, num_children) for p, c, t in beam])
+        children = [child for group in expanded for child in group]
+        if not children:
+            logger.error(f"束搜索失败: 第 {round_num + 1} 轮没有可用分支")
+            break
+        means = [mean_total(t) for _, _, t in children]
+        scored = [m for m in means if m is not None]
+        neutral = sum(scored) / len(scored) if scored else 0.0
+        order = sorted(range(len(children)), key=lambda i: means[i] if means[i] is not None else neutral, reverse=True)
+        children = [children[i] for i in order]
+        stats["pruned_beam"] += max(0, len(children) - beam_width)
+        beam = children[:beam_width]
+
+    return {"beam": beam, **stats}
+
+
+async def step1_dual_beam_generation_async(
+    questions: List[str],
+    user_model_name: str,
+    agent_model_name: str,
+    num_candidates: int,
+    num_rounds: int = 3,
+    beam_expand: int = 2,
+    turn_scorer: str = 'judge',
+    judge_model: str = GPT_MODEL
+) -> List[Dict]:
+    """
+    Step 1: 在线打分 + 束搜索的双模型生成
+
+    Args:
+        questions: 问题列表
+        user_model_name: User模型键名
+        agent_model_name: Agent模型键名
+        num_candidates: 束宽（每个问题最终输出的候选数）
+        num_rounds: 每个对话的轮数
+        beam_expand: 每个部分对话每轮展开的 Agent 回复数
+        turn_scorer: judge=短评分 prompt, prefilter=本地预筛（不调用评委）
+        judge_model: 轮次评分模型 ID
+    """
+    user_model = AVAILABLE_MODELS.get(user_model_name, user_model_name)
+    agent_model = AVAILABLE_MODELS.get(agent_model_name, agent_model_name)
+
+    logger.info("\n" + "="*80)
+    logger.info("Step 1: Dual-Model Beam Generation with Turn Scoring (Async)")
+    logger.info("="*80)
+    logger.info(f"问题数: {len(questions)} | 束宽: {num_candidates} | 每轮展开: {beam_expand} | 轮次打分: {turn_scorer}")
+    logger.info(f"User模型: {user_model} | Agent模型: {agent_model} | 对话轮数: {num_rounds}")
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Branch':<12} {'Turns':<7} {'TurnAvg':<8}")
+    logger.info("-"*80)
+
+    searches = await asyncio.gather(*[
+        generate_dual_beam_async(question, user_model, agent_model, num_candidates, num_rounds,
+                                 beam_expand, turn_scorer, judge_model)
+        for question in questions
+    ])
+
+    results = []
+    totals = {"requests": 0, "judge_requests": 0, "pruned_prefilter": 0, "pruned_beam": 0}
+    for idx, (question, search) in enumerate(zip(questions, searches), 1):
+        for key in totals:
+            totals[key] += search[key]
+        for cand_id, (path, conversation, turn_scores) in enumerate(search['beam'], 1):
+            branch = '.'.join(str(i) for i in path)
+            scored_turns = [t['Total'] for t in turn_scores if 'Total' in t]
+            turn_avg = sum(scored_turns) / len(scored_turns) if scored_turns else 0.0
+            results.append({
+                "question_id": idx,
+                "question": question,
+                "candidate_id": cand_id,
+                "mode": "dual",
+                "models": {
+                    "user": user_model,
+                    "agent": agent_model
+                },
+                "branch": branch,
+                "turn_scores": turn_scores,
+                "output": {
+                    "question": question,
+                    "cot": f"使用双模型束搜索生成，User模型: {user_model}, Agent模型: {agent_model}, 轮数: {num_rounds}, 分支: {branch}",
+                    "dialogue": conversation
+                }
+            })
+            logger.info(f"{idx:<5} {cand_id:<5} {branch:<12} {len(conversation):<7} {turn_avg:<8.2f}")
+            log_event('generation', question_id=idx, candidate_id=cand_id, status='success',
+                      turns=len(conversation), branch=branch, turn_avg=turn_avg)
+
+    logger.info("-"*80)
+    logger.info(f"🔦 生成请求: {totals['requests']} | 轮次评分请求: {totals['judge_requests']} | "
+                f"预筛剪枝: {totals['pruned_prefilter']} | 束外剪枝: {totals['pruned_beam']}")
+    log_event('beam', beam_width=num_candidates, beam_expand=beam_expand, turn_scorer=turn_scorer, **totals)
+    logger.info(f"✅ Step 1 完成: {len(results)}/{len(questions) * num_candidates} 成功\n")
+    return results
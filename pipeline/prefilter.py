@@ -0,0 +1,192 @@
+"""
+Step 1.5: 本地预筛 - 评分前的规则/词表检查
+在调用 LLM 评委之前剔除格式错误或违反生成规则的候选（每个候选微秒级，不调用 API），
+只有通过的候选进入 step2_* 评分。
+
+检查项（硬性=直接淘汰，软性=扣分，可配合 max_per_question 在评分前截断）：
+- 硬性: 对话为空、内容为空、角色混乱（首轮不是用户 / 角色不交替 / 未知角色）、
+        咨询师回复基本不含中文、诊断性断言或用药建议（prompts.json: 禁止医疗诊断、病名标签或承诺性结论）
+- 软性: 轮数不符、承诺性结论、回复过短、提及病名（如复述来访者的担心）、夹杂较多英文术语
+  （"我不是医生，无法给你做诊断" 这类转介、"CBT 里有个方法叫 thought record" 这类术语不应被淘汰）
+"""
+import re
+import time
+import logging
+from typing import List, Dict, Tuple
+
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+PREFILTER_MODES = ["off", "reject", "rank"]
+
+# 角色归一化（单模型用 role: User/Assistant，双模型用 speaker: user/agent）
+USER_ROLES = {"user", "用户", "来访者", "求助者"}
+ASSISTANT_ROLES = {"assistant", "agent", "咨询师"}
+
+# 诊断性断言 / 用药建议（硬性）
+DIAGNOSIS_PATTERNS = [
+    r"你(可能|应该|大概|很可能|肯定|显然|多半)?(患有|得了|患上)",
+    r"你(这|这个|的情况|的症状)(就|应该|可能|大概)?是.{0,8}(症|障碍|病)",
+    r"(确诊|诊断)为", r"我(诊断|判断)你",
+    r"你(可以|应该|需要|不妨)?(服用|吃|开).{0,4}(药物|处方|安眠药|抗抑郁)"
+]
+# 病名（软性：咨询师复述来访者的担心或建议就医时可能提及）
+DISEASE_PATTERNS = [
+    r"抑郁症", r"焦虑症", r"双相", r"躁郁症", r"强迫症", r"精神分裂", r"人格障碍", r"创伤后应激障碍",
+    r"\bPTSD\b", r"进食障碍"
+]
+# 承诺性结论
+PROMISE_PATTERNS = [r"一定会好", r"保证", r"肯定会(好|没事)", r"绝对(不会|没问题)", r"马上就会好"]
+
+_DIAGNOSIS_RE = re.compile("|".join(DIAGNOSIS_PATTERNS), re.IGNORECASE)
+_DISEASE_RE = re.compile("|".join(DISEASE_PATTERNS), re.IGNORECASE)
+_PROMISE_RE = re.compile("|".join(PROMISE_PATTERNS))
+_CJK_RE = re.compile(r"[一-鿿]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+# 咨询师回复中汉字占 (汉字 + 拉丁字母) 的比例：低于 MIN_CJK_RATIO 扣分，低于 HARD_CJK_RATIO 淘汰
+MIN_CJK_RATIO = 0.5
+HARD_CJK_RATIO = 0.1
+# 咨询师回复的最短长度（字符）
+MIN_REPLY_CHARS = 8
+
+# 软性问题的扣分
+PENALTIES = {
+    "turn_count": 0.3,
+    "promise": 0.3,
+    "short_reply": 0.2,
+    "disease_term": 0.2,
+    "latin_terms": 0.2
+}
+
+
+def _normalize_role(turn: Dict) -> str:
+    role = str(turn.get('role') or turn.get('speaker') or '').strip().lower()
+    if role in USER_ROLES:
+        return "user"
+    if role in ASSISTANT_ROLES:
+        return "assistant"
+    return role or "unknown"
+
+
+def check_dialogue(output: Dict, expected_turns: int = None) -> Tuple[List[str], List[str]]:
+    """
+    检查单个候选的对话
+
+    Args:
+        output: 候选的 output（GenerationOutput 或双模型对话结构）
+        expected_turns: 期望的对话轮数（一问一答为一轮），None 表示不检查
+
+    Returns:
+        (硬性问题列表, 软性问题列表)
+    """
+    hard, soft = [], []
+    dialogue = output.get('dialogue') if isinstance(output, dict) else None
+    if not isinstance(dialogue, list) or not dialogue:
+        return ["empty_dialogue"], soft
+
+    roles = [_normalize_role(t) for t in dialogue]
+    contents = [str(t.get('content') or '').strip() for t in dialogue]
+
+    if any(not c for c in contents):
+        hard.append("empty_content")
+    if roles[0] != "user" or any(r not in ("user", "assistant") for r in roles) \
+            or any(a == b for a, b in zip(roles, roles[1:])):
+        hard.append("role_confusion")
+
+    replies = [c for r, c in zip(roles, contents) if r == "assistant" and c]
+    cjk = sum(len(_CJK_RE.findall(c)) for c in replies)
+    latin = sum(len(_LATIN_RE.findall(c)) for c in replies)
+    if replies and cjk < HARD_CJK_RATIO * (cjk + latin):
+        hard.append("non_chinese")
+    elif replies and cjk < MIN_CJK_RATIO * (cjk + latin):
+        soft.append("latin_terms")
+    if any(_DIAGNOSIS_RE.search(c) for c in replies):
+        hard.append("diagnosis")
+
+    if expected_turns and len(dialogue) != expected_turns * 2:
+        soft.append("turn_count")
+    if any(_PROMISE_RE.search(c) for c in replies):
+        soft.append("promise")
+    if any(len(c) < MIN_REPLY_CHARS for c in replies):
+        soft.append("short_reply")
+    if any(_DISEASE_RE.search(c) for c in replies):
+        soft.append("disease_term")
+
+    return hard, soft
+
+
+def prefilter_candidates(
+    candidates: List[Dict],
+    mode: str = "reject",
+    expected_turns: int = None,
+    max_per_question: int = None
+) -> Tuple[List[Dict], List[Dict], Dict]:
+    """
+    本地预筛
+
+    Args:
+        candidates: 候选列表
+        mode: off=不筛选, reject=淘汰硬性问题, rank=淘汰硬性问题且按本地分排序
+        expected_turns: 期望的对话轮数（None 表示不检查轮数）
+        max_per_question: 每个问题最多保留的候选数（按本地分截断，None 表示不截断）
+
+    Returns:
+        (通过的候选, 被淘汰的候选, 统计信息)
+        每个候选附加 prefilter = {score, hard, soft}
+    """
+    start = time.perf_counter()
+    if mode == "off":
+        return candidates, [], {"mode": mode, "total": len(candidates), "passed": len(candidates), "rejected": 0}
+
+    passed, rejected = [], []
+    reasons = {}
+    for c in candidates:
+        hard, soft = check_dialogue(c.get('output', {}), expected_turns)
+        score = max(0.0, 1.0 - sum(PENALTIES.get(r, 0.0) for r in soft)) if not hard else 0.0
+        item = {**c, 'prefilter': {'score': score, 'hard': hard, 'soft': soft}}
+        for reason in hard + soft:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        (rejected if hard else passed).append(item)
+
+    truncated = 0
+    if mode == "rank" or max_per_question:
+        by_question = {}
+        for item in passed:
+            by_question.setdefault(item['question_id'], []).append(item)
+        passed = []
+        for qid, items in by_question.items():
+            items = sorted(items, key=lambda x: x['prefilter']['score'], reverse=True)
+            if max_per_question:
+                for item in items[max_per_question:]:
+                    item['prefilter']['hard'] = ["truncated"]
+                    rejected.append(item)
+                truncated += max(0, len(items) - max_per_question)
+                items = items[:max_per_question]
+            passed.extend(items)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "mode": mode,
+        "total": len(candidates),
+        "passed": len(passed),
+        "rejected": len(rejected),
+        "truncated": truncated,
+        "reasons": reasons,
+        "seconds": elapsed,
+        "us_per_candidate": elapsed / len(candidates) * 1e6 if candidates else 0.0
+    }
+    return passed, rejected, stats
+
+
+def log_prefilter_stats(stats: Dict):
+    """输出预筛统计"""
+    total = stats['total'] or 1
+    logger.info(f"🧹 本地预筛 ({stats['mode']}): {stats['passed']}/{stats['total']} 通过 | "
+                f"淘汰 {stats['rejected']} ({stats['rejected'] / total:.0%})"
+                + (f" | 截断 {stats['truncated']}" if stats.get('truncated') else "")
+                + (f" | {stats['us_per_candidate']:.1f} µs/候选" if 'us_per_candidate' in stats else ""))
+    for reason, count in sorted(stats.get('reasons', {}).items(), key=lambda x: -x[1]):
+        logger.info(f"  {reason:<16} {count:<5}")
+    log_event('prefilter', **stats)
@@ -5,8 +5,11 @@ import logging
 import asyncio
 from typing import List, Dict
 
-from config_async import client, GPT_MODEL, build_evaluation_prompt
+from config_async import GPT_MODEL, build_evaluation_prompt
+from utils.api_client import chat_completion
 from core.schemas import EvaluationOutput
+from utils.offload import parse_json_async
+from utils.log_writer import log_event
 
 logger = logging.getLogger('experiment')
 
@@ -15,7 +18,7 @@ async def call_api_structured_async(model: str, prompt: str, schema_class, max_r
     """异步调用API"""
     for attempt in range(max_retries):
         try:
-            response = await client.chat.completions.create(
+            response = await chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -24,7 +27,7 @@ async def call_api_structured_async(model: str, prompt: str, schema_class, max_r
             )
             
             json_str = response.choices[0].message.content
-            result = schema_class.model_validate_json(json_str)
+            result = await parse_json_async(schema_class, json_str)
             logger.debug(f"API调用成功 [{model}]: JSON 输出已验证")
             return result
                 
@@ -37,7 +40,7 @@ async def call_api_structured_async(model: str, prompt: str, schema_class, max_r
     return None
 
 
-async def score_one_round_async(candidate, round_idx):
+async def score_one_round_async(candidate, round_idx, model: str = GPT_MODEL):
     """异步单轮评分"""
     output = candidate.get('output', {})
     dialogue = output.get('dialogue', [])
@@ -48,7 +51,7 @@ async def score_one_round_async(candidate, round_idx):
         dialogue_str = str(dialogue)
     
     prompt = build_evaluation_prompt(dialogue_str)
-    result = await call_api_structured_async(GPT_MODEL, prompt, EvaluationOutput)
+    result = await call_api_structured_async(model, prompt, EvaluationOutput)
     
     if result:
         return result.dict()
@@ -60,7 +63,8 @@ async def step2_gpt_scoring_async(
     num_rounds: int,
     scoring_mode: str = 'per_turn',
     scoring_prompt: str = None,
-    top_k: int = None
+    top_k: int = None,
+    model: str = GPT_MODEL
 ) -> List[Dict]:
     """
     Step 2: 使用GPT异步评分
@@ -71,11 +75,12 @@ async def step2_gpt_scoring_async(
         scoring_mode: 'per_turn' 或 'overall' (保留参数，实际由外部路由)
         scoring_prompt: 自定义评分prompt
         top_k: 每个问题保留前K个（None表示全部保留）
+        model: 评分模型 ID
     """
     logger.info("\n" + "="*80)
     logger.info("Step 2: GPT Multi-round Scoring (Async)")
     logger.info("="*80)
-    logger.info(f"候选数: {len(candidates)} | 评分轮次: {num_rounds}")
+    logger.info(f"候选数: {len(candidates)} | 评分轮次: {num_rounds} | 模型: {model}")
     logger.info(f"\n{'QID':<5} {'CID':<5} {'Emp':<6} {'Sup':<6} {'Gui':<6} {'Saf':<6} {'Total':<8}")
     logger.info("-"*80)
     
@@ -84,7 +89,7 @@ async def step2_gpt_scoring_async(
     # 对每个候选进行多轮评分
     for candidate in candidates:
         # 异步并发评分多轮
-        tasks = [score_one_round_async(candidate, i) for i in range(num_rounds)]
+        tasks = [score_one_round_async(candidate, i, model) for i in range(num_rounds)]
         all_scores = await asyncio.gather(*tasks)
         
         # 过滤None
@@ -103,6 +108,8 @@ async def step2_gpt_scoring_async(
                        f"{avg_scores['Empathy']:<6.2f} {avg_scores['Supportiveness']:<6.2f} "
                        f"{avg_scores['Guidance']:<6.2f} {avg_scores['Safety']:<6.2f} "
                        f"{avg_scores['Total']:<8.2f}")
+            log_event('scoring', question_id=candidate['question_id'], candidate_id=candidate['candidate_id'],
+                      rounds=len(all_scores), **avg_scores)
             
             results.append({
                 "question_id": candidate['question_id'],
@@ -110,7 +117,9 @@ async def step2_gpt_scoring_async(
                 "candidate_id": candidate['candidate_id'],
                 "output": candidate.get('output', {}),
                 "scores": avg_scores,
-                "score_details": all_scores
+                "score_details": all_scores,
+                # 在线束搜索生成时的轮次分数
+                **({"turn_scores": candidate['turn_scores']} if 'turn_scores' in candidate else {})
             })
     
     logger.info("-"*80)
@@ -0,0 +1,268 @@
+"""
+Step 2C: 多评委集成打分 - 异步版本
+每个候选同时发给多个评委模型（各自受独立限流约束），按权重聚合，并统计评委间一致性
+"""
+import logging
+import asyncio
+from itertools import combinations
+from typing import List, Dict, Optional
+
+from config_async import resolve_model
+from pipeline.scoring_async import score_one_round_async
+from pipeline.scoring_overall_async import score_one_overall_async
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+DIMENSIONS = ['Empathy', 'Supportiveness', 'Guidance', 'Safety']
+
+# 一致性加权时的最低权重（避免某评委被完全忽略）
+MIN_AGREEMENT_WEIGHT = 0.05
+
+
+def parse_judge_weights(spec: str) -> Dict[str, float]:
+    """解析 "qwen-max=2,turing-gpt-mini=1" 形式的评委权重"""
+    weights = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"评委权重格式错误: {item}（应为 评委=权重）")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+def _average(scores_list: List[Dict]) -> Dict:
+    avg = {k: sum(s[k] for s in scores_list) / len(scores_list) for k in DIMENSIONS}
+    avg['Total'] = sum(avg.values())
+    return avg
+
+
+async def score_with_judge_async(candidate: Dict, judge: str, scoring_mode: str = 'overall',
+                                 scoring_prompt: str = None, num_rounds: int = 1) -> Optional[Dict]:
+    """
+    单个评委对单个候选打分
+
+    Returns:
+        {'scores': 平均分, 'rounds': 每轮分数}，全部失败时返回 None
+    """
+    model = resolve_model(judge)
+    if scoring_mode == 'overall':
+        result = await score_one_overall_async(candidate, scoring_prompt, num_rounds, model)
+        if result is None:
+            return None
+        return {'scores': result['scores'], 'rounds': result['score_details']}
+
+    rounds = await asyncio.gather(*[score_one_round_async(candidate, i, model) for i in range(num_rounds)])
+    rounds = [{k: r.get(k, 0.0) for k in DIMENSIONS} for r in rounds if r is not None]
+    if not rounds:
+        return None
+    return {'scores': _average(rounds), 'rounds': rounds}
+
+
+def aggregate_judges(judge_scores: Dict[str, Dict], weights: Dict[str, float]) -> Dict:
+    """按权重聚合各评委的平均分（只在成功的评委间归一化）"""
+    total_weight = sum(weights.get(j, 1.0) for j in judge_scores)
+    if total_weight <= 0:
+        total_weight = len(judge_scores)
+        weights = {}
+    agg = {
+        k: sum(weights.get(j, 1.0) * s[k] for j, s in judge_scores.items()) / total_weight
+        for k in DIMENSIONS
+    }
+    agg['Total'] = sum(agg.values())
+    return agg
+
+
+def _pearson(xs: List[float], ys: List[float]) -> Optional[float]:
+    n = len(xs)
+    if n < 2:
+        return None
+    mx, my = sum(xs) / n, sum(ys) / n
+    sxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    sxx = sum((x - mx) ** 2 for x in xs)
+    syy = sum((y - my) ** 2 for y in ys)
+    if sxx == 0 or syy == 0:
+        return None
+    return sxy / (sxx * syy) ** 0.5
+
+
+def judge_agreement(scored_candidates: List[Dict]) -> Dict:
+    """
+    评委一致性统计（基于各候选的 judge_scores）
+
+    Returns:
+        {
+            "judges": {评委: {n, mean_total, corr_with_others, mean_abs_diff, rank_agreement}},
+            "pairwise": {"评委A|评委B": Total 的 Pearson 相关}
+        }
+
+        - corr_with_others: 与其余评委平均 Total 的相关（留一法）
+        - mean_abs_diff: 与集成 Total 的平均绝对差
+        - rank_agreement: 同一问题的候选两两比较时，与集成排序一致的比例
+    """
+    judges = sorted({j for c in scored_candidates for j in c.get('judge_scores', {})})
+    stats = {"judges": {}, "pairwise": {}}
+
+    for judge in judges:
+        mine, others, diffs = [], [], []
+        for c in scored_candidates:
+            js = c.get('judge_scores', {})
+            if judge not in js:
+                continue
+            diffs.append(abs(js[judge]['Total'] - c['scores']['Total']))
+            rest = [s['Total'] for j, s in js.items() if j != judge]
+            if rest:
+                mine.append(js[judge]['Total'])
+                others.append(sum(rest) / len(rest))
+
+        # 同题候选两两排序一致率
+        by_question = {}
+        for c in scored_candidates:
+            if judge in c.get('judge_scores', {}):
+                by_question.setdefault(c['question_id'], []).append(c)
+        agree = pairs = 0
+        for items in by_question.values():
+            for a, b in combinations(items, 2):
+                ensemble_diff = a['scores']['Total'] - b['scores']['Total']
+                judge_diff = a['judge_scores'][judge]['Total'] - b['judge_scores'][judge]['Total']
+                if ensemble_diff == 0 or judge_diff == 0:
+                    continue
+                pairs += 1
+                agree += (ensemble_diff > 0) == (judge_diff > 0)
+
+        stats["judges"][judge] = {
+            "n": len(diffs),
+            "mean_total": sum(c['judge_scores'][judge]['Total'] for c in scored_candidates
+                              if judge in c.get('judge_scores', {})) / len(diffs) if diffs else None,
+            "corr_with_others": _pearson(mine, others),
+            "mean_abs_diff": sum(diffs) / len(diffs) if diffs else None,
+            "rank_agreement": agree / pairs if pairs else None
+        }
+
+    for a, b in combinations(judges, 2):
+        shared = [c['judge_scores'] for c in scored_candidates
+                  if a in c.get('judge_scores', {}) and b in c.get('judge_scores', {})]
+        stats["pairwise"][f"{a}|{b}"] = _pearson([s[a]['Total'] for s in shared], [s[b]['Total'] for s in shared])
+
+    return stats
+
+
+def agreement_weights(agreement: Dict, base_weights: Dict[str, float]) -> Dict[str, float]:
+    """按与其他评委的相关性调整权重：权重 = 基础权重 × max(相关, MIN_AGREEMENT_WEIGHT)"""
+    weights = {}
+    for judge, s in agreement["judges"].items():
+        corr = s["corr_with_others"]
+        weights[judge] = base_weights.get(judge, 1.0) * max(corr if corr is not None else 1.0, MIN_AGREEMENT_WEIGHT)
+    return weights
+
+
+def log_agreement(agreement: Dict, weights: Dict[str, float]):
+    """输出评委一致性表"""
+    def fmt(v):
+        return f"{v:.3f}" if v is not None else "-"
+
+    logger.info(f"\n🤝 评委一致性:")
+    logger.info(f"{'Judge':<20} {'N':<5} {'Weight':<8} {'Mean':<8} {'Corr':<8} {'MAD':<8} {'Rank':<8}")
+    logger.info("-"*80)
+    for judge, s in agreement["judges"].items():
+        logger.info(
+            f"{judge:<20} {s['n']:<5} {weights.get(judge, 1.0):<8.3f} {fmt(s['mean_total']):<8} "
+            f"{fmt(s['corr_with_others']):<8} {fmt(s['mean_abs_diff']):<8} {fmt(s['rank_agreement']):<8}"
+        )
+    for pair, corr in agreement["pairwise"].items():
+        logger.info(f"  {pair}: r={fmt(corr)}")
+    logger.info("-"*80)
+
+
+async def step2_ensemble_scoring_async(
+    candidates: List[Dict],
+    judges: List[str],
+    scoring_mode: str = 'overall',
+    scoring_prompt: str = None,
+    score_rounds: int = 1,
+    top_k: int = None,
+    weights: Dict[str, float] = None,
+    weighting: str = 'fixed'
+) -> List[Dict]:
+    """
+    Step 2: 多评委集成打分（异步）
+
+    Args:
+        candidates: 候选对话列表
+        judges: 评委模型（AVAILABLE_MODELS 键名或模型 ID）
+        scoring_mode: 'per_turn' 或 'overall'，决定评委使用的 prompt
+        scoring_prompt: 自定义评分prompt（仅 overall）
+        score_rounds: 每个评委对每个候选的评分轮次
+        top_k: 每个问题保留前K个结果（None表示保留全部）
+        weights: 评委权重 {评委: 权重}，未指定的评委权重为 1
+        weighting: fixed=按 weights 固定加权, agreement=再按评委与其他评委的一致性调整
+    """
+    weights = dict(weights or {})
+    logger.info("\n" + "="*80)
+    logger.info("Step 2: Multi-judge Ensemble Scoring (Async)")
+    logger.info("="*80)
+    logger.info(f"候选数: {len(candidates)} | 评委: {', '.join(judges)} | 每评委轮次: {score_rounds} | "
+                f"加权: {weighting} | Top-K: {top_k or '全部'}")
+
+    # 所有候选 × 所有评委并发，各评委的请求受各自限流约束
+    async def score_candidate(candidate):
+        results = await asyncio.gather(*[
+            score_with_judge_async(candidate, judge, scoring_mode, scoring_prompt, score_rounds)
+            for judge in judges
+        ])
+        return candidate, {j: r for j, r in zip(judges, results) if r is not None}
+
+    scored_results = await asyncio.gather(*[score_candidate(c) for c in candidates])
+
+    scored_candidates = []
+    for candidate, by_judge in scored_results:
+        if not by_judge:
+            continue
+        judge_scores = {j: r['scores'] for j, r in by_judge.items()}
+        scored_candidates.append({
+            **candidate,
+            'scores': aggregate_judges(judge_scores, weights),
+            'judge_scores': judge_scores,
+            'score_details': [{'judge': j, **s} for j, r in by_judge.items() for s in r['rounds']]
+        })
+
+    agreement = judge_agreement(scored_candidates)
+    if weighting == 'agreement':
+        weights = agreement_weights(agreement, weights)
+        for item in scored_candidates:
+            item['scores'] = aggregate_judges(item['judge_scores'], weights)
+        agreement = judge_agreement(scored_candidates)
+
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Emp':<6} {'Sup':<6} {'Gui':<6} {'Saf':<6} {'Total':<7} {'Judges':<6}")
+    logger.info("-"*80)
+    for item in scored_candidates:
+        scores = item['scores']
+        logger.info(
+            f"{item['question_id']:<5} {item['candidate_id']:<5} "
+            f"{scores['Empathy']:<6.2f} {scores['Supportiveness']:<6.2f} "
+            f"{scores['Guidance']:<6.2f} {scores['Safety']:<6.2f} "
+            f"{scores['Total']:<7.2f} {len(item['judge_scores']):<6}"
+        )
+        log_event('scoring', question_id=item['question_id'], candidate_id=item['candidate_id'],
+                  rounds=len(item['score_details']), judges=list(item['judge_scores']), **scores)
+
+    log_agreement(agreement, {j: weights.get(j, 1.0) for j in judges})
+    log_event('judge_agreement', weighting=weighting, weights={j: weights.get(j, 1.0) for j in judges}, **agreement)
+    logger.info(f"✅ Step 2 完成: {len(scored_candidates)} 个候选评分完成\n")
+
+    # Top-K筛选（如果指定）
+    if top_k is not None and top_k > 0:
+        by_question = {}
+        for item in scored_candidates:
+            by_question.setdefault(item['question_id'], []).append(item)
+
+        filtered_results = []
+        for items in by_question.values():
+            filtered_results.extend(sorted(items, key=lambda x: x['scores']['Total'], reverse=True)[:top_k])
+
+        logger.info(f"📊 Top-K筛选: {len(scored_candidates)} → {len(filtered_results)}")
+        return filtered_results
+
+    return scored_candidates
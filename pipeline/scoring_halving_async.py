@@ -0,0 +1,195 @@
+"""
+Step 2E: 逐次减半排序打分 - 异步版本
+先对所有候选整体打分一轮，之后只给 Top-K 分界线附近、排名仍不确定的候选追加评分轮次，
+每轮追加的候选数减半，直到排名稳定或达到最大轮次。输出格式与整体打分相同。
+"""
+import math
+import logging
+import asyncio
+from typing import List, Dict
+
+from config_async import GPT_MODEL
+from pipeline.scoring_overall_async import call_scoring_api_async, render_overall_prompt
+from utils.offload import offload
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+DIMENSIONS = ['Empathy', 'Supportiveness', 'Guidance', 'Safety']
+
+# 只有一轮分数时假设的 Total 标准差（四个维度之和的量级）
+DEFAULT_TOTAL_SD = 1.5
+# 与分界线的距离小于 HALVING_Z 个标准误时视为排名不确定
+HALVING_Z = 1.0
+
+
+def _total(s: Dict) -> float:
+    return sum(s[k] for k in DIMENSIONS)
+
+
+def _mean_total(rounds: List[Dict]) -> float:
+    return sum(_total(s) for s in rounds) / len(rounds)
+
+
+def _pooled_sd(all_rounds: List[List[Dict]]) -> float:
+    """同一问题内多轮候选的合并标准差，样本不足时用 DEFAULT_TOTAL_SD"""
+    ss, dof = 0.0, 0
+    for rounds in all_rounds:
+        if len(rounds) >= 2:
+            mean = _mean_total(rounds)
+            ss += sum((_total(s) - mean) ** 2 for s in rounds)
+            dof += len(rounds) - 1
+    return math.sqrt(ss / dof) if dof and ss > 0 else DEFAULT_TOTAL_SD
+
+
+def select_uncertain(rounds_by_candidate: List[List[Dict]], k: int, budget: int) -> List[int]:
+    """
+    选出分界线附近排名不确定的候选
+
+    Args:
+        rounds_by_candidate: 每个候选已有的评分轮次（没有分数的候选不参与）
+        k: 分界线位置（Top-K）
+        budget: 本轮最多追加的候选数
+
+    Returns:
+        需要追加评分的候选下标（按不确定程度排序）
+    """
+    scored = [i for i, rounds in enumerate(rounds_by_candidate) if rounds]
+    if len(scored) <= k:
+        return []
+
+    means = {i: _mean_total(rounds_by_candidate[i]) for i in scored}
+    ranked = sorted(scored, key=lambda i: means[i], reverse=True)
+    boundary = (means[ranked[k - 1]] + means[ranked[k]]) / 2
+    sd = _pooled_sd([rounds_by_candidate[i] for i in scored])
+
+    z = {i: abs(means[i] - boundary) / (sd / math.sqrt(len(rounds_by_candidate[i]))) for i in scored}
+    uncertain = sorted((i for i in scored if z[i] < HALVING_Z), key=lambda i: z[i])
+    return uncertain[:budget]
+
+
+async def rank_question_async(items: List[Dict], prompts: List[str], k: int, max_rounds: int, model: str) -> List[List[Dict]]:
+    """
+    对一个问题的候选做逐次减半排序
+
+    Returns:
+        每个候选的评分轮次列表（与 items 对应）
+    """
+    async def score(i, round_idx):
+        result = await call_scoring_api_async(model, prompts[i])
+        if result:
+            return i, {'round': round_idx, **{key: getattr(result, key) for key in DIMENSIONS}}
+        return i, None
+
+    rounds_by_candidate = [[] for _ in items]
+    active = list(range(len(items)))
+    budget = len(items)
+    for round_idx in range(max_rounds):
+        results = await asyncio.gather(*[score(i, round_idx) for i in active])
+        for i, s in results:
+            if s is not None:
+                rounds_by_candidate[i].append(s)
+
+        # 每轮追加的候选数减半（至少保留一对，才能比较分界线两侧）
+        budget = max(2, math.ceil(budget / 2))
+        active = select_uncertain(rounds_by_candidate, k, budget)
+        if not active:
+            break
+    return rounds_by_candidate
+
+
+async def step2_halving_scoring_async(
+    candidates: List[Dict],
+    scoring_prompt: str = None,
+    score_rounds: int = 3,
+    top_k: int = None,
+    model: str = GPT_MODEL
+) -> List[Dict]:
+    """
+    Step 2: 逐次减半排序打分（异步）
+
+    Args:
+        candidates: 候选对话列表
+        scoring_prompt: 自定义评分prompt
+        score_rounds: 每个候选的最大评分轮次
+        top_k: 每个问题保留前K个结果（None表示保留全部，分界线按 Top-1 计算）
+        model: 评分模型 ID
+    """
+    k = top_k if top_k is not None and top_k > 0 else 1
+
+    logger.info("\n" + "="*80)
+    logger.info("Step 2: Successive-halving Ranking (Async)")
+    logger.info("="*80)
+    logger.info(f"候选数: {len(candidates)} | 最大评分轮次: {score_rounds} | 分界线: Top-{k} | 模型: {model}")
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Emp':<6} {'Sup':<6} {'Gui':<6} {'Saf':<6} {'Total':<7} {'Rounds':<6}")
+    logger.info("-"*80)
+
+    prompts = await asyncio.gather(*[offload(render_overall_prompt, c['output'], scoring_prompt) for c in candidates])
+
+    by_question = {}
+    for idx, c in enumerate(candidates):
+        by_question.setdefault(c['question_id'], []).append(idx)
+
+    # 各问题并发排序
+    question_ids = list(by_question)
+    question_rounds = await asyncio.gather(*[
+        rank_question_async(
+            [candidates[i] for i in by_question[qid]],
+            [prompts[i] for i in by_question[qid]],
+            k, score_rounds, model
+        )
+        for qid in question_ids
+    ])
+
+    scored_candidates = []
+    for qid, rounds_list in zip(question_ids, question_rounds):
+        for idx, rounds in zip(by_question[qid], rounds_list):
+            if not rounds:
+                continue
+            avg_scores = {key: sum(s[key] for s in rounds) / len(rounds) for key in DIMENSIONS}
+            avg_scores['Total'] = sum(avg_scores.values())
+            scored_candidates.append({
+                **candidates[idx],
+                'scores': avg_scores,
+                'score_details': rounds
+            })
+
+    # 显示评分结果
+    for item in scored_candidates:
+        scores = item['scores']
+        logger.info(
+            f"{item['question_id']:<5} {item['candidate_id']:<5} "
+            f"{scores['Empathy']:<6.2f} {scores['Supportiveness']:<6.2f} "
+            f"{scores['Guidance']:<6.2f} {scores['Safety']:<6.2f} "
+            f"{scores['Total']:<7.2f} {len(item['score_details']):<6}"
+        )
+        log_event('scoring', question_id=item['question_id'], candidate_id=item['candidate_id'],
+                  rounds=len(item['score_details']), **scores)
+
+    num_requests = sum(len(item['score_details']) for item in scored_candidates)
+    full_requests = len(candidates) * score_rounds
+    logger.info("-"*80)
+    logger.info(f"✂️  评分请求: {num_requests} / 全量 {full_requests} ({num_requests / max(full_requests, 1):.0%})")
+    log_event('halving', requests=num_requests, full_requests=full_requests, top_k=k, max_rounds=score_rounds)
+    logger.info(f"✅ Step 2 完成: {len(scored_candidates)} 个候选评分完成\n")
+
+    # Top-K筛选（如果指定）
+    if top_k is not None and top_k > 0:
+        # 按问题分组
+        grouped = {}
+        for item in scored_candidates:
+            qid = item['question_id']
+            if qid not in grouped:
+                grouped[qid] = []
+            grouped[qid].append(item)
+
+        # 每个问题保留Top-K
+        filtered_results = []
+        for qid, items in grouped.items():
+            sorted_items = sorted(items, key=lambda x: x['scores']['Total'], reverse=True)
+            filtered_results.extend(sorted_items[:top_k])
+
+        logger.info(f"📊 Top-K筛选: {len(scored_candidates)} → {len(filtered_results)}")
+        return filtered_results
+
+    return scored_candidates
@@ -0,0 +1,234 @@
+"""
+Step 2D: 列表式打分 - 异步版本
+同一问题的所有候选（或分块）放进一次评分请求，每轮重新打乱顺序以抵消位置偏差
+"""
+import logging
+import asyncio
+import json
+import random
+import string
+from typing import List, Dict
+
+from config_async import GPT_MODEL, build_listwise_evaluation_prompt
+from utils.api_client import chat_completion
+from core.schemas import ListwiseEvaluationOutput
+from utils.offload import offload, parse_json_async
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+DIMENSIONS = ['Empathy', 'Supportiveness', 'Guidance', 'Safety']
+
+
+def _labels(n: int) -> List[str]:
+    """候选编号 A..Z, AA, AB ..."""
+    letters = string.ascii_uppercase
+    return [letters[i] if i < 26 else letters[i // 26 - 1] + letters[i % 26] for i in range(n)]
+
+
+def render_listwise_prompt(question: str, outputs: List[Dict], labels: List[str], scoring_prompt: str = None) -> str:
+    """
+    渲染列表式评分 prompt
+
+    自定义 prompt 需包含 {question} 和 {candidates} 占位符
+    """
+    candidates_text = "\n\n".join(
+        f"【候选 {label}】\n{json.dumps(output.get('dialogue', []), ensure_ascii=False, indent=2)}"
+        for label, output in zip(labels, outputs)
+    )
+    if scoring_prompt:
+        return scoring_prompt.format(question=question, candidates=candidates_text)
+    return build_listwise_evaluation_prompt(question, candidates_text, labels)
+
+
+async def call_listwise_api_async(model: str, prompt: str, num_candidates: int, max_retries: int = 3):
+    """异步调用列表式评分API"""
+    for attempt in range(max_retries):
+        try:
+            response = await chat_completion(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format={"type": "json_object"},
+                temperature=0.3,
+                max_tokens=200 + 120 * num_candidates
+            )
+
+            json_str = response.choices[0].message.content
+            result = await parse_json_async(ListwiseEvaluationOutput, json_str)
+            return result
+
+        except Exception as e:
+            logger.warning(f"列表式评分API调用异常 (尝试 {attempt+1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(2)
+
+    logger.error(f"列表式评分API调用最终失败")
+    return None
+
+
+def plan_requests(candidates: List[Dict], score_rounds: int, chunk_size: int = None, seed: int = 0) -> List[Dict]:
+    """
+    规划评分请求：每个问题每轮打乱一次候选顺序，再按 chunk_size 切块
+
+    Returns:
+        [{question_id, question, round, items: [(位置, 候选下标)]}]
+    """
+    by_question = {}
+    for idx, c in enumerate(candidates):
+        by_question.setdefault(c['question_id'], []).append(idx)
+
+    requests = []
+    for qid, indices in by_question.items():
+        size = chunk_size if chunk_size and chunk_size > 0 else len(indices)
+        for round_idx in range(score_rounds):
+            order = list(indices)
+            random.Random(f"{seed}:{qid}:{round_idx}").shuffle(order)
+            for start in range(0, len(order), size):
+                chunk = order[start:start + size]
+                requests.append({
+                    "question_id": qid,
+                    "question": candidates[indices[0]]['question'],
+                    "round": round_idx,
+                    "items": list(enumerate(chunk))
+                })
+    return requests
+
+
+async def score_chunk_async(request: Dict, candidates: List[Dict], scoring_prompt: str, model: str) -> List[Dict]:
+    """
+    执行一个评分请求
+
+    Returns:
+        [{index, round, position, chunk_size, Empathy, ...}]，缺失或编号不对应的候选不返回
+    """
+    items = request['items']
+    labels = _labels(len(items))
+    outputs = [candidates[idx]['output'] for _, idx in items]
+    prompt = await offload(render_listwise_prompt, request['question'], outputs, labels, scoring_prompt)
+
+    result = await call_listwise_api_async(model, prompt, len(items))
+    if result is None:
+        return []
+
+    by_label = {s.id.strip().upper(): s for s in result.scores}
+    rounds = []
+    for label, (position, idx) in zip(labels, items):
+        s = by_label.get(label)
+        if s is None:
+            continue
+        rounds.append({
+            "index": idx,
+            "round": request['round'],
+            "position": position,
+            "chunk_size": len(items),
+            **{k: getattr(s, k) for k in DIMENSIONS}
+        })
+    if len(rounds) < len(items):
+        logger.warning(f"列表式评分缺少候选 (问题 {request['question_id']} 第 {request['round']+1} 轮): "
+                       f"{len(rounds)}/{len(items)}")
+    return rounds
+
+
+def position_bias(score_details: List[Dict]) -> Dict[int, float]:
+    """各位置的平均 Total（打乱后各位置应接近，差异即位置偏差）"""
+    by_position = {}
+    for d in score_details:
+        by_position.setdefault(d['position'], []).append(sum(d[k] for k in DIMENSIONS))
+    return {pos: sum(v) / len(v) for pos, v in sorted(by_position.items())}
+
+
+async def step2_listwise_scoring_async(
+    candidates: List[Dict],
+    scoring_prompt: str = None,
+    score_rounds: int = 3,
+    top_k: int = None,
+    model: str = GPT_MODEL,
+    chunk_size: int = None,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    Step 2: 列表式打分（异步）
+
+    Args:
+        candidates: 候选对话列表
+        scoring_prompt: 自定义评分prompt（需包含 {question} 和 {candidates}）
+        score_rounds: 评分轮次（每轮重新打乱候选顺序）
+        top_k: 每个问题保留前K个结果（None表示保留全部）
+        model: 评分模型 ID
+        chunk_size: 每次请求的最大候选数（None表示一个问题的全部候选）
+        seed: 打乱顺序的随机种子
+    """
+    if scoring_prompt and '{candidates}' not in scoring_prompt:
+        logger.warning("⚠️  自定义打分Prompt缺少 {candidates} 占位符，列表式打分使用默认Prompt")
+        scoring_prompt = None
+
+    requests = plan_requests(candidates, score_rounds, chunk_size, seed)
+
+    logger.info("\n" + "="*80)
+    logger.info("Step 2: Listwise Scoring (Async)")
+    logger.info("="*80)
+    logger.info(f"候选数: {len(candidates)} | 评分轮次: {score_rounds} | 分块: {chunk_size or '整题'} | "
+                f"请求数: {len(requests)} (逐候选需 {len(candidates) * score_rounds}) | 模型: {model}")
+    logger.info(f"\n{'QID':<5} {'CID':<5} {'Emp':<6} {'Sup':<6} {'Gui':<6} {'Saf':<6} {'Total':<7}")
+    logger.info("-"*80)
+
+    # 所有问题、所有轮次的请求并发
+    chunk_results = await asyncio.gather(*[score_chunk_async(r, candidates, scoring_prompt, model) for r in requests])
+
+    details_by_index = {}
+    for rounds in chunk_results:
+        for d in rounds:
+            details_by_index.setdefault(d.pop('index'), []).append(d)
+
+    scored_candidates = []
+    for idx, candidate in enumerate(candidates):
+        details = details_by_index.get(idx)
+        if not details:
+            continue
+        avg_scores = {k: sum(d[k] for d in details) / len(details) for k in DIMENSIONS}
+        avg_scores['Total'] = sum(avg_scores.values())
+        scored_candidates.append({
+            **candidate,
+            'scores': avg_scores,
+            'score_details': sorted(details, key=lambda d: d['round'])
+        })
+
+    # 显示评分结果
+    for item in scored_candidates:
+        scores = item['scores']
+        logger.info(
+            f"{item['question_id']:<5} {item['candidate_id']:<5} "
+            f"{scores['Empathy']:<6.2f} {scores['Supportiveness']:<6.2f} "
+            f"{scores['Guidance']:<6.2f} {scores['Safety']:<6.2f} "
+            f"{scores['Total']:<7.2f}"
+        )
+        log_event('scoring', question_id=item['question_id'], candidate_id=item['candidate_id'],
+                  rounds=len(item['score_details']), **scores)
+
+    bias = position_bias([d for item in scored_candidates for d in item['score_details']])
+    logger.info("-"*80)
+    logger.info("📍 各位置平均 Total: " + " | ".join(f"{_labels(pos + 1)[-1]}={v:.2f}" for pos, v in bias.items()))
+    log_event('listwise', requests=len(requests), candidates=len(candidates), chunk_size=chunk_size,
+              position_mean_total={str(k): v for k, v in bias.items()})
+    logger.info(f"✅ Step 2 完成: {len(scored_candidates)} 个候选评分完成\n")
+
+    # Top-K筛选（如果指定）
+    if top_k is not None and top_k > 0:
+        # 按问题分组
+        by_question = {}
+        for item in scored_candidates:
+            qid = item['question_id']
+            if qid not in by_question:
+                by_question[qid] = []
+            by_question[qid].append(item)
+
+        # 每个问题保留Top-K
+        filtered_results = []
+        for qid, items in by_question.items():
+            sorted_items = sorted(items, key=lambda x: x['scores']['Total'], reverse=True)
+            filtered_results.extend(sorted_items[:top_k])
+
+        logger.info(f"📊 Top-K筛选: {len(scored_candidates)} → {len(filtered_results)}")
+        return filtered_results
+
+    return scored_candidates
@@ -7,8 +7,11 @@ import asyncio
 import json
 from typing import List, Dict
 
-from config_async import client, GPT_MODEL, build_overall_evaluation_prompt
+from config_async import GPT_MODEL, build_overall_evaluation_prompt
+from utils.api_client import chat_completion
 from core.schemas import EvaluationOutput
+from utils.offload import offload, parse_json_async
+from utils.log_writer import log_event
 
 logger = logging.getLogger('experiment')
 
@@ -17,7 +20,7 @@ async def call_scoring_api_async(model: str, prompt: str, max_retries: int = 3):
     """异步调用评分API"""
     for attempt in range(max_retries):
         try:
-            response = await client.chat.completions.create(
+            response = await chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -26,7 +29,7 @@ async def call_scoring_api_async(model: str, prompt: str, max_retries: int = 3):
             )
             
             json_str = response.choices[0].message.content
-            result = EvaluationOutput.model_validate_json(json_str)
+            result = await parse_json_async(EvaluationOutput, json_str)
             return result
                 
         except Exception as e:
@@ -38,7 +41,18 @@ async def call_scoring_api_async(model: str, prompt: str, max_retries: int = 3):
     return None
 
 
-async def score_one_overall_async(candidate: Dict, scoring_prompt: str = None, num_rounds: int = 3):
+def render_overall_prompt(output: Dict, scoring_prompt: str = None) -> str:
+    """渲染整体评分 prompt（JSON 序列化较重，可卸载到执行器）"""
+    dialogue_json = json.dumps(output, ensure_ascii=False, indent=2)
+    
+    # 使用自定义prompt或默认prompt
+    if scoring_prompt:
+        return scoring_prompt.format(dialogue_json=dialogue_json)
+    return build_overall_evaluation_prompt(dialogue_json)
+
+
+async def score_one_overall_async(candidate: Dict, scoring_prompt: str = None, num_rounds: int = 3,
+                                  model: str = GPT_MODEL):
     """
     对单个候选对话进行整体评分（多轮求平均）
     
@@ -46,19 +60,14 @@ async def score_one_overall_async(candidate: Dict, scoring_prompt: str = None, n
         candidate: 候选对话数据
         scoring_prompt: 自定义评分prompt（可选）
         num_rounds: 评分轮次
+        model: 评分模型 ID
     """
-    dialogue_json = json.dumps(candidate['output'], ensure_ascii=False, indent=2)
-    
-    # 使用自定义prompt或默认prompt
-    if scoring_prompt:
-        prompt = scoring_prompt.format(dialogue_json=dialogue_json)
-    else:
-        prompt = build_overall_evaluation_prompt(dialogue_json)
+    prompt = await offload(render_overall_prompt, candidate['output'], scoring_prompt)
     
     # 多轮评分
     scores_list = []
     for round_idx in range(num_rounds):
-        result = await call_scoring_api_async(GPT_MODEL, prompt)
+        result = await call_scoring_api_async(model, prompt)
         if result:
             scores_list.append({
                 'Empathy': result.Empathy,
@@ -90,7 +99,8 @@ async def step2_overall_scoring_async(
     candidates: List[Dict], 
     scoring_prompt: str = None,
     score_rounds: int = 3,
-    top_k: int = None
+    top_k: int = None,
+    model: str = GPT_MODEL
 ) -> List[Dict]:
     """
     Step 2: 整体打分（异步）
@@ -100,16 +110,17 @@ async def step2_overall_scoring_async(
         scoring_prompt: 自定义评分prompt
         score_rounds: 每个候选评分轮次
         top_k: 每个问题保留前K个结果（None表示保留全部）
+        model: 评分模型 ID
     """
     logger.info("\n" + "="*80)
     logger.info("Step 2: Overall Scoring (Async)")
     logger.info("="*80)
-    logger.info(f"候选数: {len(candidates)} | 评分轮次: {score_rounds} | Top-K: {top_k or '全部'}")
+    logger.info(f"候选数: {len(candidates)} | 评分轮次: {score_rounds} | Top-K: {top_k or '全部'} | 模型: {model}")
     logger.info(f"\n{'QID':<5} {'CID':<5} {'Emp':<6} {'Sup':<6} {'Gui':<6} {'Saf':<6} {'Total':<7}")
     logger.info("-"*80)
     
     # 异步并发评分
-    tasks = [score_one_overall_async(c, scoring_prompt, score_rounds) for c in candidates]
+    tasks = [score_one_overall_async(c, scoring_prompt, score_rounds, model) for c in candidates]
     scored_results = await asyncio.gather(*tasks)
     
     # 过滤失败的结果
@@ -124,6 +135,8 @@ async def step2_overall_scoring_async(
             f"{scores['Guidance']:<6.2f} {scores['Safety']:<6.2f} "
             f"{scores['Total']:<7.2f}"
         )
+        log_event('scoring', question_id=item['question_id'], candidate_id=item['candidate_id'],
+                  rounds=len(item['score_details']), **scores)
     
     logger.info("-"*80)
     logger.info(f"✅ Step 2 完成: {len(scored_candidates)} 个候选评分完成\n")
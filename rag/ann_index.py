@@ -0,0 +1,318 @@
+"""
+近似最近邻（ANN）索引
+基于 IVF（倒排文件 + k-means 聚类）在本地实现，作用于向量库中已存储的向量
+
+- nlist: 聚类中心数，越大每个桶越小、检索越快
+- nprobe: 查询时访问的桶数，越大召回越高、延迟越高
+
+索引以 .npy 文件持久化，加载时使用内存映射（mmap），不会一次性读入内存。
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# 索引目录位于向量库目录下
+ANN_INDEX_SUBDIR = "ann_index"
+ANN_INDEX_DIR = f"vectorstore/{ANN_INDEX_SUBDIR}"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 归一化，内积即余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回得分最高的 k 个下标（降序）"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """精确检索（暴力内积），用作召回率基准"""
+    scores = vectors @ _normalize(query)
+    idx = _top_k(scores, k)
+    return idx, scores[idx]
+
+
+def kmeans(vectors: np.ndarray, nlist: int, n_iter: int = 20, seed: int = 42,
+           batch_size: int = 65536) -> np.ndarray:
+    """球面 k-means，返回归一化后的聚类中心"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    nlist = min(nlist, n)
+    centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(nlist, dtype=np.int64)
+        for start in range(0, n, batch_size):
+            batch = vectors[start:start + batch_size]
+            assign = np.argmax(batch @ centroids.T, axis=1)
+            np.add.at(sums, assign, batch)
+            counts += np.bincount(assign, minlength=nlist)
+
+        # 空簇用随机样本重新初始化
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """IVF 近似最近邻索引（余弦相似度）"""
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, offsets: np.ndarray,
+                 ids: List[str], nprobe: int = 8):
+        """
+        Args:
+            centroids: 聚类中心 (nlist, dim)
+            vectors: 按桶排序后的向量 (n, dim)
+            offsets: 每个桶在 vectors 中的起始位置 (nlist + 1,)
+            ids: 与 vectors 同序的块 ID
+            nprobe: 查询时访问的桶数
+        """
+        self.centroids = centroids
+        self.vectors = vectors
+        self.offsets = offsets
+        self.ids = ids
+        self.nprobe = nprobe
+        # 构建参数（nlist 为 None 表示按数据量自动选择），随 meta.json 保存，重建时沿用
+        self.build_params = {}
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, ids: List[str], nlist: int = None,
+              n_iter: int = 20, train_size: int = None, nprobe: int = 8, seed: int = 42) -> "IVFIndex":
+        """
+        构建索引
+
+        Args:
+            vectors: 原始向量 (n, dim)
+            ids: 块 ID 列表
+            nlist: 聚类中心数（默认 4*sqrt(n)）
+            n_iter: k-means 迭代次数
+            train_size: k-means 训练样本数（默认 256*nlist）
+            nprobe: 默认查询桶数
+            seed: 随机种子
+        """
+        requested_nlist, train_size_param = nlist, train_size
+        vectors = _normalize(vectors)
+        n = len(vectors)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        train_size = train_size or 256 * nlist
+        train = vectors if n <= train_size else vectors[rng.choice(n, train_size, replace=False)]
+        centroids = kmeans(train, nlist, n_iter=n_iter, seed=seed)
+
+        # 分配到桶，并按桶连续存储
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            assign[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        index = cls(centroids, vectors[order], offsets, [ids[i] for i in order], nprobe=nprobe)
+        index.build_params = {"nlist": requested_nlist, "n_iter": n_iter, "train_size": train_size_param, "seed": seed}
+        return index
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: int = None) -> List[Tuple[str, float]]:
+        """检索最相似的 k 个块，返回 [(id, score), ...]"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query = _normalize(query)
+        probes = _top_k(self.centroids @ query, nprobe)
+
+        cand_idx = []
+        cand_scores = []
+        for p in probes:
+            start, end = self.offsets[p], self.offsets[p + 1]
+            if start == end:
+                continue
+            cand_idx.append(np.arange(start, end))
+            cand_scores.append(self.vectors[start:end] @ query)
+        if not cand_idx:
+            return []
+
+        cand_idx = np.concatenate(cand_idx)
+        cand_scores = np.concatenate(cand_scores)
+        best = _top_k(cand_scores, k)
+        return [(self.ids[cand_idx[i]], float(cand_scores[i])) for i in best]
+
+    def save(self, directory: str = ANN_INDEX_DIR):
+        """持久化到磁盘"""
+        path = PROJECT_ROOT / directory
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "centroids.npy", np.ascontiguousarray(self.centroids))
+        np.save(path / "vectors.npy", np.ascontiguousarray(self.vectors))
+        np.save(path / "offsets.npy", self.offsets)
+        with open(path / "ids.json", 'w', encoding='utf-8') as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+        with open(path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "type": "ivf",
+                "metric": "cosine",
+                "nlist": self.nlist,
+                "nprobe": self.nprobe,
+                "num_vectors": len(self.ids),
+                "dim": int(self.vectors.shape[1]),
+                "build": self.build_params
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str = ANN_INDEX_DIR, nprobe: int = None, mmap: bool = True) -> "IVFIndex":
+        """从磁盘加载，默认内存映射向量文件"""
+        path = PROJECT_ROOT / directory
+        if not (path / "meta.json").exists():
+            raise FileNotFoundError(f"ANN 索引不存在: {path}")
+        mmap_mode = 'r' if mmap else None
+        with open(path / "meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(path / "ids.json", 'r', encoding='utf-8') as f:
+            ids = json.load(f)
+        index = cls(
+            centroids=np.load(path / "centroids.npy"),
+            vectors=np.load(path / "vectors.npy", mmap_mode=mmap_mode),
+            offsets=np.load(path / "offsets.npy"),
+            ids=ids,
+            nprobe=nprobe or meta.get("nprobe", 8)
+        )
+        index.build_params = meta.get("build", {})
+        return index
+
+
+def rebuild_params(meta: Dict) -> Dict:
+    """从已有索引的 meta.json 取出重建参数（旧版 meta 没有 build 字段时沿用实际 nlist）"""
+    params = dict(meta.get("build") or {"nlist": meta.get("nlist")})
+    params["nprobe"] = meta.get("nprobe", 8)
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def load_vectors_from_chroma(persist_directory: str = "vectorstore") -> Tuple[List[str], np.ndarray]:
+    """从 Chroma 向量库读取全部块 ID 和向量"""
+    from langchain_community.vectorstores import Chroma
+
+    vectorstore = Chroma(persist_directory=str(PROJECT_ROOT / persist_directory))
+    data = vectorstore.get(include=["embeddings"])
+    return data["ids"], np.asarray(data["embeddings"], dtype=np.float32)
+
+
+def build_ann_index(persist_directory: str = "vectorstore", nlist: int = None,
+                    nprobe: int = 8, n_iter: int = 20, train_size: int = None, seed: int = 42) -> IVFIndex:
+    """从向量库构建并保存 ANN 索引"""
+    ids, vectors = load_vectors_from_chroma(persist_directory)
+    if len(ids) == 0:
+        raise ValueError("向量库为空，请先运行 rag/indexing.py")
+
+    print(f"🔄 构建 IVF 索引: {len(ids)} 个向量, dim={vectors.shape[1]}")
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors, ids, nlist=nlist, n_iter=n_iter, train_size=train_size, nprobe=nprobe, seed=seed)
+    index.save(str(Path(persist_directory) / ANN_INDEX_SUBDIR))
+    print(f"✅ 索引已保存 (nlist={index.nlist}, 耗时 {time.perf_counter() - start:.2f}s)")
+    return index
+
+
+def benchmark_recall(index: IVFIndex, queries: np.ndarray, k: int = 10,
+                     nprobes: List[int] = None) -> List[Dict]:
+    """
+    召回率基准：对比 IVF 与精确检索
+
+    Returns:
+        每个 nprobe 的 recall@k 和平均延迟
+    """
+    nprobes = nprobes or [1, 2, 4, 8, 16, 32, 64]
+    vectors = np.asarray(index.vectors)
+
+    # 精确检索结果作为 ground truth
+    exact_start = time.perf_counter()
+    truth = []
+    for q in queries:
+        idx, _ = exact_search(vectors, q, k)
+        truth.append({index.ids[i] for i in idx})
+    exact_ms = (time.perf_counter() - exact_start) * 1000 / len(queries)
+
+    results = []
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            continue
+        hits = 0
+        start = time.perf_counter()
+        for q, t in zip(queries, truth):
+            found = {cid for cid, _ in index.search(q, k, nprobe=nprobe)}
+            hits += len(found & t)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        results.append({
+            "nprobe": nprobe,
+            "recall": hits / (len(queries) * k),
+            "latency_ms": latency_ms,
+            "exact_latency_ms": exact_ms
+        })
+    return results
+
+
+def main():
+    """命令行入口：构建索引 / 召回率基准"""
+    parser = argparse.ArgumentParser(description='案例库 IVF 近似最近邻索引')
+    parser.add_argument('command', choices=['build', 'benchmark'], help='build=构建索引, benchmark=召回率基准')
+    parser.add_argument('--nlist', type=int, default=None, help='聚类中心数（默认 4*sqrt(n)）')
+    parser.add_argument('--nprobe', type=int, default=8, help='默认查询桶数')
+    parser.add_argument('--k', type=int, default=10, help='recall@k')
+    parser.add_argument('--num-queries', type=int, default=200, help='基准查询数')
+    parser.add_argument('--synthetic', type=int, default=0, help='使用 N 个合成向量做基准（不读取向量库）')
+    parser.add_argument('--dim', type=int, default=1536, help='合成向量维度')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_ann_index(nlist=args.nlist, nprobe=args.nprobe)
+        return
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        # 合成聚簇数据，近似真实文本向量的分布
+        centers = rng.normal(size=(max(16, args.synthetic // 500), args.dim))
+        labels = rng.integers(0, len(centers), args.synthetic)
+        vectors = (centers[labels] + 0.5 * rng.normal(size=(args.synthetic, args.dim))).astype(np.float32)
+        ids = [str(i) for i in range(args.synthetic)]
+        index = IVFIndex.build(vectors, ids, nlist=args.nlist, nprobe=args.nprobe)
+    else:
+        index = IVFIndex.load(nprobe=args.nprobe)
+
+    # 用库内向量加噪声作为查询
+    sample = rng.choice(len(index), min(args.num_queries, len(index)), replace=False)
+    base = np.asarray(index.vectors)[sample]
+    queries = base + 0.05 * rng.normal(size=base.shape).astype(np.float32)
+
+    print(f"📊 召回率基准: {len(index)} 个向量, nlist={index.nlist}, k={args.k}")
+    print(f"{'nprobe':<8} {'recall':<8} {'ANN(ms)':<10} {'Exact(ms)':<10}")
+    print("-" * 40)
+    for r in benchmark_recall(index, queries, k=args.k):
+        print(f"{r['nprobe']:<8} {r['recall']:<8.3f} {r['latency_ms']:<10.3f} {r['exact_latency_ms']:<10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+BM25 倒排索引
+对向量库中的同一批块建立本地关键词索引，补充稠密检索对关键词、具体情境的召回
+
+分词：
+- char: 中文按字符 n-gram（默认 bigram），英文/数字按单词
+- jieba: 词典分词（需安装 jieba，可选依赖）
+
+倒排表以紧凑的 numpy 数组存储（uint32 文档号 + uint16 词频），加载时内存映射。
+"""
+
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# 索引目录位于向量库目录下
+BM25_INDEX_SUBDIR = "bm25_index"
+BM25_INDEX_DIR = f"vectorstore/{BM25_INDEX_SUBDIR}"
+
+_CJK_RE = re.compile(r'[一-鿿]+')
+_WORD_RE = re.compile(r'[一-鿿]+|[A-Za-z0-9]+')
+
+
+def tokenize(text: str, method: str = "char", ngram: int = 2) -> List[str]:
+    """
+    中文友好的分词
+
+    Args:
+        text: 文本
+        method: 'char'（字符 n-gram）或 'jieba'（词典分词）
+        ngram: 字符 n-gram 的 n
+    """
+    if method == "jieba":
+        try:
+            import jieba
+        except ImportError:
+            raise ImportError("jieba 分词需要安装 jieba: pip install jieba")
+        return [t.lower() for t in jieba.lcut_for_search(text) if _WORD_RE.fullmatch(t)]
+
+    tokens = []
+    for span in _WORD_RE.findall(text):
+        if not _CJK_RE.fullmatch(span):
+            tokens.append(span.lower())
+        elif len(span) < ngram:
+            tokens.append(span)
+        else:
+            tokens.extend(span[i:i + ngram] for i in range(len(span) - ngram + 1))
+    return tokens
+
+
+class BM25Index:
+    """BM25 倒排索引"""
+
+    def __init__(self, vocab: Dict[str, int], term_offsets: np.ndarray, post_docs: np.ndarray,
+                 post_tfs: np.ndarray, idf: np.ndarray, doc_lengths: np.ndarray, ids: List[str],
+                 tokenizer: str = "char", ngram: int = 2, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.idf = idf
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.tokenizer = tokenizer
+        self.ngram = ngram
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: List[str], texts: List[str], tokenizer: str = "char", ngram: int = 2,
+              k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """从块 ID 和文本构建索引"""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.uint32)
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text, tokenizer, ngram)
+            doc_lengths[doc_id] = len(tokens)
+            tf: Dict[str, int] = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            for t, c in tf.items():
+                postings.setdefault(t, []).append((doc_id, c))
+
+        terms = sorted(postings)
+        vocab = {t: i for i, t in enumerate(terms)}
+        counts = np.array([len(postings[t]) for t in terms], dtype=np.int64)
+        term_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        post_docs = np.empty(int(term_offsets[-1]), dtype=np.uint32)
+        post_tfs = np.empty(int(term_offsets[-1]), dtype=np.uint16)
+        for i, t in enumerate(terms):
+            plist = postings[t]
+            post_docs[term_offsets[i]:term_offsets[i + 1]] = [d for d, _ in plist]
+            post_tfs[term_offsets[i]:term_offsets[i + 1]] = [min(c, 65535) for _, c in plist]
+
+        n = len(texts)
+        idf = np.log(1 + (n - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+        return cls(vocab, term_offsets, post_docs, post_tfs, idf, doc_lengths, list(ids),
+                   tokenizer=tokenizer, ngram=ngram, k1=k1, b=b)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """检索，返回 [(id, bm25_score), ...]"""
+        term_ids = {self.vocab[t] for t in tokenize(query, self.tokenizer, self.ngram) if t in self.vocab}
+        if not term_ids:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avgdl, 1e-9))
+        for tid in term_ids:
+            start, end = self.term_offsets[tid], self.term_offsets[tid + 1]
+            docs = np.asarray(self.post_docs[start:end], dtype=np.int64)
+            tfs = np.asarray(self.post_tfs[start:end], dtype=np.float32)
+            scores[docs] += self.idf[tid] * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        nonzero = np.flatnonzero(scores)
+        if len(nonzero) == 0:
+            return []
+        k = min(k, len(nonzero))
+        top = nonzero[np.argpartition(-scores[nonzero], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def save(self, directory: str = BM25_INDEX_DIR):
+        """持久化到磁盘"""
+        path = PROJECT_ROOT / directory
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "term_offsets.npy", self.term_offsets)
+        np.save(path / "post_docs.npy", self.post_docs)
+        np.save(path / "post_tfs.npy", self.post_tfs)
+        np.save(path / "idf.npy", self.idf)
+        np.save(path / "doc_lengths.npy", self.doc_lengths)
+        with open(path / "vocab.json", 'w', encoding='utf-8') as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(path / "ids.json", 'w', encoding='utf-8') as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+        with open(path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "tokenizer": self.tokenizer,
+                "ngram": self.ngram,
+                "k1": self.k1,
+                "b": self.b,
+                "num_docs": len(self.ids),
+                "num_terms": len(self.vocab),
+                "num_postings": int(len(self.post_docs))
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str = BM25_INDEX_DIR, mmap: bool = True) -> "BM25Index":
+        """从磁盘加载，倒排表使用内存映射"""
+        path = PROJECT_ROOT / directory
+        if not (path / "meta.json").exists():
+            raise FileNotFoundError(f"BM25 索引不存在: {path}")
+        mmap_mode = 'r' if mmap else None
+        with open(path / "meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(path / "vocab.json", 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        with open(path / "ids.json", 'r', encoding='utf-8') as f:
+            ids = json.load(f)
+        return cls(
+            vocab=vocab,
+            term_offsets=np.load(path / "term_offsets.npy"),
+            post_docs=np.load(path / "post_docs.npy", mmap_mode=mmap_mode),
+            post_tfs=np.load(path / "post_tfs.npy", mmap_mode=mmap_mode),
+            idf=np.load(path / "idf.npy"),
+            doc_lengths=np.load(path / "doc_lengths.npy"),
+            ids=ids,
+            tokenizer=meta["tokenizer"],
+            ngram=meta["ngram"],
+            k1=meta["k1"],
+            b=meta["b"]
+        )
+
+
+def build_bm25_index(persist_directory: str = "vectorstore", tokenizer: str = "char",
+                     ngram: int = 2) -> BM25Index:
+    """从 Chroma 向量库中的块构建并保存 BM25 索引"""
+    from langchain_community.vectorstores import Chroma
+
+    vectorstore = Chroma(persist_directory=str(PROJECT_ROOT / persist_directory))
+    data = vectorstore.get(include=["documents"])
+    index = BM25Index.build(data["ids"], data["documents"], tokenizer=tokenizer, ngram=ngram)
+    index.save(str(Path(persist_directory) / BM25_INDEX_SUBDIR))
+    print(f"✅ BM25 索引已保存: {len(index)} 个块, {len(index.vocab)} 个词项")
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, weights: List[float] = None) -> List[Tuple[str, float]]:
+    """
+    RRF 融合多路检索结果
+
+    Args:
+        rankings: 每路检索的 ID 列表（按相关度降序）
+        k: RRF 平滑常数
+        weights: 每路权重（默认均为 1）
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, w in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + w / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def main():
+    """命令行入口：构建 BM25 索引"""
+    parser = argparse.ArgumentParser(description='案例库 BM25 倒排索引')
+    parser.add_argument('--tokenizer', type=str, default='char', choices=['char', 'jieba'], help='分词方式')
+    parser.add_argument('--ngram', type=int, default=2, help='字符 n-gram 的 n')
+    args = parser.parse_args()
+    build_bm25_index(tokenizer=args.tokenizer, ngram=args.ngram)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+异步向量化模块
+复用 config_async 中的 AsyncOpenAI 客户端，对文本块做批量并发向量化
+
+- 按估算 token 数切分批次（而不是固定条数）
+- 有界并发：同时最多 max_concurrency 个批次在请求中
+- 每个批次完成后立即落盘（检查点），按块内容哈希缓存向量
+- 部分批次失败时，已完成批次不受影响，重跑只请求缺失部分
+"""
+
+import os
+import sys
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Dict
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+EMBEDDING_CACHE_DIR = "vectorstore/embedding_cache"
+
+logger = logging.getLogger('experiment')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其他字符约 4 字符 1 token"""
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def make_batches(texts: List[str], max_tokens: int = 8000, max_items: int = 256) -> List[List[int]]:
+    """按 token 数切分批次，返回每批的文本下标"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingCache:
+    """
+    按内容哈希缓存向量
+
+    每个完成的批次写成一个 .npz 分片（hashes + vectors），既是缓存也是检查点。
+    """
+
+    def __init__(self, model: str, directory: str = EMBEDDING_CACHE_DIR):
+        safe_model = model.replace('/', '_')
+        self.path = PROJECT_ROOT / directory / safe_model
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._vectors: Dict[str, np.ndarray] = {}
+        for shard in sorted(self.path.glob("*.npz")):
+            try:
+                data = np.load(shard)
+                for h, v in zip(data["hashes"], data["vectors"]):
+                    self._vectors[str(h)] = v
+            except Exception as e:
+                logger.warning(f"向量缓存分片损坏，已跳过: {shard.name} ({e})")
+
+    def __contains__(self, text_hash: str) -> bool:
+        return text_hash in self._vectors
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def get(self, text_hash: str) -> np.ndarray:
+        return self._vectors[text_hash]
+
+    def put_batch(self, hashes: List[str], vectors: List[List[float]]):
+        """写入一个批次（原子落盘）"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        shard_name = hashlib.sha256(''.join(hashes).encode('utf-8')).hexdigest()[:24]
+        tmp_file = self.path / f"{shard_name}.tmp.npz"
+        np.savez(tmp_file, hashes=np.array(hashes), vectors=vectors)
+        os.replace(tmp_file, self.path / f"{shard_name}.npz")
+        for h, v in zip(hashes, vectors):
+            self._vectors[h] = v
+
+
+async def _embed_batch_async(client, model: str, texts: List[str], max_retries: int = 5) -> List[List[float]]:
+    """异步向量化一个批次，失败指数退避重试"""
+    for attempt in range(max_retries):
+        try:
+            response = await client.embeddings.create(model=model, input=texts)
+            data = sorted(response.data, key=lambda d: d.index)
+            return [d.embedding for d in data]
+        except Exception as e:
+            logger.warning(f"向量化请求异常 [{model}] (尝试 {attempt+1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(min(2 ** attempt, 30))
+    raise RuntimeError(f"向量化批次最终失败 [{model}] ({len(texts)} 条)")
+
+
+async def embed_texts_async(
+    texts: List[str],
+    model: str = "text-embedding-ada-002",
+    max_tokens_per_batch: int = 8000,
+    max_items_per_batch: int = 256,
+    max_concurrency: int = 4,
+    cache: EmbeddingCache = None,
+    client=None
+) -> List[np.ndarray]:
+    """
+    批量异步向量化
+
+    Args:
+        texts: 文本列表
+        model: 向量模型
+        max_tokens_per_batch: 每批最大估算 token 数
+        max_items_per_batch: 每批最大条数
+        max_concurrency: 同时进行的批次数
+        cache: 向量缓存（默认按模型名创建）
+        client: AsyncOpenAI 兼容客户端（默认使用 config_async 中的共享客户端）
+
+    Returns:
+        与 texts 同序的向量列表
+    """
+    if client is None:
+        from config_async import get_client
+        client = get_client()
+    cache = cache or EmbeddingCache(model)
+
+    hashes = [hashlib.sha256(t.encode('utf-8')).hexdigest() for t in texts]
+
+    # 只请求缓存中没有的文本（同一文本只请求一次）
+    missing = {}
+    for i, h in enumerate(hashes):
+        if h not in cache and h not in missing:
+            missing[h] = i
+    missing_hashes = list(missing)
+    missing_texts = [texts[missing[h]] for h in missing_hashes]
+
+    batches = make_batches(missing_texts, max_tokens_per_batch, max_items_per_batch)
+    print(f"🔄 向量化: {len(texts)} 条, 缓存命中 {len(texts) - len(missing_texts)}, "
+          f"待请求 {len(missing_texts)} 条 / {len(batches)} 批 (并发 {max_concurrency})")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    done = 0
+
+    async def run_batch(batch: List[int]):
+        nonlocal done
+        async with semaphore:
+            vectors = await _embed_batch_async(client, model, [missing_texts[i] for i in batch])
+        cache.put_batch([missing_hashes[i] for i in batch], vectors)
+        done += 1
+        print(f"  ✓ 批次 {done}/{len(batches)}")
+
+    results = await asyncio.gather(*[run_batch(b) for b in batches], return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        raise RuntimeError(f"{len(failures)}/{len(batches)} 个向量化批次失败，已完成批次已缓存，重跑可续传")
+
+    return [cache.get(h) for h in hashes]
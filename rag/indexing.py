@@ -1,12 +1,21 @@
 """
 文档索引脚本
 将 documents/ 下的文档向量化并存储到 Chroma
+
+支持增量索引：通过 manifest 记录每个文件的内容哈希和块 ID，
+只对新增/变更的块做向量化，并删除已移除文件的块。
 """
 
 import os
 import sys
+import json
+import shutil
+import hashlib
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Dict
 
 PROJECT_ROOT = Path(__file__).parent.parent.absolute()
 sys.path.insert(0, str(PROJECT_ROOT))
@@ -15,9 +24,15 @@ from langchain_community.document_loaders import TextLoader, DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
 
 from config_async import API_KEY, API_BASE_URL
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+MANIFEST_FILE = "index_manifest.json"
+MANIFEST_VERSION = 1
+SEPARATORS = ["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+
 
 def load_documents(directory: str = "documents") -> List:
     """加载文档目录下的所有文本文件"""
@@ -44,29 +59,39 @@ def load_documents(directory: str = "documents") -> List:
     return documents
 
 
-def split_documents(documents: List, chunk_size: int = 500, chunk_overlap: int = 50) -> List:
-    """切分文档为小块"""
-    text_splitter = RecursiveCharacterTextSplitter(
+def _build_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """构建中文友好的文本切分器"""
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
-        separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+        separators=SEPARATORS
     )
+
+
+def split_documents(documents: List, chunk_size: int = 500, chunk_overlap: int = 50) -> List:
+    """切分文档为小块"""
+    text_splitter = _build_splitter(chunk_size, chunk_overlap)
     
     chunks = text_splitter.split_documents(documents)
     print(f"📝 文档已切分为 {len(chunks)} 个块")
     return chunks
 
 
-def create_vectorstore(chunks: List, persist_directory: str = "vectorstore"):
-    """创建向量数据库"""
-    persist_path = PROJECT_ROOT / persist_directory
-    
-    embeddings = OpenAIEmbeddings(
+def get_embeddings() -> OpenAIEmbeddings:
+    """构建向量化模型"""
+    return OpenAIEmbeddings(
         openai_api_key=API_KEY,
         openai_api_base=API_BASE_URL,
-        model="text-embedding-ada-002"
+        model=EMBEDDING_MODEL
     )
+
+
+def create_vectorstore(chunks: List, persist_directory: str = "vectorstore"):
+    """创建向量数据库（全量）"""
+    persist_path = PROJECT_ROOT / persist_directory
+    
+    embeddings = get_embeddings()
     
     print(f"🔄 正在向量化文档...")
     
@@ -79,30 +104,323 @@ def create_vectorstore(chunks: List, persist_directory: str = "vectorstore"):
     print(f"✅ 向量库已保存到: {persist_path}")
     return vectorstore
 
+# ================================
+# 增量索引
+# ================================
+
+class PrecomputedEmbeddings(Embeddings):
+    """
+    优先返回预先计算好的向量（异步向量化的结果），使其可以通过 Chroma.add_texts 写入；
+    未预先计算的文本和查询交给真实向量化模型
+    """
+    
+    def __init__(self, vectors: Dict[str, List[float]], fallback: Embeddings):
+        self.vectors = vectors
+        self.fallback = fallback
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [t for t in texts if t not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.fallback.embed_documents(missing)))
+        return [self.vectors[t] for t in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.fallback.embed_query(text)
+
+
+def file_sha256(path: Path) -> str:
+    """计算文件内容哈希"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    """计算文本块内容哈希"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def load_manifest(persist_path: Path) -> Dict:
+    """读取索引 manifest，不存在时返回空 manifest"""
+    manifest_file = persist_path / MANIFEST_FILE
+    if manifest_file.exists():
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def save_manifest(persist_path: Path, manifest: Dict):
+    """原子写入索引 manifest"""
+    persist_path.mkdir(parents=True, exist_ok=True)
+    manifest_file = persist_path / MANIFEST_FILE
+    tmp_file = manifest_file.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+
+def load_file_chunks(path: Path, rel_path: str, chunk_size: int, chunk_overlap: int) -> List:
+    """加载并切分单个文件，为每个块生成稳定 ID（文件路径 + 内容哈希）"""
+    documents = TextLoader(str(path), encoding="utf-8").load()
+    chunks = _build_splitter(chunk_size, chunk_overlap).split_documents(documents)
+    
+    unique_chunks = []
+    seen = set()
+    for chunk in chunks:
+        c_hash = chunk_hash(chunk.page_content)
+        chunk_id = f"{rel_path}:{c_hash[:32]}"
+        if chunk_id in seen:
+            continue  # 同一文件内的重复块只保留一份
+        seen.add(chunk_id)
+        chunk.metadata['source'] = rel_path
+        chunk.metadata['chunk_hash'] = c_hash
+        chunk.metadata['chunk_id'] = chunk_id
+        unique_chunks.append(chunk)
+    return unique_chunks
+
+
+def incremental_index(
+    directory: str = "documents",
+    persist_directory: str = "vectorstore",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    batch_size: int = 64,
+    workers: int = 1,
+    rebuild: bool = False,
+    async_embed: bool = True,
+    max_concurrency: int = 4,
+    max_batch_tokens: int = 8000
+) -> Dict:
+    """
+    增量索引：只向量化新增/变更的块，删除已移除文件的块
+    
+    Args:
+        directory: 文档目录
+        persist_directory: 向量库目录
+        chunk_size: 块大小
+        chunk_overlap: 块重叠
+        batch_size: 每次向量化请求的块数
+        workers: 并行加载/切分文件的线程数
+        rebuild: 是否丢弃已有索引全量重建
+        async_embed: 使用异步批量向量化（按 token 分批、并发、缓存续传）
+        max_concurrency: 异步向量化的并发批次数
+        max_batch_tokens: 异步向量化每批最大估算 token 数
+    
+    Returns:
+        统计信息
+    """
+    docs_path = PROJECT_ROOT / directory
+    persist_path = PROJECT_ROOT / persist_directory
+    
+    if not docs_path.exists():
+        raise FileNotFoundError(f"文档目录不存在: {docs_path}")
+    
+    files = sorted(docs_path.glob("*.txt"))
+    print(f"📂 找到 {len(files)} 个文档文件")
+    
+    vectorstore = Chroma(
+        embedding_function=get_embeddings(),
+        persist_directory=str(persist_path)
+    )
+    
+    has_manifest = (persist_path / MANIFEST_FILE).exists()
+    manifest = load_manifest(persist_path)
+    settings = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": EMBEDDING_MODEL
+    }
+    # 切分参数或向量模型变化时，旧块全部失效
+    if manifest.get("settings") and manifest["settings"] != settings:
+        print("⚠️  切分参数或向量模型已变化，执行全量重建")
+        rebuild = True
+    if manifest.get("version") != MANIFEST_VERSION:
+        rebuild = True
+    # 没有 manifest 但集合非空（旧脚本建的库，块没有稳定 ID）：增量添加会与旧块重复，必须全量重建
+    if not has_manifest and not rebuild and vectorstore.get(limit=1, include=[])["ids"]:
+        print("⚠️  向量库中有 manifest 未记录的块，执行全量重建")
+        rebuild = True
+    
+    if rebuild:
+        # 清空整个集合（包括没有 manifest 记录的历史重复块）
+        vectorstore.delete_collection()
+        vectorstore = Chroma(
+            embedding_function=get_embeddings(),
+            persist_directory=str(persist_path)
+        )
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
+    manifest["settings"] = settings
+    old_files = manifest["files"]
+    
+    # 1. 对比文件哈希，找出变更文件
+    current_hashes = {}
+    changed = []
+    for path in files:
+        rel_path = str(path.relative_to(docs_path))
+        current_hashes[rel_path] = file_sha256(path)
+        old = old_files.get(rel_path)
+        if old is None or old["sha256"] != current_hashes[rel_path]:
+            changed.append((path, rel_path))
+    removed = [rel for rel in old_files if rel not in current_hashes]
+    
+    print(f"🔍 变更文件: {len(changed)} | 删除文件: {len(removed)} | 未变化: {len(files) - len(changed)}")
+    
+    # 2. 并行加载/切分变更文件
+    def _load(item):
+        path, rel_path = item
+        return rel_path, load_file_chunks(path, rel_path, chunk_size, chunk_overlap)
+    
+    if workers > 1 and len(changed) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(_load, changed))
+    else:
+        loaded = [_load(item) for item in changed]
+    
+    # 3. 计算需要新增和删除的块
+    to_add = []
+    to_delete = []
+    new_file_chunks = {}
+    for rel_path, chunks in loaded:
+        old_ids = set(old_files.get(rel_path, {}).get("chunks", []))
+        new_ids = [c.metadata['chunk_id'] for c in chunks]
+        new_file_chunks[rel_path] = new_ids
+        to_add.extend(c for c in chunks if c.metadata['chunk_id'] not in old_ids)
+        to_delete.extend(old_ids - set(new_ids))
+    for rel_path in removed:
+        to_delete.extend(old_files[rel_path]["chunks"])
+    
+    # 4. 删除失效块
+    if to_delete:
+        vectorstore.delete(ids=to_delete)
+        print(f"🗑️  已删除 {len(to_delete)} 个失效块")
+    for rel_path in removed:
+        del old_files[rel_path]
+    save_manifest(persist_path, manifest)
+    
+    # 5. 分批向量化新增块，每个文件完成后立即写入 manifest
+    pending = {rel_path: len([c for c in to_add if c.metadata['source'] == rel_path])
+               for rel_path in new_file_chunks}
+    
+    def _commit_file(rel_path):
+        old_files[rel_path] = {
+            "sha256": current_hashes[rel_path],
+            "chunks": new_file_chunks[rel_path]
+        }
+    
+    for rel_path, count in pending.items():
+        if count == 0:
+            _commit_file(rel_path)
+    
+    writer = vectorstore
+    if to_add and async_embed:
+        from rag.embedding_async import embed_texts_async
+        vectors = asyncio.run(embed_texts_async(
+            [c.page_content for c in to_add],
+            model=EMBEDDING_MODEL,
+            max_tokens_per_batch=max_batch_tokens,
+            max_items_per_batch=batch_size,
+            max_concurrency=max_concurrency
+        ))
+        # 向量已预先计算，写入时按文本取回，不再调用向量化接口
+        writer = Chroma(
+            embedding_function=PrecomputedEmbeddings(
+                {c.page_content: v.tolist() for c, v in zip(to_add, vectors)},
+                fallback=get_embeddings()
+            ),
+            persist_directory=str(persist_path)
+        )
+    elif to_add:
+        print(f"🔄 正在向量化 {len(to_add)} 个新块 (批大小: {batch_size})...")
+    
+    for start in range(0, len(to_add), batch_size):
+        batch = to_add[start:start + batch_size]
+        writer.add_texts(
+            texts=[c.page_content for c in batch],
+            metadatas=[c.metadata for c in batch],
+            ids=[c.metadata['chunk_id'] for c in batch]
+        )
+        for c in batch:
+            pending[c.metadata['source']] -= 1
+            if pending[c.metadata['source']] == 0:
+                _commit_file(c.metadata['source'])
+        save_manifest(persist_path, manifest)
+        print(f"  ✓ {min(start + batch_size, len(to_add))}/{len(to_add)}")
+    
+    save_manifest(persist_path, manifest)
+    
+    return {
+        "num_files": len(files),
+        "changed_files": len(changed),
+        "removed_files": len(removed),
+        "added_chunks": len(to_add),
+        "deleted_chunks": len(to_delete),
+        "total_chunks": sum(len(info["chunks"]) for info in manifest["files"].values())
+    }
+
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='心理咨询案例向量化索引（增量）')
+    parser.add_argument('--rebuild', action='store_true', help='丢弃已有索引，全量重建')
+    parser.add_argument('--persist-directory', type=str, default='vectorstore', help='向量库目录（相对项目根目录）')
+    parser.add_argument('--workers', type=int, default=4, help='并行加载/切分文件的线程数')
+    parser.add_argument('--batch-size', type=int, default=64, help='每次向量化请求的块数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='块大小')
+    parser.add_argument('--chunk-overlap', type=int, default=50, help='块重叠')
+    parser.add_argument('--sync-embed', action='store_true', help='使用同步向量化（不走异步批量管道）')
+    parser.add_argument('--concurrency', type=int, default=4, help='异步向量化并发批次数')
+    parser.add_argument('--max-batch-tokens', type=int, default=8000, help='异步向量化每批最大 token 数')
+    parser.add_argument('--no-bm25', action='store_true', help='不重建 BM25 倒排索引')
+    parser.add_argument('--tokenizer', type=str, default='char', choices=['char', 'jieba'], help='BM25 分词方式')
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("📚 心理咨询案例向量化索引")
     print("=" * 80)
     
     try:
-        print("\n[步骤 1/3] 加载文档...")
-        documents = load_documents()
+        stats = incremental_index(
+            persist_directory=args.persist_directory,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            rebuild=args.rebuild,
+            async_embed=not args.sync_embed,
+            max_concurrency=args.concurrency,
+            max_batch_tokens=args.max_batch_tokens
+        )
         
-        print("\n[步骤 2/3] 切分文档...")
-        chunks = split_documents(documents, chunk_size=500, chunk_overlap=50)
+        if not args.no_bm25:
+            print("\n构建 BM25 倒排索引...")
+            from rag.bm25 import build_bm25_index
+            build_bm25_index(persist_directory=args.persist_directory, tokenizer=args.tokenizer)
         
-        print("\n[步骤 3/3] 创建向量库...")
-        vectorstore = create_vectorstore(chunks)
+        # 块集合变化后，已有的 IVF 索引会漏掉新块、返回已删除的块 ID：按原参数重建（集合为空时删除）
+        if stats['added_chunks'] or stats['deleted_chunks']:
+            from rag.ann_index import ANN_INDEX_SUBDIR, build_ann_index, rebuild_params
+            ann_dir = PROJECT_ROOT / args.persist_directory / ANN_INDEX_SUBDIR
+            if (ann_dir / 'meta.json').exists():
+                print("\n块集合已变化，重建 IVF 索引...")
+                with open(ann_dir / 'meta.json', 'r', encoding='utf-8') as f:
+                    params = rebuild_params(json.load(f))
+                try:
+                    build_ann_index(persist_directory=args.persist_directory, **params)
+                except ValueError as e:
+                    shutil.rmtree(ann_dir, ignore_errors=True)
+                    print(f"⚠️  {e}，已删除过期的 IVF 索引")
         
         print("\n" + "=" * 80)
         print("🎉 索引完成！")
         print("=" * 80)
         print(f"📊 统计信息:")
-        print(f"  - 文档数量: {len(documents)}")
-        print(f"  - 文档块数: {len(chunks)}")
-        print(f"  - 向量库路径: {PROJECT_ROOT / 'vectorstore'}")
+        print(f"  - 文档数量: {stats['num_files']} (变更 {stats['changed_files']}, 删除 {stats['removed_files']})")
+        print(f"  - 新增块数: {stats['added_chunks']}")
+        print(f"  - 删除块数: {stats['deleted_chunks']}")
+        print(f"  - 文档块数: {stats['total_chunks']}")
+        print(f"  - 向量库路径: {PROJECT_ROOT / args.persist_directory}")
         print("\n现在可以运行实验并使用 --use-rag 参数启用 RAG 功能")
         
     except Exception as e:
@@ -0,0 +1,114 @@
+"""
+案例检索模块
+从向量库中检索与问题相似的心理咨询案例
+
+检索模式：
+- exact: Chroma 暴力相似度检索
+- ann: 本地 IVF 近似最近邻索引（见 rag/ann_index.py）
+- hybrid: BM25 关键词检索 + 向量检索，RRF 融合（见 rag/bm25.py）
+"""
+
+import sys
+from pathlib import Path
+from typing import List, Dict
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+RETRIEVAL_MODES = ["exact", "ann", "hybrid"]
+
+
+class CaseRetriever:
+    """案例检索器"""
+
+    def __init__(self, mode: str = "exact", persist_directory: str = "vectorstore", nprobe: int = None,
+                 dense_mode: str = "exact", rrf_k: int = 60, candidate_multiplier: int = 4):
+        """
+        Args:
+            mode: 检索模式 'exact' / 'ann' / 'hybrid'
+            persist_directory: 向量库目录
+            nprobe: ANN 模式下查询的桶数（越大召回越高）
+            dense_mode: hybrid 模式下稠密检索使用 'exact' 或 'ann'
+            rrf_k: RRF 平滑常数
+            candidate_multiplier: hybrid 模式下每路召回 k * multiplier 个候选再融合
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}")
+
+        from langchain_community.vectorstores import Chroma
+        from rag.indexing import get_embeddings
+
+        self.mode = mode
+        self.dense_mode = dense_mode if mode == "hybrid" else mode
+        self.rrf_k = rrf_k
+        self.candidate_multiplier = candidate_multiplier
+        self.embeddings = get_embeddings()
+        self.vectorstore = Chroma(
+            embedding_function=self.embeddings,
+            persist_directory=str(PROJECT_ROOT / persist_directory)
+        )
+        self.ann_index = None
+        if self.dense_mode == "ann":
+            from rag.ann_index import IVFIndex, ANN_INDEX_SUBDIR
+            self.ann_index = IVFIndex.load(str(Path(persist_directory) / ANN_INDEX_SUBDIR), nprobe=nprobe)
+        self.bm25_index = None
+        if mode == "hybrid":
+            from rag.bm25 import BM25Index, BM25_INDEX_SUBDIR
+            self.bm25_index = BM25Index.load(str(Path(persist_directory) / BM25_INDEX_SUBDIR))
+
+    def _fetch(self, ids: List[str]) -> Dict[str, tuple]:
+        """按 ID 从向量库取回块内容和元数据"""
+        data = self.vectorstore.get(ids=ids, include=["documents", "metadatas"])
+        return {cid: (doc, meta) for cid, doc, meta in zip(data["ids"], data["documents"], data["metadatas"])}
+
+    def search_by_vector(self, query_vector: List[float], k: int = 3) -> List[Dict]:
+        """
+        按向量检索，返回 [{'id', 'content', 'metadata', 'score'}, ...]
+        
+        注意：ann 模式下 score 为余弦相似度（越大越相似），exact 模式下为 Chroma 距离（越小越相似），
+        hybrid 模式（search）下为 RRF 融合分（越大越相关）
+        """
+        if self.dense_mode == "ann":
+            hits = self.ann_index.search(query_vector, k)
+            if not hits:
+                return []
+            by_id = self._fetch([cid for cid, _ in hits])
+            return [
+                {"id": cid, "content": by_id[cid][0], "metadata": by_id[cid][1], "score": score}
+                for cid, score in hits if cid in by_id
+            ]
+
+        docs = self.vectorstore.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+        return [
+            {"id": doc.metadata.get("chunk_id"), "content": doc.page_content,
+             "metadata": doc.metadata, "score": score}
+            for doc, score in docs
+        ]
+
+    def search(self, query: str, k: int = 3) -> List[Dict]:
+        """按文本检索相似案例"""
+        if self.mode != "hybrid":
+            return self.search_by_vector(self.embeddings.embed_query(query), k)
+
+        from rag.bm25 import reciprocal_rank_fusion
+
+        n = k * self.candidate_multiplier
+        dense = self.search_by_vector(self.embeddings.embed_query(query), n)
+        sparse = self.bm25_index.search(query, n)
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in dense], [cid for cid, _ in sparse]],
+            k=self.rrf_k
+        )[:k]
+        if not fused:
+            return []
+
+        by_id = self._fetch([cid for cid, _ in fused])
+        return [
+            {"id": cid, "content": by_id[cid][0], "metadata": by_id[cid][1], "score": score}
+            for cid, score in fused if cid in by_id
+        ]
+
+
+def format_cases(cases: List[Dict]) -> str:
+    """将检索到的案例格式化为 prompt 上下文"""
+    return "\n\n".join(f"【参考案例 {i}】\n{case['content']}" for i, case in enumerate(cases, 1))
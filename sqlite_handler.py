@@ -10,6 +10,8 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
+from utils.blob_store import BlobStore, build_manifest
+
 
 class SQLiteHandler:
     """SQLite 数据库处理类"""
@@ -26,6 +28,7 @@ class SQLiteHandler:
         self.conn.row_factory = sqlite3.Row  # 返回字典形式
         self.cursor = self.conn.cursor()
         self._create_tables()
+        self.blobs = BlobStore(self.conn)  # 内容寻址快照存储
     
     def _create_tables(self):
         """创建数据库表"""
@@ -53,9 +56,12 @@ class SQLiteHandler:
                 git_branch TEXT,
                 git_is_dirty TEXT,
                 
-                -- 代码快照（可选，仅在没有 Git 时使用）
+                -- 旧版代码快照（已停止写入，仅保留用于读取历史实验；新快照见 snapshot_manifest）
                 code_snapshots TEXT,
                 
+                -- 快照清单 {相对路径: blob hash}（JSON），内容存于 blobs 表
+                snapshot_manifest TEXT,
+                
                 -- 输出结果（JSON）
                 step1_generation TEXT,
                 step2_scores TEXT,
@@ -66,6 +72,11 @@ class SQLiteHandler:
             )
         ''')
         
+        # 旧数据库迁移：补充新增列
+        columns = {row['name'] for row in self.cursor.execute('PRAGMA table_info(experiments)')}
+        if 'snapshot_manifest' not in columns:
+            self.cursor.execute('ALTER TABLE experiments ADD COLUMN snapshot_manifest TEXT')
+        
         # 创建索引
         self.cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_version ON experiments(version)
@@ -85,7 +96,6 @@ class SQLiteHandler:
         config: Dict[str, Any],
         input_questions: List[str],
         prompts: Dict[str, str] = None,
-        code_snapshots: Dict[str, str] = None,
         git_info: Dict[str, str] = None
     ) -> str:
         """
@@ -96,7 +106,6 @@ class SQLiteHandler:
             config: 实验配置
             input_questions: 输入问题列表
             prompts: Prompt 字典
-            code_snapshots: 代码快照字典（可选，推荐使用 Git）
             git_info: Git 版本信息 {'commit': 'xxx', 'branch': 'main', 'is_dirty': 'false'}
             
         Returns:
@@ -109,17 +118,12 @@ class SQLiteHandler:
         git_branch = git_info.get('branch') if git_info else None
         git_is_dirty = git_info.get('is_dirty') if git_info else None
         
-        # 代码快照（备用）
-        code_snapshots_json = None
-        if code_snapshots:
-            code_snapshots_json = json.dumps(code_snapshots, ensure_ascii=False)
-        
         self.cursor.execute('''
             INSERT OR REPLACE INTO experiments (
                 version, status, created_at, updated_at,
                 config, input_questions, num_questions,
-                prompts, git_commit, git_branch, git_is_dirty, code_snapshots
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                prompts, git_commit, git_branch, git_is_dirty
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             version,
             'running',
@@ -131,8 +135,7 @@ class SQLiteHandler:
             json.dumps(prompts, ensure_ascii=False) if prompts else None,
             git_commit,
             git_branch,
-            git_is_dirty,
-            code_snapshots_json
+            git_is_dirty
         ))
         
         self.conn.commit()
@@ -192,6 +195,64 @@ class SQLiteHandler:
         self.cursor.execute(sql, params)
         self.conn.commit()
     
+    def update_experiment_metadata(
+        self,
+        version: str,
+        git_info: Dict[str, str] = None
+    ):
+        """
+        补充实验元数据（Git 信息在后台收集完成后写入；代码快照见 save_snapshot）
+        
+        Args:
+            version: 实验版本号
+            git_info: Git 版本信息
+        """
+        self.cursor.execute('''
+            UPDATE experiments SET
+                updated_at = ?,
+                git_commit = COALESCE(?, git_commit),
+                git_branch = COALESCE(?, git_branch),
+                git_is_dirty = COALESCE(?, git_is_dirty)
+            WHERE version = ?
+        ''', (
+            datetime.now().isoformat(),
+            git_info.get('commit') if git_info else None,
+            git_info.get('branch') if git_info else None,
+            git_info.get('is_dirty') if git_info else None,
+            version
+        ))
+        self.conn.commit()
+    
+    def save_snapshot(self, version: str, prepared: Dict, compression: str = "zlib") -> Dict:
+        """
+        保存内容寻址快照：新内容写入 blobs 表，实验只记录清单
+        
+        Args:
+            version: 实验版本号
+            prepared: utils.blob_store.prepare_files 的结果
+            compression: 新 blob 的压缩方式
+            
+        Returns:
+            统计 {files, new_blobs, new_bytes, reused, manifest_hash}
+        """
+        manifest, stats = self.blobs.put_prepared(prepared, compression)
+        self.cursor.execute(
+            'UPDATE experiments SET snapshot_manifest = ?, updated_at = ? WHERE version = ?',
+            (json.dumps(manifest, ensure_ascii=False, sort_keys=True), datetime.now().isoformat(), version)
+        )
+        self.conn.commit()
+        stats['manifest'] = manifest
+        stats['manifest_hash'] = build_manifest(prepared)[1]
+        return stats
+    
+    def get_snapshot_manifest(self, version: str) -> Optional[Dict[str, str]]:
+        """获取实验的快照清单"""
+        self.cursor.execute('SELECT snapshot_manifest FROM experiments WHERE version = ?', (version,))
+        row = self.cursor.fetchone()
+        if row and row['snapshot_manifest']:
+            return json.loads(row['snapshot_manifest'])
+        return None
+    
     def get_experiment(self, version: str) -> Optional[Dict]:
         """获取实验数据"""
         self.cursor.execute('SELECT * FROM experiments WHERE version = ?', (version,))
@@ -250,7 +311,7 @@ class SQLiteHandler:
         data = dict(row)
         
         # 解析 JSON 字段
-        json_fields = ['config', 'input_questions', 'prompts', 'code_snapshots',
+        json_fields = ['config', 'input_questions', 'prompts', 'code_snapshots', 'snapshot_manifest',
                       'step1_generation', 'step2_scores', 'step3_final', 'statistics']
         
         for field in json_fields:
@@ -281,90 +342,6 @@ def load_prompts_from_file(prompts_file: str = "prompts.json") -> Dict[str, str]
     return {}
 
 
-def load_code_snapshots(
-    additional_patterns: List[str] = None,
-    exclude_patterns: List[str] = None
-) -> Dict[str, Any]:
-    """加载代码快照 - 分层结构
-    
-    Args:
-        additional_patterns: 额外要包含的 glob 模式，如 ['rag/**/*.py', 'utils/**/*.py']
-        exclude_patterns: 要排除的 glob 模式，如 ['**/__init__.py', '**/test_*.py']
-    
-    Returns:
-        {
-            'step1': '核心步骤1代码',
-            'step2': '核心步骤2代码',
-            'step3': '核心步骤3代码',
-            'additional': {
-                'rag/indexing.py': '辅助代码内容',
-                'utils/io_handler.py': '辅助代码内容',
-                ...
-            }
-        }
-    """
-    # 1. 核心步骤代码（单独存储）
-    core_files = {
-        'step1': 'pipeline/generation_async.py',
-        'step2': 'pipeline/scoring_async.py',
-        'step3': 'pipeline/selection.py'
-    }
-    
-    snapshots = {}
-    for key, filepath in core_files.items():
-        if Path(filepath).exists():
-            with open(filepath, 'r', encoding='utf-8') as f:
-                snapshots[key] = f.read()
-        else:
-            snapshots[key] = f"# 文件不存在: {filepath}"
-    
-    # 2. 其他辅助代码（打包到 additional）
-    additional_code = {}
-    
-    # 默认要包含的目录
-    default_patterns = [
-        'rag/**/*.py',
-        'utils/**/*.py',
-        'core/**/*.py'
-    ]
-    
-    # 默认排除的文件
-    default_exclude = [
-        '**/__init__.py',
-        '**/__pycache__/**',
-        '**/test_*.py',
-        '**/venv/**',
-        '**/.venv/**'
-    ]
-    
-    patterns = additional_patterns or default_patterns
-    exclude = exclude_patterns or default_exclude
-    
-    # 收集所有匹配的文件
-    all_files = set()
-    for pattern in patterns:
-        all_files.update(Path('.').glob(pattern))
-    
-    # 过滤排除的文件
-    for pattern in exclude:
-        exclude_files = set(Path('.').glob(pattern))
-        all_files -= exclude_files
-    
-    # 读取文件内容
-    for filepath in sorted(all_files):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                # 使用相对路径作为 key
-                relative_path = str(filepath)
-                additional_code[relative_path] = f.read()
-        except Exception as e:
-            additional_code[str(filepath)] = f"# 读取失败: {e}"
-    
-    snapshots['additional'] = additional_code
-    
-    return snapshots
-
-
 # 使用示例
 if __name__ == "__main__":
     # 初始化数据库
@@ -376,8 +353,7 @@ if __name__ == "__main__":
         version='test_v1',
         config={'limit': 5, 'candidates': 2},
         input_questions=['问题1', '问题2'],
-        prompts={'test': 'prompt'},
-        code_snapshots={'step1': 'code'}
+        prompts={'test': 'prompt'}
     )
     print("✅ 保存成功")
     
@@ -0,0 +1,10 @@
+"""测试公共配置：项目根目录加入 sys.path，使用离线 Mock 后端"""
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# 必须在导入 config_async 之前设置，测试不访问真实 API
+os.environ.setdefault('LLM_BACKEND', 'mock')
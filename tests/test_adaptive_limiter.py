@@ -0,0 +1,80 @@
+"""AIMD 自适应并发控制器（utils/api_client.py）"""
+import time
+import asyncio
+
+from utils.api_client import AdaptiveLimiter, _Attempt
+
+
+def _attempt(latency=None):
+    attempt = _Attempt()
+    attempt.sent_at = time.perf_counter()
+    attempt.latency = latency
+    return attempt
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_acquire_blocks_at_limit():
+    async def scenario():
+        limiter = AdaptiveLimiter("m", initial=2, min_limit=1, max_limit=4)
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not third.done()
+        await limiter.release(None, _attempt())
+        await asyncio.wait_for(third, 1)
+        return limiter
+    limiter = _run(scenario())
+    assert limiter.stats["max_in_flight"] == 2 and limiter.limit == 2
+
+
+def test_additive_increase_only_when_saturated():
+    async def scenario():
+        limiter = AdaptiveLimiter("m", initial=2, min_limit=1, max_limit=4)
+        # 未跑满：上限不变
+        await limiter.acquire()
+        await limiter.release('ok', _attempt(0.1))
+        assert limiter.limit == 2
+        # 跑满时每个成功请求 +1/limit，直到 max_limit
+        for _ in range(20):
+            n = int(limiter.limit)
+            for _ in range(n):
+                await limiter.acquire()
+            await limiter.release('ok', _attempt(0.1))
+            for _ in range(n - 1):
+                await limiter.release(None, _attempt())
+        return limiter
+    limiter = _run(scenario())
+    assert limiter.limit == 4 and limiter.stats["increases"] == 2
+
+
+def test_overload_decreases_once_per_congestion_wave():
+    async def scenario():
+        limiter = AdaptiveLimiter("m", initial=8, min_limit=1, max_limit=16, decrease=0.5)
+        attempts = [_attempt() for _ in range(3)]
+        for _ in attempts:
+            await limiter.acquire()
+        for attempt in attempts:
+            await limiter.release('overload', attempt)
+        # 下降之后发出的请求再次过载才会继续下降
+        await limiter.acquire()
+        await limiter.release('overload', _attempt())
+        return limiter
+    limiter = _run(scenario())
+    assert limiter.limit == 2 and limiter.stats["decreases"] == 2 and limiter.stats["overloads"] == 4
+
+
+def test_latency_spike_decreases_and_respects_min_limit():
+    async def scenario():
+        limiter = AdaptiveLimiter("m", initial=2, min_limit=2, max_limit=8, latency_factor=3.0)
+        await limiter.acquire()
+        await limiter.release('ok', _attempt(0.1))
+        await limiter.acquire()
+        await limiter.release('ok', _attempt(1.0))
+        return limiter
+    limiter = _run(scenario())
+    assert limiter.stats["latency_spikes"] == 1
+    assert limiter.limit == 2
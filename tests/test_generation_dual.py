@@ -0,0 +1,57 @@
+"""双模型生成的提前结束判断与分叉规划（pipeline/generation_dual_async.py）"""
+import math
+
+import pytest
+
+from pipeline.generation_dual_async import detect_termination, plan_branching, strip_end_marker, END_MARKER
+
+
+def _turn(content, speaker="user"):
+    return {"speaker": speaker, "content": content}
+
+
+@pytest.mark.parametrize("content", [
+    "谢谢你，今天就先到这吧，再见。",
+    "好的，我会试试看的。拜拜！",
+    "嗯，我明白了，今天先聊到这里。",
+])
+def test_heuristic_detects_farewell_in_last_sentence(content):
+    assert detect_termination(_turn(content), "heuristic")
+
+
+@pytest.mark.parametrize("content", [
+    "我感觉好一点了，但是还是会担心明天的考试。",
+    "谢谢你，我会试着和妈妈谈谈。",
+    "上次我和他说了再见，可是后来又忍不住联系他了。",
+    "那我们今天就先到这里好吗？",
+    "",
+])
+def test_heuristic_ignores_non_farewells(content):
+    assert not detect_termination(_turn(content), "heuristic")
+
+
+def test_flag_mode_only_uses_marker():
+    text, flagged = strip_end_marker(f"谢谢你的陪伴。{END_MARKER}")
+    assert text == "谢谢你的陪伴。" and flagged
+    assert detect_termination(_turn(text), "flag", flagged=True)
+    assert not detect_termination(_turn("好的，再见。"), "flag")
+    assert detect_termination(_turn("好的，再见。"), "both")
+    assert not detect_termination(_turn("好的，再见。"), "off", flagged=True)
+
+
+@pytest.mark.parametrize("num_candidates,num_rounds,expected", [
+    (1, 3, [1, 1, 1]),
+    (4, 3, [1, 2, 2]),
+    (3, 2, [2, 2]),
+    (8, 2, [2, 4]),
+])
+def test_plan_branching_branches_late(num_candidates, num_rounds, expected):
+    factors = plan_branching(num_candidates, num_rounds)
+    assert factors == expected
+    assert math.prod(factors) >= num_candidates
+
+
+def test_plan_branching_schedule():
+    assert plan_branching(4, 3, [2, 2]) == [2, 2, 1]
+    with pytest.raises(ValueError):
+        plan_branching(8, 3, [2, 2])
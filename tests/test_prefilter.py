@@ -0,0 +1,80 @@
+"""本地预筛（pipeline/prefilter.py）"""
+from pipeline.prefilter import check_dialogue, prefilter_candidates
+
+
+def _dialogue(*replies, user="我最近总是睡不着，心里很烦。"):
+    turns = []
+    for reply in replies:
+        turns.append({"role": "User", "content": user})
+        turns.append({"role": "Assistant", "content": reply})
+    return {"dialogue": turns}
+
+
+def _candidate(qid, output, idx=0):
+    return {"question_id": qid, "question": f"问题{qid}", "candidate_id": idx, "output": output}
+
+
+GOOD_REPLY = "听起来这段时间你真的很辛苦，能和我说说最近发生了什么吗？"
+
+
+def test_clean_dialogue_passes():
+    assert check_dialogue(_dialogue(GOOD_REPLY), expected_turns=1) == ([], [])
+
+
+def test_structural_problems_are_hard():
+    assert check_dialogue({"dialogue": []}) == (["empty_dialogue"], [])
+    hard, _ = check_dialogue({"dialogue": [{"role": "Assistant", "content": GOOD_REPLY},
+                                           {"role": "User", "content": "嗯"}]})
+    assert "role_confusion" in hard
+    hard, _ = check_dialogue(_dialogue(""))
+    assert "empty_content" in hard
+
+
+def test_diagnosis_and_medication_are_hard():
+    assert "diagnosis" in check_dialogue(_dialogue("从你的描述来看，你可能患有抑郁症，需要重视。"))[0]
+    assert "diagnosis" in check_dialogue(_dialogue("你应该服用一些抗抑郁药物来帮助睡眠。"))[0]
+
+
+def test_referral_and_disease_mentions_are_not_rejected():
+    """转介说明、复述来访者担心的病名只扣分，不淘汰"""
+    hard, soft = check_dialogue(_dialogue("我不是医生，无法给你做诊断，但可以陪你一起理一理这些感受。"))
+    assert hard == []
+    hard, soft = check_dialogue(_dialogue("你担心自己是不是抑郁症，这种担心本身就让人很不安。"))
+    assert hard == [] and soft == ["disease_term"]
+
+
+def test_latin_terms_are_soft_and_english_replies_hard():
+    assert check_dialogue(_dialogue("CBT 里有个方法叫 thought record，我们可以一起试试记录想法。")) == ([], [])
+    hard, soft = check_dialogue(_dialogue("可以试试 cognitive behavioral therapy 里的 thought record 练习。"))
+    assert hard == [] and soft == ["latin_terms"]
+    hard, _ = check_dialogue(_dialogue("I hear you. It sounds like you have been under a lot of stress lately."))
+    assert "non_chinese" in hard
+
+
+def test_soft_checks():
+    _, soft = check_dialogue(_dialogue("放心，你一定会好起来的，别想太多了。"), expected_turns=2)
+    assert "promise" in soft and "turn_count" in soft
+    assert "short_reply" in check_dialogue(_dialogue("嗯嗯。"))[1]
+
+
+def test_prefilter_off_keeps_everything():
+    candidates = [_candidate(1, {"dialogue": []})]
+    passed, rejected, stats = prefilter_candidates(candidates, mode="off")
+    assert passed == candidates and rejected == [] and stats["rejected"] == 0
+
+
+def test_prefilter_reject_and_rank_truncation():
+    candidates = [
+        _candidate(1, _dialogue(GOOD_REPLY), 0),
+        _candidate(1, _dialogue("放心，你一定会好起来的，别担心。"), 1),
+        _candidate(1, {"dialogue": []}, 2),
+        _candidate(2, _dialogue(GOOD_REPLY), 0),
+    ]
+    passed, rejected, stats = prefilter_candidates(candidates, mode="reject")
+    assert stats["passed"] == 3 and stats["rejected"] == 1
+    assert rejected[0]["prefilter"]["hard"] == ["empty_dialogue"]
+
+    passed, rejected, stats = prefilter_candidates(candidates, mode="rank", max_per_question=1)
+    assert [(c["question_id"], c["candidate_id"]) for c in passed] == [(1, 0), (2, 0)]
+    assert stats["truncated"] == 1
+    assert any(c["prefilter"]["hard"] == ["truncated"] for c in rejected)
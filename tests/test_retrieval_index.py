@@ -0,0 +1,72 @@
+"""本地检索索引：BM25 倒排索引与 IVF 近似最近邻（仅依赖 numpy）"""
+import json
+
+import numpy as np
+
+from rag.bm25 import BM25Index, tokenize, reciprocal_rank_fusion
+from rag.ann_index import IVFIndex, exact_search, benchmark_recall, rebuild_params
+
+
+DOCS = {
+    "sleep": "失眠的时候可以尝试固定作息，睡前避免使用手机。",
+    "exam": "考试焦虑常见于备考阶段，可以把复习计划拆成小目标。",
+    "family": "和父母沟通时，先表达自己的感受，再说明具体的需求。",
+    "work": "工作压力大时，适当休息和运动有助于缓解紧张情绪。",
+}
+
+
+def test_tokenize_char_bigrams_and_words():
+    assert tokenize("失眠怎么办") == ["失眠", "眠怎", "怎么", "么办"]
+    assert tokenize("CBT 方法") == ["cbt", "方法"]
+    assert tokenize("我") == ["我"]
+
+
+def test_bm25_ranks_keyword_match_first(tmp_path):
+    index = BM25Index.build(list(DOCS), list(DOCS.values()))
+    assert index.search("晚上失眠睡不着")[0][0] == "sleep"
+    assert index.search("考试前很焦虑")[0][0] == "exam"
+    assert index.search("完全无关的xyz") == []
+
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert loaded.search("和父母沟通", k=1)[0][0] == "family"
+
+
+def test_reciprocal_rank_fusion_prefers_consensus():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"]])
+    assert {doc for doc, _ in fused[:2]} == {"a", "b"}
+    assert {doc for doc, _ in fused} == {"a", "b", "c", "d"}
+
+
+def _clustered_vectors(n=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_ivf_recall_against_exact_search():
+    vectors = _clustered_vectors()
+    ids = [f"c{i}" for i in range(len(vectors))]
+    index = IVFIndex.build(vectors, ids, nlist=20, nprobe=4)
+    queries = _clustered_vectors(n=50, seed=1)
+
+    recall = {r["nprobe"]: r["recall"] for r in benchmark_recall(index, queries, k=10, nprobes=[4, index.nlist])}
+    assert recall[4] >= 0.9
+    # 探查全部桶时等价于精确检索
+    assert recall[index.nlist] == 1.0
+
+    q = queries[0]
+    exact_idx, _ = exact_search(np.asarray(index.vectors), q, k=5)
+    assert [doc for doc, _ in index.search(q, k=5, nprobe=index.nlist)] == [index.ids[i] for i in exact_idx]
+
+
+def test_ivf_save_load_keeps_build_params(tmp_path):
+    vectors = _clustered_vectors(n=300, dim=8)
+    index = IVFIndex.build(vectors, [str(i) for i in range(300)], nlist=6, nprobe=3)
+    directory = tmp_path / "ann"
+    index.save(str(directory))
+    loaded = IVFIndex.load(str(directory))
+    assert loaded.nlist == 6 and len(loaded) == 300
+    assert loaded.search(vectors[0], k=1)[0][0] == "0"
+    with open(directory / "meta.json", encoding="utf-8") as f:
+        assert rebuild_params(json.load(f)) == {"nlist": 6, "n_iter": 20, "seed": 42, "nprobe": 3}
@@ -0,0 +1,61 @@
+"""评分辅助函数：逐次减半、列表式请求规划、多评委聚合"""
+import pytest
+
+from pipeline.scoring_halving_async import select_uncertain
+from pipeline.scoring_listwise_async import plan_requests
+from pipeline.scoring_ensemble import aggregate_judges
+
+
+def _score(total):
+    """四个维度均分的一轮分数"""
+    return {k: total / 4 for k in ['Empathy', 'Supportiveness', 'Guidance', 'Safety']}
+
+
+def test_select_uncertain_picks_candidates_near_boundary():
+    rounds = [[_score(36)], [_score(30.5)], [_score(30)], [_score(20)]]
+    # Top-2 分界线在 30.5 与 30 之间，远离分界线的候选不再追加
+    assert sorted(select_uncertain(rounds, k=2, budget=4)) == [1, 2]
+    assert len(select_uncertain(rounds, k=2, budget=1)) == 1
+
+
+def test_select_uncertain_stops_when_separated():
+    rounds = [[_score(36), _score(36.2)], [_score(20), _score(20.1)], [_score(10), _score(10.1)]]
+    assert select_uncertain(rounds, k=1, budget=3) == []
+    # 候选数不超过 K 时无需排序；没有分数的候选不参与
+    assert select_uncertain([[_score(30)], [], [_score(20)]], k=2, budget=3) == []
+
+
+def _candidates(per_question):
+    return [{"question_id": q, "question": f"问题{q}", "candidate_id": i}
+            for q, n in per_question.items() for i in range(n)]
+
+
+def test_plan_requests_covers_every_candidate_each_round():
+    candidates = _candidates({1: 5, 2: 3})
+    requests = plan_requests(candidates, score_rounds=2, chunk_size=2, seed=7)
+    for qid, n in ((1, 5), (2, 3)):
+        for round_idx in range(2):
+            chunks = [r for r in requests if r["question_id"] == qid and r["round"] == round_idx]
+            assert all(len(r["items"]) <= 2 for r in chunks)
+            indices = [idx for r in chunks for _, idx in r["items"]]
+            assert sorted(indices) == [i for i, c in enumerate(candidates) if c["question_id"] == qid]
+
+
+def test_plan_requests_is_deterministic_and_shuffles_rounds():
+    candidates = _candidates({1: 8})
+    first = plan_requests(candidates, score_rounds=3, seed=1)
+    assert first == plan_requests(candidates, score_rounds=3, seed=1)
+    orders = {tuple(idx for _, idx in r["items"]) for r in first}
+    assert len(orders) > 1
+
+
+def test_aggregate_judges_weights_successful_judges_only():
+    judge_scores = {"a": _score(32), "b": _score(24)}
+    agg = aggregate_judges(judge_scores, {"a": 3, "b": 1, "missing": 10})
+    assert agg["Total"] == pytest.approx(30)
+    assert agg["Empathy"] == pytest.approx(7.5)
+
+
+def test_aggregate_judges_zero_weights_fall_back_to_mean():
+    agg = aggregate_judges({"a": _score(32), "b": _score(24)}, {"a": 0, "b": 0})
+    assert agg["Total"] == pytest.approx(28)
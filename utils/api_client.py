@@ -0,0 +1,465 @@
+"""
+共享 LLM 调用入口
+所有流水线的 chat.completions 请求都经过 chat_completion，受同一个全局限流器约束
+（最大并发 + 每分钟请求数），多个实验/变体并发运行时共享同一额度。
+另可为单个模型配置独立限流（如多评委集成时各评委按各自的额度并发）。
+
+尾延迟控制：每次请求有独立超时（超时即取消，由调用方的重试逻辑处理）；
+可选对冲请求——请求耗时超过该模型近期 p95 延迟时再发一个副本，取先返回的有效响应并取消另一个，
+对冲比例受 HEDGE_MAX_RATE 限制。
+
+自适应并发（可选）：每个模型前置一个 AIMD 并发控制器，健康时并发上限加性增长，
+遇到 429/5xx/超时或延迟突增时乘性下降，自动逼近可持续的最大吞吐。
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from config_async import (
+    get_client, REQUEST_TIMEOUT, HEDGE_REQUESTS, HEDGE_QUANTILE, HEDGE_MAX_RATE,
+    HEDGE_MIN_SAMPLES, HEDGE_POLL_INTERVAL, LATENCY_WINDOW, ADAPTIVE_INITIAL_LIMIT, ADAPTIVE_MIN_LIMIT,
+    ADAPTIVE_MAX_LIMIT, ADAPTIVE_DECREASE, ADAPTIVE_LATENCY_FACTOR
+)
+from utils.log_writer import log_event
+
+logger = logging.getLogger('experiment')
+
+
+class RateLimiter:
+    """
+    全局限流器
+
+    - max_concurrency: 同时在途的请求数上限（None/0 表示不限）
+    - requests_per_minute: 请求发起速率上限（None/0 表示不限），请求均匀间隔发出
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None):
+        self.max_concurrency = max_concurrency or None
+        self.requests_per_minute = requests_per_minute or None
+        self._semaphore = None
+        self._next_slot = 0.0
+        self._in_flight = 0
+        self.stats = {"requests": 0, "wait_seconds": 0.0, "max_in_flight": 0}
+
+    def _get_semaphore(self):
+        # 信号量延迟到事件循环内创建
+        if self.max_concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        semaphore = self._get_semaphore()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            if self.requests_per_minute:
+                loop = asyncio.get_running_loop()
+                now = loop.time()
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + 60.0 / self.requests_per_minute
+                if slot > now:
+                    await asyncio.sleep(slot - now)
+        except BaseException:
+            # 等待发送时段期间被取消（如对冲落败）：归还并发额度，否则并发上限被永久占掉
+            if semaphore is not None:
+                semaphore.release()
+            raise
+        self._in_flight += 1
+        self.stats["requests"] += 1
+        self.stats["wait_seconds"] += time.perf_counter() - start
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+class LatencyTracker:
+    """
+    按模型记录最近的请求延迟（只含请求本身，不含限流排队）
+
+    超时和被取消的请求记录其已耗时（真实延迟的下界），否则 p95 只来自完成的请求、估计偏低
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RequestPolicy:
+    """
+    单次请求的超时与对冲策略
+
+    - timeout: 单次请求超时（秒，None/0 表示不限）
+    - hedge: 是否启用对冲请求
+    - hedge_quantile: 对冲触发延迟取该模型近期延迟的分位数
+    - hedge_max_rate: 对冲请求占总请求的比例上限
+    - hedge_min_samples: 模型累计的延迟样本数不足时不对冲
+    """
+
+    def __init__(self, timeout: Optional[float] = REQUEST_TIMEOUT, hedge: bool = HEDGE_REQUESTS,
+                 hedge_quantile: float = HEDGE_QUANTILE, hedge_max_rate: float = HEDGE_MAX_RATE,
+                 hedge_min_samples: int = HEDGE_MIN_SAMPLES):
+        self.timeout = timeout or None
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_max_rate = hedge_max_rate
+        self.hedge_min_samples = hedge_min_samples
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.stats = {"requests": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0, "hedge_capped": 0}
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """该模型的对冲触发延迟（样本不足时返回 None）"""
+        tracker = self.latency.get(model)
+        if tracker is None or len(tracker) < self.hedge_min_samples:
+            return None
+        return tracker.quantile(self.hedge_quantile)
+
+    def allow_hedge(self) -> bool:
+        """对冲比例未超上限时允许再发一个副本"""
+        if self.stats["hedged"] + 1 > self.hedge_max_rate * self.stats["requests"]:
+            self.stats["hedge_capped"] += 1
+            return False
+        return True
+
+    def summary(self) -> Dict:
+        """请求统计 + 各模型延迟分位数"""
+        hedged = self.stats["hedged"]
+        return {
+            **self.stats,
+            "timeout": self.timeout,
+            "hedge": self.hedge,
+            "hedge_rate": hedged / self.stats["requests"] if self.stats["requests"] else 0.0,
+            "hedge_win_rate": self.stats["hedge_wins"] / hedged if hedged else 0.0,
+            "latency": {
+                model: {"n": len(t), "p50": t.quantile(0.5), "p95": t.quantile(0.95), "max": t.quantile(1.0)}
+                for model, t in self.latency.items()
+            }
+        }
+
+
+class _Attempt:
+    """单次请求的状态（对冲计时与自适应并发使用）"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.sent_at = None
+        self.latency = None
+
+
+def _is_overload(e: Exception) -> bool:
+    """429 / 5xx / 超时视为服务过载"""
+    status = getattr(e, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(e, TimeoutError) or 'Timeout' in type(e).__name__
+
+
+class AdaptiveLimiter:
+    """
+    单个模型的 AIMD 并发控制器
+
+    - 成功且延迟正常: limit += 1/limit（并发跑满时，约每一"窗口"的请求 +1）
+    - 429/5xx/超时或延迟超过基线的 latency_factor 倍: limit *= decrease
+      （在上次下降之前发出的请求不会再次触发下降，避免同一波拥塞连续减半）
+    """
+
+    def __init__(self, model: str, initial: int = ADAPTIVE_INITIAL_LIMIT, min_limit: int = ADAPTIVE_MIN_LIMIT,
+                 max_limit: int = ADAPTIVE_MAX_LIMIT, decrease: float = ADAPTIVE_DECREASE,
+                 latency_factor: float = ADAPTIVE_LATENCY_FACTOR):
+        self.model = model
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.baseline = None
+        self._in_flight = 0
+        self._condition = None
+        self._last_decrease = 0.0
+        self.stats = {"requests": 0, "overloads": 0, "latency_spikes": 0, "increases": 0, "decreases": 0,
+                      "min_limit_seen": int(self.limit), "max_limit_seen": int(self.limit), "max_in_flight": 0}
+
+    def _get_condition(self):
+        # 条件变量延迟到事件循环内创建
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        self.stats["requests"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+
+    async def release(self, outcome: Optional[str], attempt: _Attempt):
+        """
+        归还并发额度并调整上限
+
+        Args:
+            outcome: 'ok' / 'overload' / 'error'（其他错误不调整），None 表示请求被取消（不调整）
+        """
+        condition = self._get_condition()
+        async with condition:
+            saturated = self._in_flight >= int(self.limit)
+            self._in_flight -= 1
+            if outcome == 'overload':
+                self.stats["overloads"] += 1
+                self._decrease(attempt, 'overload')
+            elif outcome == 'ok' and attempt.latency is not None:
+                spike = self.baseline is not None and attempt.latency > self.latency_factor * self.baseline
+                # 基线用全部成功请求的滑动平均，持续变慢时基线随之上移
+                self.baseline = attempt.latency if self.baseline is None else 0.95 * self.baseline + 0.05 * attempt.latency
+                if spike:
+                    self.stats["latency_spikes"] += 1
+                    self._decrease(attempt, 'latency')
+                elif saturated and self.limit < self.max_limit:
+                    # 只有并发跑满时才加性增长，否则上限没有被检验过
+                    before = int(self.limit)
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    if int(self.limit) > before:
+                        self.stats["increases"] += 1
+                        self.stats["max_limit_seen"] = max(self.stats["max_limit_seen"], int(self.limit))
+            condition.notify_all()
+
+    def _decrease(self, attempt: _Attempt, reason: str):
+        if attempt.sent_at is not None and attempt.sent_at < self._last_decrease:
+            return
+        self._last_decrease = time.perf_counter()
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.stats["decreases"] += 1
+        self.stats["min_limit_seen"] = min(self.stats["min_limit_seen"], int(self.limit))
+        log_event('adaptive_concurrency', model=self.model, limit=int(self.limit), reason=reason)
+
+    def summary(self) -> Dict:
+        return {"limit": int(self.limit), "baseline_latency": self.baseline, **self.stats}
+
+
+_limiter = RateLimiter()
+_model_limiters: Dict[str, RateLimiter] = {}
+_policy = RequestPolicy()
+_adaptive_config: Optional[Dict] = None
+_adaptive_limiters: Dict[str, AdaptiveLimiter] = {}
+
+
+def configure_rate_limit(max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None) -> RateLimiter:
+    """配置全局限流器（在流水线开始前调用）"""
+    global _limiter
+    _limiter = RateLimiter(max_concurrency, requests_per_minute)
+    if max_concurrency or requests_per_minute:
+        logger.info(f"🚦 全局限流: 并发 {max_concurrency or '不限'} | 每分钟 {requests_per_minute or '不限'} 次请求")
+    return _limiter
+
+
+def configure_model_limits(limits: Dict[str, Dict]) -> Dict[str, RateLimiter]:
+    """
+    配置按模型的独立限流（在全局限流之外叠加）
+    
+    Args:
+        limits: {模型名: {"max_concurrency": N, "rpm": M}}，模型名需为实际请求的模型 ID
+    """
+    _model_limiters.clear()
+    for model, limit in (limits or {}).items():
+        _model_limiters[model] = RateLimiter(limit.get("max_concurrency"), limit.get("rpm"))
+        logger.info(f"🚦 模型限流 [{model}]: 并发 {limit.get('max_concurrency') or '不限'} | "
+                    f"每分钟 {limit.get('rpm') or '不限'} 次请求")
+    return _model_limiters
+
+
+def configure_request_policy(timeout: Optional[float] = REQUEST_TIMEOUT, hedge: bool = HEDGE_REQUESTS,
+                             hedge_max_rate: float = HEDGE_MAX_RATE) -> RequestPolicy:
+    """配置请求超时与对冲策略（在流水线开始前调用）"""
+    global _policy
+    _policy = RequestPolicy(timeout, hedge, hedge_max_rate=hedge_max_rate)
+    logger.info(f"⏱️  请求超时: {f'{timeout:g}s' if timeout else '不限'} | 对冲请求: "
+                + (f"p{HEDGE_QUANTILE * 100:.0f} 触发，比例上限 {hedge_max_rate:.0%}" if hedge else "关闭"))
+    return _policy
+
+
+def get_request_policy() -> RequestPolicy:
+    return _policy
+
+
+def log_request_stats(stats: Dict):
+    """输出请求超时/对冲统计和各模型延迟分位数"""
+    logger.info(f"⏱️  API 请求: {stats['requests']} | 超时: {stats['timeouts']} | "
+                f"对冲: {stats['hedged']} ({stats['hedge_rate']:.1%}, 被比例上限拦截 {stats['hedge_capped']}) | "
+                f"对冲胜出: {stats['hedge_wins']} ({stats['hedge_win_rate']:.0%})")
+    for model, lat in stats['latency'].items():
+        logger.info(f"  {model:<28} n={lat['n']:<5} p50={lat['p50']:.2f}s p95={lat['p95']:.2f}s max={lat['max']:.2f}s")
+
+
+def configure_adaptive_concurrency(enabled: bool, initial: int = ADAPTIVE_INITIAL_LIMIT,
+                                   max_limit: int = ADAPTIVE_MAX_LIMIT) -> None:
+    """配置按模型的自适应并发（各模型的控制器在首次请求时创建）"""
+    global _adaptive_config
+    _adaptive_limiters.clear()
+    _adaptive_config = {"initial": initial, "max_limit": max_limit} if enabled else None
+    if enabled:
+        logger.info(f"📈 自适应并发 (AIMD): 初始 {initial} | 范围 {ADAPTIVE_MIN_LIMIT}-{max_limit} | "
+                    f"过载或延迟超过基线 {ADAPTIVE_LATENCY_FACTOR:g} 倍时 ×{ADAPTIVE_DECREASE:g}")
+
+
+def _get_adaptive_limiter(model: str) -> Optional[AdaptiveLimiter]:
+    if _adaptive_config is None:
+        return None
+    if model not in _adaptive_limiters:
+        _adaptive_limiters[model] = AdaptiveLimiter(model, **_adaptive_config)
+    return _adaptive_limiters[model]
+
+
+def get_adaptive_stats() -> Dict[str, Dict]:
+    """各模型自适应并发的当前上限与调整统计（未启用时为空）"""
+    return {model: limiter.summary() for model, limiter in _adaptive_limiters.items()}
+
+
+def log_adaptive_stats(stats: Dict[str, Dict]):
+    """输出各模型的自适应并发上限"""
+    if not stats:
+        return
+    logger.info(f"📈 自适应并发:")
+    logger.info(f"  {'Model':<28} {'Limit':<6} {'Min':<5} {'Max':<5} {'Peak':<5} {'+':<5} {'-':<5} {'Overload':<9} {'Spike':<6}")
+    for model, s in stats.items():
+        logger.info(f"  {model:<28} {s['limit']:<6} {s['min_limit_seen']:<5} {s['max_limit_seen']:<5} "
+                    f"{s['max_in_flight']:<5} {s['increases']:<5} {s['decreases']:<5} {s['overloads']:<9} {s['latency_spikes']:<6}")
+
+
+def get_rate_limiter(model: str = None) -> RateLimiter:
+    """获取全局限流器，或指定模型的独立限流器（未配置时返回 None）"""
+    if model is None:
+        return _limiter
+    return _model_limiters.get(model)
+
+
+def _is_valid(response) -> bool:
+    try:
+        return bool(response.choices[0].message.content)
+    except (AttributeError, IndexError, TypeError):
+        return False
+
+
+async def _send(model: str, messages: List[Dict], attempt: _Attempt, kwargs: Dict):
+    attempt.started.set()
+    start = attempt.sent_at = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            get_client().chat.completions.create(model=model, messages=messages, **kwargs),
+            timeout=_policy.timeout
+        )
+    except asyncio.TimeoutError:
+        _policy.stats["timeouts"] += 1
+        _policy.latency.setdefault(model, LatencyTracker()).add(time.perf_counter() - start)
+        raise TimeoutError(f"请求超时 ({_policy.timeout:g}s, {model})") from None
+    except asyncio.CancelledError:
+        _policy.latency.setdefault(model, LatencyTracker()).add(time.perf_counter() - start)
+        raise
+    attempt.latency = time.perf_counter() - start
+    _policy.latency.setdefault(model, LatencyTracker()).add(attempt.latency)
+    return response
+
+
+async def _limited(model: str, messages: List[Dict], attempt: _Attempt, kwargs: Dict):
+    model_limiter = _model_limiters.get(model)
+    if model_limiter is None:
+        async with _limiter:
+            return await _send(model, messages, attempt, kwargs)
+    # 先占模型额度再占全局额度，避免排队中的慢模型请求占住全局并发
+    async with model_limiter, _limiter:
+        return await _send(model, messages, attempt, kwargs)
+
+
+async def _request(model: str, messages: List[Dict], attempt: _Attempt, kwargs: Dict):
+    """单次请求：占用（自适应并发 →）限流额度后发出（attempt.started 置位），超时即取消"""
+    adaptive = _get_adaptive_limiter(model)
+    if adaptive is None:
+        return await _limited(model, messages, attempt, kwargs)
+
+    await adaptive.acquire()
+    outcome = None
+    try:
+        response = await _limited(model, messages, attempt, kwargs)
+        outcome = 'ok'
+        return response
+    except Exception as e:
+        outcome = 'overload' if _is_overload(e) else 'error'
+        raise
+    finally:
+        # 被取消（如对冲落败）的请求不调整上限
+        await asyncio.shield(adaptive.release(outcome, attempt))
+
+
+async def chat_completion(model: str, messages: List[Dict], **kwargs):
+    """
+    发起一次 chat.completions 请求（受模型限流和全局限流约束）
+
+    超时抛出 TimeoutError；启用对冲时，请求发出后超过该模型 p95 延迟仍未返回则再发一个副本，
+    取先返回的有效响应，另一个被取消。
+    """
+    _policy.stats["requests"] += 1
+    attempt = _Attempt()
+    if not _policy.hedge:
+        return await _request(model, messages, attempt, kwargs)
+
+    loop = asyncio.get_running_loop()
+    primary = asyncio.create_task(_request(model, messages, attempt, kwargs))
+    tasks = [primary]
+    try:
+        # 对冲计时从请求真正发出（拿到限流额度）开始
+        waiter = asyncio.create_task(attempt.started.wait())
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        sent = loop.time()
+        # 延迟分位数随其他请求返回而更新，定期重新检查
+        while True:
+            delay = _policy.hedge_delay(model)
+            remaining = delay - (loop.time() - sent) if delay is not None else HEDGE_POLL_INTERVAL
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait({primary}, timeout=min(remaining, HEDGE_POLL_INTERVAL))
+            if done:
+                return await primary
+        if not _policy.allow_hedge():
+            return await primary
+
+        _policy.stats["hedged"] += 1
+        hedge = asyncio.create_task(_request(model, messages, _Attempt(), kwargs))
+        tasks.append(hedge)
+        pending = set(tasks)
+        fallback, error = None, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif _is_valid(task.result()):
+                    if task is hedge:
+                        _policy.stats["hedge_wins"] += 1
+                    return task.result()
+                else:
+                    fallback = task.result()
+        # 两个都没有有效响应：返回空响应交给调用方解析，否则抛出最后一个异常
+        if fallback is not None:
+            return fallback
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
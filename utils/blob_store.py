@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+内容寻址快照存储
+代码、prompts 和输入文件按内容 SHA-256 存为 blob（可选 zlib 压缩），
+每次实验只保存 {相对路径: hash} 清单，未改动的文件在所有实验间共享同一份。
+
+用法:
+    python utils/blob_store.py stats
+    python utils/blob_store.py restore v1_sqlite restored/
+    python utils/blob_store.py gc
+"""
+import sys
+import json
+import zlib
+import hashlib
+import sqlite3
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+
+COMPRESSIONS = ["zlib", "none"]
+
+# 默认纳入快照的文件
+DEFAULT_SNAPSHOT_PATTERNS = [
+    'pipeline/**/*.py',
+    'rag/**/*.py',
+    'utils/**/*.py',
+    'core/**/*.py',
+    '*.py',
+    'prompts.json',
+    'inputs/*'
+]
+DEFAULT_SNAPSHOT_EXCLUDE = [
+    '**/__pycache__/**',
+    '**/test_*.py'
+]
+
+
+def collect_snapshot_files(root: Path = PROJECT_ROOT, patterns: List[str] = None,
+                           exclude: List[str] = None, extra_files: List[str] = None) -> List[str]:
+    """
+    收集需要快照的文件（相对 root 的路径，已排序）
+
+    Args:
+        root: 项目根目录
+        patterns: 包含的 glob 模式
+        exclude: 排除的 glob 模式
+        extra_files: 额外文件（如不在 inputs/ 下的输入文件）
+    """
+    root = Path(root)
+    files = set()
+    for pattern in patterns or DEFAULT_SNAPSHOT_PATTERNS:
+        files.update(p for p in root.glob(pattern) if p.is_file())
+    for pattern in exclude or DEFAULT_SNAPSHOT_EXCLUDE:
+        files -= set(root.glob(pattern))
+    result = {str(p.relative_to(root)) for p in files}
+    for f in extra_files or []:
+        path = Path(f).absolute()
+        if path.is_file():
+            result.add(str(path.relative_to(root)) if path.is_relative_to(root) else str(path))
+    return sorted(result)
+
+
+def encode_blob(data: bytes, compression: str = "zlib") -> Tuple[str, bytes]:
+    """返回 (内容 hash, 存储字节)；hash 始终基于原始内容"""
+    digest = hashlib.sha256(data).hexdigest()
+    if compression == "zlib":
+        return digest, zlib.compress(data, 6)
+    return digest, data
+
+
+def decode_blob(stored: bytes, compression: str = "zlib") -> bytes:
+    """encode_blob 的逆操作"""
+    return zlib.decompress(stored) if compression == "zlib" else bytes(stored)
+
+
+def prepare_files(paths: List[str], root: Path = PROJECT_ROOT, compression: str = "zlib") -> Dict[str, Tuple[str, int, bytes]]:
+    """
+    读取并编码文件（CPU/IO 密集，适合在线程中调用）
+
+    Returns:
+        {相对路径: (hash, 原始大小, 存储字节)}
+    """
+    prepared = {}
+    for rel_path in paths:
+        path = Path(rel_path) if Path(rel_path).is_absolute() else Path(root) / rel_path
+        try:
+            data = path.read_bytes()
+        except OSError:
+            continue
+        digest, stored = encode_blob(data, compression)
+        prepared[rel_path] = (digest, len(data), stored)
+    return prepared
+
+
+def build_manifest(prepared: Dict[str, Tuple[str, int, bytes]]) -> Tuple[Dict[str, str], str]:
+    """由 prepare_files 结果生成清单 {相对路径: hash} 及清单自身的 hash"""
+    manifest = {rel_path: item[0] for rel_path, item in prepared.items()}
+    manifest_json = json.dumps(manifest, ensure_ascii=False, sort_keys=True)
+    return manifest, hashlib.sha256(manifest_json.encode('utf-8')).hexdigest()
+
+
+class BlobStore:
+    """基于 SQLite 的内容寻址 blob 存储（与 experiments 表共用同一数据库）"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                compression TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def put_prepared(self, prepared: Dict[str, Tuple[str, int, bytes]], compression: str = "zlib") -> Tuple[Dict[str, str], Dict]:
+        """
+        写入 prepare_files 的结果，已存在的 blob 直接复用
+
+        Returns:
+            (清单 {相对路径: hash}, 统计 {files, new_blobs, new_bytes, reused})
+        """
+        now = datetime.now().isoformat()
+        manifest = {}
+        new_blobs = 0
+        new_bytes = 0
+        for rel_path, (digest, size, stored) in prepared.items():
+            manifest[rel_path] = digest
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO blobs (hash, size, stored_size, compression, data, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (digest, size, len(stored), compression, stored, now)
+            )
+            if cursor.rowcount > 0:
+                new_blobs += 1
+                new_bytes += len(stored)
+        self.conn.commit()
+        return manifest, {
+            "files": len(manifest),
+            "new_blobs": new_blobs,
+            "new_bytes": new_bytes,
+            "reused": len(manifest) - new_blobs
+        }
+
+    def get(self, digest: str) -> bytes:
+        """读取 blob 原始内容"""
+        row = self.conn.execute('SELECT compression, data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"blob 不存在: {digest}")
+        return decode_blob(row[1], row[0])
+
+    def restore(self, manifest: Dict[str, str], target_dir: str) -> int:
+        """按清单把文件还原到目标目录，返回文件数"""
+        target = Path(target_dir)
+        for rel_path, digest in manifest.items():
+            path = target / rel_path.lstrip('/')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.get(digest))
+        return len(manifest)
+
+    def referenced_hashes(self) -> set:
+        """所有实验清单引用的 hash"""
+        referenced = set()
+        rows = self.conn.execute('SELECT snapshot_manifest FROM experiments WHERE snapshot_manifest IS NOT NULL')
+        for row in rows:
+            try:
+                referenced.update(json.loads(row[0]).values())
+            except (TypeError, ValueError):
+                pass
+        return referenced
+
+    def gc(self, vacuum: bool = False) -> Dict:
+        """删除未被任何实验引用的 blob"""
+        referenced = self.referenced_hashes()
+        orphans = [(h, s) for h, s in self.conn.execute('SELECT hash, stored_size FROM blobs') if h not in referenced]
+        self.conn.executemany('DELETE FROM blobs WHERE hash = ?', [(h,) for h, _ in orphans])
+        self.conn.commit()
+        if vacuum:
+            self.conn.execute('VACUUM')
+        return {"deleted": len(orphans), "freed_bytes": sum(s for _, s in orphans)}
+
+    def stats(self) -> Dict:
+        row = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs').fetchone()
+        return {"blobs": row[0], "size_bytes": row[1], "stored_bytes": row[2]}
+
+
+def main():
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from sqlite_handler import SQLiteHandler
+
+    parser = argparse.ArgumentParser(description='内容寻址快照存储管理')
+    parser.add_argument('command', choices=['stats', 'restore', 'gc'], help='stats=统计, restore=还原快照, gc=清理未引用 blob')
+    parser.add_argument('version', nargs='?', help='实验版本号（restore）')
+    parser.add_argument('target', nargs='?', help='还原目标目录（restore）')
+    parser.add_argument('--db-path', type=str, default='experiments.db', help='SQLite 数据库文件路径')
+    parser.add_argument('--vacuum', action='store_true', help='gc 后执行 VACUUM 回收磁盘空间')
+    args = parser.parse_args()
+
+    with SQLiteHandler(args.db_path) as db:
+        if args.command == 'stats':
+            stats = db.blobs.stats()
+            ratio = stats['stored_bytes'] / stats['size_bytes'] if stats['size_bytes'] else 0
+            print(f"📦 blob: {stats['blobs']} 个 | 原始 {stats['size_bytes'] / 1024:.1f} KB | "
+                  f"存储 {stats['stored_bytes'] / 1024:.1f} KB (压缩比 {ratio:.1%})")
+            print(f"🔗 被引用: {len(db.blobs.referenced_hashes())} 个")
+        elif args.command == 'restore':
+            if not args.version or not args.target:
+                parser.error('restore 需要 version 和 target')
+            manifest = db.get_snapshot_manifest(args.version)
+            if not manifest:
+                print(f"❌ 实验 {args.version} 没有快照清单")
+                sys.exit(1)
+            count = db.blobs.restore(manifest, args.target)
+            print(f"✅ 已还原 {count} 个文件到 {args.target}")
+        else:
+            result = db.blobs.gc(vacuum=args.vacuum)
+            print(f"🗑️  已删除 {result['deleted']} 个未引用 blob，释放 {result['freed_bytes'] / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -98,6 +98,38 @@ def format_generation_output(candidates: List[Dict]) -> List[Dict]:
     return formatted
 
 
+def parse_generation_output(formatted: List[Dict]) -> List[Dict]:
+    """
+    由 format_generation_output 的结果还原候选（用于只有 SQLite 记录、没有原始文件的版本）
+    
+    answer 按 "角色: 内容" 逐行拆回 dialogue；question_id 按问题首次出现顺序从 1 编号。
+    """
+    candidates = []
+    question_ids = {}
+    counters = {}
+    for item in formatted:
+        question = item.get('question', '')
+        qid = question_ids.setdefault(question, len(question_ids) + 1)
+        counters[qid] = counters.get(qid, 0) + 1
+        
+        dialogue = []
+        for line in item.get('answer', '').split('\n'):
+            role, sep, content = line.partition(': ')
+            if sep:
+                dialogue.append({"role": role, "content": content})
+            elif dialogue:
+                # 内容自身含换行，接到上一条
+                dialogue[-1]['content'] += '\n' + line
+        
+        candidates.append({
+            "question_id": qid,
+            "question": question,
+            "candidate_id": counters[qid],
+            "output": {"question": question, "cot": item.get('cot', ''), "dialogue": dialogue}
+        })
+    return candidates
+
+
 def format_scoring_output(scored_candidates: List[Dict]) -> List[Dict]:
     """格式化评分结果"""
     formatted = []
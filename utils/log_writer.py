@@ -0,0 +1,181 @@
+"""
+异步日志
+事件循环线程只把日志记录放入队列，由后台线程批量写入文件/终端并批量 flush
+
+- 人类可读日志（表格行等）→ 日志文件 + 终端
+- 结构化事件（log_event）→ 单独的 JSONL 文件，不进入人类可读日志
+
+未启用异步日志时，log_event 直接丢弃（几乎零开销）。
+"""
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from pathlib import Path
+from typing import List, Tuple, Optional
+
+events_logger = logging.getLogger('experiment.events')
+events_logger.propagate = False
+events_logger.addHandler(logging.NullHandler())
+
+_SENTINEL = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """不在事件循环线程上格式化/复制记录，格式化推迟到写入线程"""
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        self.queue.put_nowait(record)
+
+
+def log_event(event: str, **fields):
+    """记录结构化事件（JSONL），如 log_event('generation', question_id=1, status='ok')"""
+    if events_logger.isEnabledFor(logging.INFO):
+        events_logger.info(event, extra={'event': {'event': event, **fields}})
+
+
+class BatchingLogWriter(threading.Thread):
+    """后台日志写入线程：批量取出队列中的记录，写完一批再统一 flush"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, text_streams: List[Tuple[object, logging.Formatter]],
+                 event_stream=None, flush_interval: float = 0.2, max_batch: int = 2000):
+        """
+        Args:
+            log_queue: 日志记录队列
+            text_streams: [(stream, formatter), ...] 人类可读输出
+            event_stream: 结构化事件 JSONL 输出流
+            flush_interval: 批次最长攒积时间（秒）
+            max_batch: 单批最大记录数
+        """
+        super().__init__(name='log-writer', daemon=True)
+        self.log_queue = log_queue
+        self.text_streams = text_streams
+        self.event_stream = event_stream
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.stats = {"records": 0, "events": 0, "batches": 0}
+
+    def _write(self, record: logging.LogRecord):
+        event = getattr(record, 'event', None)
+        if event is not None:
+            if self.event_stream is not None:
+                self.event_stream.write(json.dumps({"ts": record.created, **event}, ensure_ascii=False) + '\n')
+                self.stats["events"] += 1
+            return
+        for stream, formatter in self.text_streams:
+            try:
+                stream.write(formatter.format(record) + '\n')
+            except Exception:
+                pass
+        self.stats["records"] += 1
+
+    def _flush(self):
+        for stream, _ in self.text_streams:
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        if self.event_stream is not None:
+            self.event_stream.flush()
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.log_queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or batch[-1] is _SENTINEL:
+                    break
+                try:
+                    batch.append(self.log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is _SENTINEL:
+                    stop = True
+                    continue
+                self._write(record)
+            self._flush()
+            self.stats["batches"] += 1
+
+
+_writer: Optional[BatchingLogWriter] = None
+_queue: Optional[queue.SimpleQueue] = None
+_files: List = []
+
+
+def setup_async_logger(log_file: str = None, events_file: str = None, flush_interval: float = 0.2,
+                       console: bool = True) -> logging.Logger:
+    """
+    配置异步日志（替代 logging.basicConfig 的同步 FileHandler + StreamHandler）
+
+    Args:
+        log_file: 人类可读日志文件
+        events_file: 结构化事件 JSONL 文件
+        flush_interval: 批量 flush 间隔（秒）
+        console: 是否同时输出到终端
+    """
+    global _writer, _queue
+    stop_async_logger()
+
+    formatter = logging.Formatter('%(message)s')
+    text_streams = []
+    if log_file:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        f = open(log_file, 'a', encoding='utf-8', buffering=1 << 16)
+        _files.append(f)
+        text_streams.append((f, formatter))
+    if console:
+        text_streams.append((sys.stderr, formatter))
+
+    event_stream = None
+    if events_file:
+        Path(events_file).parent.mkdir(parents=True, exist_ok=True)
+        event_stream = open(events_file, 'a', encoding='utf-8', buffering=1 << 16)
+        _files.append(event_stream)
+
+    _queue = queue.SimpleQueue()
+    _writer = BatchingLogWriter(_queue, text_streams, event_stream, flush_interval=flush_interval)
+    _writer.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(_queue))
+    root.setLevel(logging.INFO)
+
+    events_logger.handlers = [_DeferredQueueHandler(_queue)]
+    events_logger.setLevel(logging.INFO if events_file else logging.CRITICAL + 1)
+
+    atexit.register(stop_async_logger)
+    return logging.getLogger('experiment')
+
+
+def stop_async_logger():
+    """写完队列中剩余日志并停止后台线程"""
+    global _writer, _queue
+    if _writer is None:
+        return
+    _queue.put(_SENTINEL)
+    _writer.join(timeout=10)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            root.removeHandler(handler)
+    events_logger.handlers = [logging.NullHandler()]
+    for f in _files:
+        try:
+            f.close()
+        except Exception:
+            pass
+    _files.clear()
+    _writer = None
+    _queue = None
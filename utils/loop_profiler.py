@@ -0,0 +1,246 @@
+"""
+事件循环性能剖析
+用于判断瓶颈在事件循环（CPU）还是在 API 等待
+
+- LoopLagSampler: 周期性 sleep，测量事件循环延迟分布
+- LoopProfiler: 统计每个回调的 CPU 时间并按阶段（generation / scoring / selection）归类，
+  记录慢回调及其调用栈（由看门狗线程在回调运行期间抓取真实栈）
+
+阶段通过 contextvars 传递：在调用 step 函数前 set_stage('generation')，
+其中创建的所有任务都会继承该阶段。
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import contextvars
+from typing import List, Dict, Optional
+
+logger = logging.getLogger('experiment')
+
+current_stage: contextvars.ContextVar = contextvars.ContextVar('current_stage', default='main')
+
+
+def set_stage(name: str):
+    """设置当前阶段，之后创建的任务/回调都归属该阶段"""
+    return current_stage.set(name)
+
+
+class LoopLagSampler:
+    """周期性 sleep 并测量超时量，得到事件循环延迟分布"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        # 采样任务本身不归属任何业务阶段
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(), context=contextvars.Context()
+        )
+
+    def summary(self) -> Dict:
+        if not self.samples:
+            return {"loop_lag_p50_ms": 0.0, "loop_lag_p99_ms": 0.0, "loop_lag_max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "loop_lag_p50_ms": ordered[len(ordered) // 2] * 1000,
+            "loop_lag_p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            "loop_lag_max_ms": ordered[-1] * 1000,
+        }
+
+    async def stop(self) -> Dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.summary()
+
+
+def _describe_callback(handle) -> str:
+    """回调的可读描述：任务则给出协程名"""
+    callback = getattr(handle, '_callback', None)
+    task = getattr(callback, '__self__', None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return f"Task {task.get_name()} {getattr(coro, '__qualname__', coro)}"
+    return repr(callback)
+
+
+class LoopProfiler:
+    """
+    事件循环剖析器
+
+    安装后替换 asyncio Handle._run，统计每个回调的耗时；仅在剖析模式下使用。
+    """
+
+    _installed: Optional["LoopProfiler"] = None
+
+    def __init__(self, slow_callback_ms: float = 100.0, lag_interval: float = 0.01, max_slow_records: int = 50):
+        """
+        Args:
+            slow_callback_ms: 慢回调阈值（毫秒）
+            lag_interval: 事件循环延迟采样间隔（秒）
+            max_slow_records: 最多保留的慢回调记录数
+        """
+        self.slow_callback = slow_callback_ms / 1000
+        self.max_slow_records = max_slow_records
+        self.lag_sampler = LoopLagSampler(lag_interval)
+        self.stage_cpu: Dict[str, float] = {}
+        self.stage_wall: Dict[str, float] = {}
+        self.stage_callbacks: Dict[str, int] = {}
+        self.slow_callbacks: List[Dict] = []
+        self.slow_count = 0
+        self._original_run = None
+        self._loop_thread_id = None
+        self._running = None  # (handle, start, stage)
+        self._captured_stack = None
+        self._watchdog = None
+        self._stop_event = threading.Event()
+        self._process_cpu_start = 0.0
+        self._wall_start = 0.0
+
+    # ------------------------------------------------------------
+    # 安装 / 卸载
+    # ------------------------------------------------------------
+
+    def start(self):
+        """在事件循环内调用，开始剖析"""
+        if LoopProfiler._installed is not None:
+            raise RuntimeError("LoopProfiler 已安装")
+        LoopProfiler._installed = self
+        self._loop_thread_id = threading.get_ident()
+        self._process_cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+
+        profiler = self
+        original_run = asyncio.events.Handle._run
+        self._original_run = original_run
+
+        def _profiled_run(handle):
+            stage = handle._context.get(current_stage, 'main')
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            profiler._running = (handle, start, stage)
+            try:
+                original_run(handle)
+            finally:
+                profiler._running = None
+                elapsed = time.perf_counter() - start
+                profiler._record(handle, stage, elapsed, time.thread_time() - cpu_start)
+
+        asyncio.events.Handle._run = _profiled_run
+
+        self._stop_event.clear()
+        self._watchdog = threading.Thread(target=self._watch, name='loop-profiler-watchdog', daemon=True)
+        self._watchdog.start()
+        self.lag_sampler.start()
+
+    async def stop(self) -> Dict:
+        """停止剖析并返回报告"""
+        lag = await self.lag_sampler.stop()
+        self._stop_event.set()
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run
+        LoopProfiler._installed = None
+        return self.report(lag)
+
+    # ------------------------------------------------------------
+    # 记录
+    # ------------------------------------------------------------
+
+    def _watch(self):
+        """看门狗：回调运行超过阈值时抓取事件循环线程的真实调用栈"""
+        interval = max(self.slow_callback / 2, 0.005)
+        last_handle = None
+        while not self._stop_event.wait(interval):
+            running = self._running
+            if running is None:
+                continue
+            handle, start, _ = running
+            if handle is last_handle or time.perf_counter() - start < self.slow_callback:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured_stack = (handle, ''.join(traceback.format_stack(frame, limit=15)))
+                last_handle = handle
+
+    def _record(self, handle, stage: str, elapsed: float, cpu: float):
+        self.stage_cpu[stage] = self.stage_cpu.get(stage, 0.0) + cpu
+        self.stage_wall[stage] = self.stage_wall.get(stage, 0.0) + elapsed
+        self.stage_callbacks[stage] = self.stage_callbacks.get(stage, 0) + 1
+
+        if elapsed < self.slow_callback:
+            return
+        self.slow_count += 1
+        captured = self._captured_stack
+        stack = captured[1] if captured and captured[0] is handle else None
+        if stack is None:
+            # 看门狗未来得及抓取时，退而记录任务当前挂起位置
+            task = getattr(getattr(handle, '_callback', None), '__self__', None)
+            if isinstance(task, asyncio.Task):
+                frames = task.get_stack(limit=10)
+                stack = ''.join(''.join(traceback.format_stack(f, limit=1)) for f in frames) or None
+        description = _describe_callback(handle)
+        logger.warning(f"⚠️  慢回调 [{stage}] {elapsed * 1000:.1f}ms: {description}")
+        if len(self.slow_callbacks) < self.max_slow_records:
+            self.slow_callbacks.append({
+                "stage": stage,
+                "duration_ms": elapsed * 1000,
+                "callback": description,
+                "stack": stack
+            })
+
+    # ------------------------------------------------------------
+    # 报告
+    # ------------------------------------------------------------
+
+    def report(self, lag: Dict = None) -> Dict:
+        wall = time.perf_counter() - self._wall_start
+        loop_cpu = sum(self.stage_cpu.values())
+        return {
+            **(lag or self.lag_sampler.summary()),
+            "wall_seconds": wall,
+            "loop_cpu_seconds": loop_cpu,
+            "process_cpu_seconds": time.process_time() - self._process_cpu_start,
+            "loop_busy_ratio": loop_cpu / wall if wall else 0.0,
+            "stage_cpu_seconds": dict(self.stage_cpu),
+            "stage_callback_seconds": dict(self.stage_wall),
+            "stage_callbacks": dict(self.stage_callbacks),
+            "slow_callback_count": self.slow_count,
+            "slow_callbacks": self.slow_callbacks,
+        }
+
+
+def log_profile_report(report: Dict):
+    """以表格形式输出剖析报告"""
+    logger.info("\n" + "="*80)
+    logger.info("⏱️  事件循环剖析报告")
+    logger.info("="*80)
+    logger.info(f"循环延迟: p50 {report['loop_lag_p50_ms']:.2f}ms | p99 {report['loop_lag_p99_ms']:.2f}ms | "
+                f"max {report['loop_lag_max_ms']:.2f}ms")
+    logger.info(f"循环线程 CPU: {report['loop_cpu_seconds']:.2f}s / 墙钟 {report['wall_seconds']:.2f}s "
+                f"(繁忙度 {report['loop_busy_ratio']:.1%}) | 进程 CPU: {report['process_cpu_seconds']:.2f}s")
+    logger.info(f"\n{'Stage':<14} {'CPU(s)':<10} {'Callbacks':<12}")
+    logger.info("-"*80)
+    for stage, cpu in sorted(report['stage_cpu_seconds'].items(), key=lambda x: -x[1]):
+        logger.info(f"{stage:<14} {cpu:<10.3f} {report['stage_callbacks'].get(stage, 0):<12}")
+    logger.info("-"*80)
+    logger.info(f"慢回调: {report['slow_callback_count']} 个")
+    for item in sorted(report['slow_callbacks'], key=lambda x: -x['duration_ms'])[:5]:
+        logger.info(f"  [{item['stage']}] {item['duration_ms']:.1f}ms {item['callback']}")
+        if item['stack']:
+            logger.info("    " + item['stack'].rstrip().replace("\n", "\n    "))
@@ -0,0 +1,267 @@
+"""
+离线 Mock LLM 后端
+与 AsyncOpenAI 接口兼容的客户端替身，用于压测和复现并发问题，不访问真实 API
+
+返回内容：
+- JSON 模式 + 生成 prompt → 合法的 GenerationOutput
+- JSON 模式 + 评分 prompt → 合法的 EvaluationOutput
+- JSON 模式 + 列表式评分 prompt → 合法的 ListwiseEvaluationOutput（按 【候选 X】 编号逐个打分）
+- 普通模式 → 自由文本（双模型对话的 User / Agent 发言）
+
+可配置：延迟分布、错误率、429 比例、畸形 JSON 比例、token 数。
+同一 prompt 的第 N 次调用结果固定（按 prompt 哈希播种），与并发调度顺序无关。
+"""
+import re
+import json
+import random
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import Dict, List
+
+
+_USER_LINES = [
+    "我最近总是睡不好，一想到明天的事情就很焦虑，不知道该怎么办。",
+    "其实我也试过和家人说，但他们总觉得是我想太多了。",
+    "你说得对，我好像一直在逃避这个问题。",
+    "有时候我会觉得很累，什么都不想做。",
+    "谢谢你愿意听我说这些，我感觉好一点了。",
+]
+
+_AGENT_LINES = [
+    "听起来这段时间你承受了不少压力，这种焦虑让你连休息都受到了影响。能多说说是什么让你最担心吗？",
+    "被身边的人误解一定很难受。你愿意分享一下当时你最希望他们怎么回应你吗？",
+    "能意识到这一点已经很不容易了。我们可以一起看看，有没有一个小的、可以开始尝试的改变。",
+    "感到疲惫是很正常的信号，说明你需要好好照顾自己。最近有没有哪些时刻让你觉得稍微轻松一些？",
+    "很高兴你愿意说出来。你的感受很重要，如果之后还想聊，随时都可以来找我。",
+]
+
+
+class MockRateLimitError(Exception):
+    """模拟 429（openai 不可用时使用）"""
+    status_code = 429
+
+
+class MockAPIError(Exception):
+    """模拟 5xx（openai 不可用时使用）"""
+    status_code = 500
+
+
+def _make_error(status_code: int, message: str) -> Exception:
+    """优先构造 openai 自带的异常类型，使重试/限流逻辑与真实环境一致"""
+    try:
+        import httpx
+        import openai
+        request = httpx.Request("POST", "http://mock-llm/v1/chat/completions")
+        response = httpx.Response(status_code, request=request)
+        if status_code == 429:
+            return openai.RateLimitError(message, response=response, body=None)
+        return openai.InternalServerError(message, response=response, body=None)
+    except ImportError:
+        return MockRateLimitError(message) if status_code == 429 else MockAPIError(message)
+
+
+class _MockCompletions:
+    def __init__(self, owner: "MockAsyncOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, messages: List[Dict], response_format: Dict = None,
+                     temperature: float = 0.7, max_tokens: int = 2000, **kwargs):
+        return await self._owner._complete(model, messages, response_format, max_tokens)
+
+
+class _MockEmbeddings:
+    def __init__(self, owner: "MockAsyncOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, input, **kwargs):
+        return await self._owner._embed(model, input)
+
+
+class MockAsyncOpenAI:
+    """AsyncOpenAI 兼容的 Mock 客户端"""
+
+    def __init__(
+        self,
+        latency: Dict = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        malformed_json_rate: float = 0.0,
+        completion_tokens: int = None,
+        embedding_dim: int = 1536,
+        seed: int = 42,
+        **kwargs
+    ):
+        """
+        Args:
+            latency: 延迟分布，如
+                {"distribution": "lognormal", "median": 0.8, "sigma": 0.5}
+                {"distribution": "uniform", "min": 0.2, "max": 1.5}
+                {"distribution": "exponential", "mean": 0.5}
+                {"distribution": "fixed", "value": 0.1}
+                可选 "tail_prob" / "tail_latency" 模拟偶发的超长请求
+            error_rate: 5xx 错误比例
+            rate_limit_rate: 429 比例
+            malformed_json_rate: JSON 模式下返回畸形 JSON 的比例
+            completion_tokens: 固定的 completion token 数（默认按输出长度估算）
+            embedding_dim: 向量维度
+            seed: 随机种子
+        """
+        self.latency = latency or {"distribution": "lognormal", "median": 0.8, "sigma": 0.5}
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_json_rate = malformed_json_rate
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        self.seed = seed
+        self.chat = SimpleNamespace(completions=_MockCompletions(self))
+        self.embeddings = _MockEmbeddings(self)
+        self._call_counts: Dict[str, int] = {}
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "malformed": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    # ------------------------------------------------------------
+    # 随机性
+    # ------------------------------------------------------------
+
+    def _rng(self, model: str, prompt: str) -> random.Random:
+        """按 (model, prompt, 第 N 次调用) 播种，保证可复现"""
+        key = hashlib.sha256(f"{model}\x00{prompt}".encode('utf-8')).hexdigest()
+        n = self._call_counts.get(key, 0)
+        self._call_counts[key] = n + 1
+        return random.Random(f"{self.seed}:{key}:{n}")
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        cfg = self.latency
+        dist = cfg.get("distribution", "lognormal")
+        if dist == "fixed":
+            value = cfg.get("value", 0.0)
+        elif dist == "uniform":
+            value = rng.uniform(cfg.get("min", 0.0), cfg.get("max", 1.0))
+        elif dist == "exponential":
+            value = rng.expovariate(1.0 / max(cfg.get("mean", 0.5), 1e-9))
+        else:
+            value = rng.lognormvariate(0, cfg.get("sigma", 0.5)) * cfg.get("median", 0.8)
+        if cfg.get("tail_prob") and rng.random() < cfg["tail_prob"]:
+            value = cfg.get("tail_latency", 30.0)
+        return value
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+        return cjk + (len(text) - cjk) // 4 + 1
+
+    # ------------------------------------------------------------
+    # 内容生成
+    # ------------------------------------------------------------
+
+    def _generation_json(self, prompt: str, rng: random.Random) -> Dict:
+        turns_match = re.search(r'(\d+)\s*轮', prompt)
+        num_turns = int(turns_match.group(1)) if turns_match else 5
+        question_match = re.search(r'【问题】\n(.+)', prompt)
+        question = question_match.group(1).strip() if question_match else "（未知问题）"
+        dialogue = []
+        for i in range(num_turns):
+            dialogue.append({"role": "User", "content": rng.choice(_USER_LINES)})
+            dialogue.append({"role": "Assistant", "content": rng.choice(_AGENT_LINES)})
+        return {
+            "question": question,
+            "cot": "情绪识别：焦虑、疲惫；问题分析：压力来源不明确；对话策略：共情、澄清、小步行动。",
+            "dialogue": dialogue
+        }
+
+    @staticmethod
+    def _evaluation_json(rng: random.Random) -> Dict:
+        return {dim: round(rng.uniform(5.0, 9.5), 1)
+                for dim in ["Empathy", "Supportiveness", "Guidance", "Safety"]}
+
+    def _listwise_json(self, prompt: str, rng: random.Random) -> Dict:
+        labels = re.findall(r'【候选 ([A-Z]+)】', prompt)
+        return {"scores": [{"id": label, **self._evaluation_json(rng)} for label in labels]}
+
+    def _render(self, prompt: str, json_mode: bool, rng: random.Random) -> str:
+        if json_mode:
+            if "【候选 " in prompt:
+                payload = self._listwise_json(prompt, rng)
+            elif "dialogue" in prompt and "Empathy" not in prompt:
+                payload = self._generation_json(prompt, rng)
+            else:
+                payload = self._evaluation_json(rng)
+            text = json.dumps(payload, ensure_ascii=False)
+            if rng.random() < self.malformed_json_rate:
+                self.stats["malformed"] += 1
+                text = text[:max(1, len(text) // 2)]
+            return text
+        if "寻求心理咨询帮助的用户" in prompt:
+            return rng.choice(_USER_LINES)
+        return rng.choice(_AGENT_LINES)
+
+    # ------------------------------------------------------------
+    # 请求处理
+    # ------------------------------------------------------------
+
+    async def _complete(self, model: str, messages: List[Dict], response_format: Dict, max_tokens: int):
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        rng = self._rng(model, prompt)
+        self.stats["requests"] += 1
+
+        await asyncio.sleep(self._sample_latency(rng))
+
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            raise _make_error(429, f"Mock rate limit [{model}]")
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            raise _make_error(500, f"Mock server error [{model}]")
+
+        json_mode = bool(response_format and response_format.get("type") == "json_object")
+        content = self._render(prompt, json_mode, rng)
+
+        prompt_tokens = self._count_tokens(prompt)
+        completion_tokens = self.completion_tokens or min(self._count_tokens(content), max_tokens)
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+
+        return SimpleNamespace(
+            id=f"mock-{self.stats['requests']}",
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason="stop",
+                message=SimpleNamespace(role="assistant", content=content)
+            )],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    async def _embed(self, model: str, inputs):
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        rng = self._rng(model, "\x00".join(inputs))
+        self.stats["requests"] += 1
+        await asyncio.sleep(self._sample_latency(rng))
+
+        data = []
+        for i, text in enumerate(inputs):
+            vec_rng = random.Random(hashlib.sha256(text.encode('utf-8')).hexdigest())
+            data.append(SimpleNamespace(
+                index=i,
+                embedding=[vec_rng.gauss(0, 1) for _ in range(self.embedding_dim)]
+            ))
+        tokens = sum(self._count_tokens(t) for t in inputs)
+        self.stats["prompt_tokens"] += tokens
+        return SimpleNamespace(
+            model=model,
+            data=data,
+            usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens)
+        )
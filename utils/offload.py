@@ -0,0 +1,155 @@
+"""
+CPU 密集型工作卸载
+将响应解析（pydantic 校验）和 prompt 渲染（JSON 序列化）从事件循环线程移到线程池/进程池
+
+高并发时大量响应同时返回，逐个在事件循环上校验会阻塞其他请求。
+这里按批次收集任务（攒满 batch_size 或等待 batch_wait_ms 后），一次性交给执行器，
+事件循环只负责 I/O。
+
+执行器类型：
+- none: 直接在事件循环上执行（默认，与原行为一致）
+- thread: 线程池（pydantic-core 校验会释放 GIL 的部分有收益）
+- process: 进程池（真正并行，任务函数与参数需可 pickle）
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+logger = logging.getLogger('experiment')
+
+EXECUTOR_KINDS = ["none", "thread", "process"]
+
+
+class OffloadError(ValueError):
+    """执行器中任务失败（异常在进程间传递时统一转换为该类型）"""
+
+
+def _run_batch(items: List[Tuple[Callable, tuple]]) -> List[Tuple[bool, Any]]:
+    """在执行器中运行一批任务，异常转为字符串以便跨进程传递"""
+    results = []
+    for fn, args in items:
+        try:
+            results.append((True, fn(*args)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def validate_json(schema_class, json_str: str):
+    """用 pydantic schema 校验 JSON 字符串"""
+    return schema_class.model_validate_json(json_str)
+
+
+class BatchOffloader:
+    """批量卸载器"""
+
+    def __init__(self, kind: str = "thread", workers: int = 4, batch_size: int = 32, batch_wait_ms: float = 2.0):
+        """
+        Args:
+            kind: 'thread' 或 'process'
+            workers: 工作线程/进程数
+            batch_size: 攒满多少个任务立即提交
+            batch_wait_ms: 未攒满时最多等待多久提交
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"不支持的执行器类型: {kind}")
+        self.kind = kind
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='offload')
+        self._pending: List[Tuple[Callable, tuple, asyncio.Future]] = []
+        self._timer = None
+        self.stats = {"tasks": 0, "batches": 0}
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """提交任务并等待结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((fn, args, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        batch = [item for item in batch if not item[2].cancelled()]
+        if not batch:
+            return
+
+        self.stats["tasks"] += len(batch)
+        self.stats["batches"] += 1
+        loop = asyncio.get_running_loop()
+        done = loop.run_in_executor(self._executor, _run_batch, [(fn, args) for fn, args, _ in batch])
+        done.add_done_callback(lambda f: self._deliver(batch, f))
+
+    @staticmethod
+    def _deliver(batch, done: asyncio.Future):
+        if done.cancelled() or done.exception() is not None:
+            error = done.exception() if not done.cancelled() else OffloadError("执行器任务被取消")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (ok, value), (_, _, future) in zip(done.result(), batch):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(OffloadError(value))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_offloader: BatchOffloader = None
+_offload_kind: str = None
+
+
+def configure_offload(kind: str = "none", workers: int = 4, batch_size: int = 32, batch_wait_ms: float = 2.0):
+    """配置全局卸载器（在流水线开始前调用）"""
+    global _offloader, _offload_kind
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"不支持的执行器类型: {kind}")
+    shutdown_offload()
+    _offload_kind = kind
+    if kind != "none":
+        _offloader = BatchOffloader(kind, workers, batch_size, batch_wait_ms)
+        logger.info(f"⚙️  解析/渲染卸载: {kind} (workers={workers}, batch={batch_size}, wait={batch_wait_ms}ms)")
+
+
+def _ensure_configured():
+    if _offload_kind is None:
+        from config_async import PARSE_EXECUTOR, PARSE_WORKERS, PARSE_BATCH_SIZE, PARSE_BATCH_WAIT_MS
+        configure_offload(PARSE_EXECUTOR, PARSE_WORKERS, PARSE_BATCH_SIZE, PARSE_BATCH_WAIT_MS)
+
+
+async def offload(fn: Callable, *args) -> Any:
+    """在配置的执行器中运行 fn(*args)；未启用时直接在当前线程执行"""
+    _ensure_configured()
+    if _offloader is None:
+        return fn(*args)
+    return await _offloader.run(fn, *args)
+
+
+async def parse_json_async(schema_class, json_str: str):
+    """异步校验 LLM 返回的 JSON"""
+    return await offload(validate_json, schema_class, json_str)
+
+
+def shutdown_offload():
+    """关闭执行器"""
+    global _offloader, _offload_kind
+    if _offloader is not None:
+        _offloader.shutdown()
+    _offloader = None
+    _offload_kind = None
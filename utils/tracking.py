@@ -0,0 +1,412 @@
+"""
+实验追踪
+- collect_git_info: 一次性获取 Git 信息（各后端共用）
+- Tracker: 追踪后端接口，create_tracker 按模式创建
+    sqlite: 实验记录写入 SQLite（experiments / blobs 表）
+    mlflow: 参数、指标、产物写入 MLflow
+    both:   同时写入两者
+    none:   不追踪（只保留 Outputs/ 下的 JSON 文件）
+
+sqlite / none 模式不会导入 mlflow。
+每个后端有自己的后台线程，调用方只是把调用放入队列（按提交顺序执行），
+事件循环不等待数据库/文件 I/O；finish() 时统一等待写完。
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('experiment')
+
+TRACKING_BACKENDS = ["sqlite", "mlflow", "both", "none"]
+
+
+def _git(args: List[str], cwd) -> str:
+    return subprocess.check_output(['git'] + args, cwd=cwd, stderr=subprocess.DEVNULL).decode('utf-8')
+
+
+def collect_git_info(cwd) -> Optional[Dict[str, str]]:
+    """
+    获取 Git 信息（commit / branch / is_dirty，有未提交更改时附带 diff）
+
+    Returns:
+        信息字典；不在 Git 仓库中时返回 None
+    """
+    try:
+        commit = _git(['rev-parse', 'HEAD'], cwd).strip()
+        branch = _git(['rev-parse', '--abbrev-ref', 'HEAD'], cwd).strip()
+        is_dirty = len(_git(['status', '--porcelain'], cwd).strip()) > 0
+        info = {'commit': commit, 'branch': branch, 'is_dirty': str(is_dirty)}
+        if is_dirty:
+            info['diff'] = _git(['diff'], cwd)
+        return info
+    except Exception as e:
+        logger.warning(f"⚠️  Git 信息获取失败: {e}")
+        return None
+
+
+class Tracker:
+    """
+    追踪后端接口
+
+    默认实现均为空操作（即 none 模式）。所有方法立即返回。
+    """
+
+    name = "none"
+
+    @property
+    def run_id(self) -> Optional[str]:
+        return None
+
+    def start_run(self, version: str, config: Dict, input_questions: List[str], prompts: Dict = None):
+        """开始一次实验"""
+
+    def log_git_info(self, git_info: Optional[Dict[str, str]]):
+        """记录 Git 信息"""
+
+    def log_snapshot(self, prepared: Dict, compression: str, manifest: Dict[str, str], manifest_hash: str):
+        """记录内容寻址快照（prepared 为 utils.blob_store.prepare_files 的结果）"""
+
+    def log_params(self, params: Dict):
+        """记录参数"""
+
+    def log_metrics(self, metrics: Dict[str, float]):
+        """记录指标"""
+
+    def log_metric(self, key: str, value: float):
+        self.log_metrics({key: value})
+
+    def log_outputs(self, **outputs):
+        """记录步骤输出（step1_generation / step2_scores / step3_final / statistics / status）"""
+
+    def log_artifacts(self, files: Dict[str, List[str]] = None, texts: Dict[str, str] = None):
+        """
+        记录产物
+
+        Args:
+            files: {artifact_path: [本地文件, ...]}
+            texts: {artifact 相对路径: 文本内容}
+        """
+
+    def finish(self, status: str = "completed", timeout: float = 300.0) -> Dict:
+        """结束实验：等待后台写入完成，返回统计"""
+        return {}
+
+
+class _BufferedTracker(Tracker):
+    """后台线程按提交顺序执行所有调用"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'tracking-{self.name}')
+        self._futures = []
+        self._disabled = False
+        self.stats = {"calls": 0, "errors": 0, "seconds": 0.0}
+
+    def _submit(self, fn, *args, **kwargs):
+        if self._executor is None:
+            return
+        self._futures.append(self._executor.submit(self._run, fn, *args, **kwargs))
+
+    def _run(self, fn, *args, **kwargs):
+        if self._disabled:
+            return
+        start = time.perf_counter()
+        try:
+            fn(*args, **kwargs)
+            self.stats["calls"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️  [{self.name}] 追踪记录失败: {e}")
+        finally:
+            self.stats["seconds"] += time.perf_counter() - start
+
+    def _init_or_disable(self, fn):
+        """初始化失败时停用该后端，后续记录直接跳过"""
+        try:
+            fn()
+        except Exception:
+            self._disabled = True
+            logger.warning(f"⚠️  [{self.name}] 追踪后端初始化失败，本次实验不再记录到该后端")
+            raise
+
+    def _drain(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        for future in self._futures:
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                logger.warning(f"⚠️  [{self.name}] 等待追踪记录超时/失败: {e}")
+        self._futures = []
+
+    def _shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def finish(self, status: str = "completed", timeout: float = 300.0) -> Dict:
+        if self._executor is None:
+            return self.stats
+        self._submit(self._finish, status)
+        self._drain(timeout)
+        self._shutdown()
+        return self.stats
+
+    def _finish(self, status: str):
+        pass
+
+
+class SqliteTracker(_BufferedTracker):
+    """SQLite 追踪：实验记录、步骤输出、快照清单和 blob"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = db_path
+        self.db = None
+        self.version = None
+        self.metrics = {}
+        # 连接在后台线程中创建（sqlite3 连接不能跨线程使用）
+        self._submit(self._init_or_disable, self._connect)
+
+    def _connect(self):
+        from sqlite_handler import SQLiteHandler
+        self.db = SQLiteHandler(self.db_path)
+
+    def start_run(self, version, config, input_questions, prompts=None):
+        self.version = version
+        self._submit(lambda: self.db.save_experiment(
+            version=version, config=config, input_questions=input_questions, prompts=prompts
+        ))
+
+    def log_git_info(self, git_info):
+        if git_info:
+            self._submit(lambda: self.db.update_experiment_metadata(self.version, git_info=git_info))
+
+    def log_snapshot(self, prepared, compression, manifest, manifest_hash):
+        def save():
+            stats = self.db.save_snapshot(self.version, prepared, compression)
+            logger.info(f"📦 快照: {stats['files']} 个文件, 新增 {stats['new_blobs']} 个 blob "
+                        f"({stats['new_bytes'] / 1024:.1f} KB), 复用 {stats['reused']} 个")
+        self._submit(save)
+
+    def log_metrics(self, metrics):
+        # 指标随 statistics 一起在结束时写入
+        self.metrics.update(metrics)
+
+    def log_outputs(self, **outputs):
+        self._submit(lambda: self.db.update_experiment_outputs(version=self.version, **outputs))
+
+    def _finish(self, status):
+        if self.db is None:
+            return
+        if self.version is not None:
+            row = self.db.get_experiment(self.version) or {}
+            statistics = row.get('statistics') if isinstance(row.get('statistics'), dict) else {}
+            if self.metrics:
+                statistics = {**statistics, "metrics": self.metrics}
+            self.db.update_experiment_outputs(version=self.version, statistics=statistics, status=status)
+        self.db.close()
+        self.db = None
+
+
+class MlflowTracker(_BufferedTracker):
+    """
+    MLflow 追踪
+
+    mlflow 的导入、run 的创建和所有记录都在后台线程中完成，
+    使用 MlflowClient + 显式 run_id，不依赖 fluent API 的线程局部 active run。
+    """
+
+    name = "mlflow"
+
+    def __init__(self, tracking_uri: str = "sqlite:///mlflow.db", experiment_name: str = "ESC_Experiments",
+                 staging_dir: str = None, blob_store: bool = False):
+        """
+        Args:
+            tracking_uri: MLflow tracking URI
+            experiment_name: MLflow 实验名
+            staging_dir: 产物暂存目录（上传完成后删除）
+            blob_store: 是否同时有 SQLite blob 存储（否则快照文件内容作为产物上传）
+        """
+        super().__init__()
+        self.blob_store = blob_store
+        self.tracking_uri = tracking_uri
+        self.experiment_name = experiment_name
+        self.staging_dir = Path(staging_dir) if staging_dir else Path('.mlflow_staging')
+        self.client = None
+        self._run_id = None
+        self._batches = 0
+        self.stats["artifacts"] = 0
+
+    @property
+    def run_id(self):
+        return self._run_id
+
+    def start_run(self, version, config, input_questions, prompts=None):
+        self._submit(self._init_or_disable, lambda: self._start_run(version))
+        self.log_params(config)
+        self.log_metrics({"num_questions": len(input_questions)})
+
+    def _start_run(self, version: str):
+        from mlflow.tracking import MlflowClient
+        self.client = MlflowClient(tracking_uri=self.tracking_uri)
+        experiment = self.client.get_experiment_by_name(self.experiment_name)
+        experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(self.experiment_name)
+        self._run_id = self.client.create_run(experiment_id, run_name=version).info.run_id
+
+    def log_git_info(self, git_info):
+        if not git_info:
+            self._submit(self._log_batch, tags={"git.error": "Git 信息获取失败"})
+            return
+        tags = {
+            "git.commit": git_info['commit'],
+            "git.branch": git_info['branch'],
+            "git.is_dirty": git_info['is_dirty']
+        }
+        if 'diff' in git_info:
+            tags["git.warning"] = "Uncommitted changes detected"
+            self.log_artifacts(texts={"code/git_diff.patch": git_info['diff']})
+        self._submit(self._log_batch, params={"git_commit": git_info['commit'][:8]}, tags=tags)
+
+    def log_snapshot(self, prepared, compression, manifest, manifest_hash):
+        # 有 SQLite 时只记录清单，文件内容在 blobs 表中（python utils/blob_store.py restore 还原）；
+        # 只用 MLflow 时没有 blob 存储，文件内容作为 snapshot/files/ 产物上传
+        self._submit(self._log_batch, tags={"snapshot.manifest_hash": manifest_hash})
+        self.log_artifacts(texts={"snapshot/manifest.json": json.dumps(manifest, ensure_ascii=False, indent=2)})
+        if not self.blob_store:
+            self._batches += 1
+            batch_dir = self.staging_dir / f"batch_{self._batches}"
+            self._submit(self._upload_snapshot, batch_dir, dict(prepared), compression)
+
+    def log_params(self, params):
+        self._submit(self._log_batch, params=dict(params))
+
+    def log_metrics(self, metrics):
+        self._submit(self._log_batch, metrics=dict(metrics))
+
+    def log_artifacts(self, files=None, texts=None):
+        self._batches += 1
+        batch_dir = self.staging_dir / f"batch_{self._batches}"
+        self._submit(self._stage_and_upload, batch_dir, dict(files or {}), dict(texts or {}))
+
+    def _log_batch(self, metrics: Dict = None, params: Dict = None, tags: Dict = None):
+        from mlflow.entities import Metric, Param, RunTag
+        timestamp = int(time.time() * 1000)
+        self.client.log_batch(
+            self._run_id,
+            metrics=[Metric(k, float(v), timestamp, 0) for k, v in (metrics or {}).items()],
+            params=[Param(k, str(v)) for k, v in (params or {}).items()],
+            tags=[RunTag(k, str(v)) for k, v in (tags or {}).items()]
+        )
+
+    def _stage_and_upload(self, batch_dir: Path, files: Dict[str, List[str]], texts: Dict[str, str]):
+        """暂存到一个目录后一次 log_artifacts 上传"""
+        count = 0
+        for artifact_path, paths in files.items():
+            target_dir = batch_dir / artifact_path
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for path in paths:
+                target = target_dir / Path(path).name
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+                count += 1
+        for rel_path, text in texts.items():
+            target = batch_dir / rel_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(text, encoding='utf-8')
+            count += 1
+        if count:
+            self.client.log_artifacts(self._run_id, str(batch_dir))
+            self.stats["artifacts"] += count
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def _upload_snapshot(self, batch_dir: Path, prepared: Dict, compression: str):
+        """解码快照文件并上传到 snapshot/files/<相对路径>"""
+        from utils.blob_store import decode_blob
+        for rel_path, (_, _, stored) in prepared.items():
+            target = batch_dir / "snapshot" / "files" / Path(rel_path).as_posix().lstrip('/')
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(decode_blob(stored, compression))
+        if prepared:
+            self.client.log_artifacts(self._run_id, str(batch_dir))
+            self.stats["artifacts"] += len(prepared)
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def _finish(self, status):
+        if self.client is not None and self._run_id is not None:
+            self.client.set_terminated(self._run_id, "FINISHED" if status == "completed" else "FAILED")
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+class CompositeTracker(Tracker):
+    """同时写入多个后端（各后端的后台线程并行）"""
+
+    def __init__(self, trackers: List[Tracker]):
+        self.trackers = trackers
+        self.name = "+".join(t.name for t in trackers)
+
+    @property
+    def run_id(self):
+        return next((t.run_id for t in self.trackers if t.run_id), None)
+
+    def start_run(self, *args, **kwargs):
+        for t in self.trackers:
+            t.start_run(*args, **kwargs)
+
+    def log_git_info(self, git_info):
+        for t in self.trackers:
+            t.log_git_info(git_info)
+
+    def log_snapshot(self, *args):
+        for t in self.trackers:
+            t.log_snapshot(*args)
+
+    def log_params(self, params):
+        for t in self.trackers:
+            t.log_params(params)
+
+    def log_metrics(self, metrics):
+        for t in self.trackers:
+            t.log_metrics(metrics)
+
+    def log_outputs(self, **outputs):
+        for t in self.trackers:
+            t.log_outputs(**outputs)
+
+    def log_artifacts(self, files=None, texts=None):
+        for t in self.trackers:
+            t.log_artifacts(files, texts)
+
+    def finish(self, status="completed", timeout=300.0):
+        return {t.name: t.finish(status, timeout) for t in self.trackers}
+
+
+def create_tracker(mode: str, db_path: str = "experiments.db", staging_dir: str = None,
+                   tracking_uri: str = "sqlite:///mlflow.db", experiment_name: str = "ESC_Experiments") -> Tracker:
+    """
+    按模式创建追踪后端
+
+    Args:
+        mode: sqlite / mlflow / both / none
+        db_path: SQLite 数据库路径
+        staging_dir: MLflow 产物暂存目录
+        tracking_uri: MLflow tracking URI
+        experiment_name: MLflow 实验名
+    """
+    if mode not in TRACKING_BACKENDS:
+        raise ValueError(f"不支持的追踪后端: {mode}")
+    trackers = []
+    if mode in ("sqlite", "both"):
+        trackers.append(SqliteTracker(db_path))
+    if mode in ("mlflow", "both"):
+        trackers.append(MlflowTracker(tracking_uri, experiment_name, staging_dir, blob_store=mode == "both"))
+    if not trackers:
+        return Tracker()
+    return trackers[0] if len(trackers) == 1 else CompositeTracker(trackers)
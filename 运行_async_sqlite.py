@@ -1,14 +1,18 @@
 #!/data/zl.zhang/Code/venv/bin/python3
 """
 实验主脚本 - 异步版本 + MLflow + SQLite
+
+快速启动：流水线模块在 main_async 中按需导入；追踪后端由 --tracking 选择，sqlite / none 模式不导入 mlflow。
 """
+import time
+_PROCESS_START = time.perf_counter()
+
 import argparse
 import asyncio
 import os
 import sys
 from pathlib import Path
 import logging
-import mlflow
 import json
 from datetime import datetime
 
@@ -20,248 +24,294 @@ from utils.io_handler import (
     save_json,
     format_generation_output,
     format_scoring_output,
-    format_final_output
+    format_final_output,
+    load_json,
+    parse_generation_output
+)
+from config_async import (
+    PARSE_EXECUTOR, PARSE_WORKERS, PARSE_BATCH_SIZE, MAX_CONCURRENT_REQUESTS, REQUESTS_PER_MINUTE,
+    REQUEST_TIMEOUT, HEDGE_REQUESTS, HEDGE_MAX_RATE, ADAPTIVE_CONCURRENCY, ADAPTIVE_INITIAL_LIMIT, ADAPTIVE_MAX_LIMIT,
+    MODEL_RATE_LIMITS, resolve_model
 )
-from pipeline.generation_async import step1_qwen_generation_async
-from pipeline.generation_dual_async import step1_dual_generation_async
-from pipeline.scoring_async import step2_gpt_scoring_async
-from pipeline.scoring_overall_async import step2_overall_scoring_async
-from pipeline.selection import step3_selection
-from sqlite_handler import SQLiteHandler, load_prompts_from_file, load_code_snapshots
+from sqlite_handler import SQLiteHandler, load_prompts_from_file
+from utils.loop_profiler import LoopProfiler, set_stage, log_profile_report
+from utils.offload import configure_offload, shutdown_offload
+from utils.api_client import (
+    configure_rate_limit, configure_model_limits, configure_request_policy, get_request_policy, log_request_stats,
+    configure_adaptive_concurrency, get_adaptive_stats, log_adaptive_stats
+)
+from utils.log_writer import setup_async_logger, stop_async_logger, log_event
+from utils.tracking import collect_git_info, create_tracker, TRACKING_BACKENDS
+from utils.blob_store import collect_snapshot_files, prepare_files, build_manifest
+
+# 模块导入耗时（不含解释器自身启动）
+IMPORT_SECONDS = time.perf_counter() - _PROCESS_START
 
-def setup_logger(log_file: str = None):
-    """配置日志系统"""
+def setup_logger(log_file: str = None, async_mode: bool = False, events_file: str = None,
+                 console: bool = True):
+    """
+    配置日志系统
+    
+    Args:
+        log_file: 日志文件
+        async_mode: 异步日志（队列 + 后台批量写入，不阻塞事件循环）
+        events_file: 结构化事件 JSONL 文件（仅异步模式）
+        console: 是否同时输出到终端
+    """
+    if async_mode:
+        return setup_async_logger(log_file, events_file, console=console)
+    
     if log_file:
         Path(log_file).parent.mkdir(parents=True, exist_ok=True)
     
+    handlers = [logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.NullHandler()]
+    if console:
+        handlers.append(logging.StreamHandler())
     logging.basicConfig(
         level=logging.INFO,
         format='%(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.NullHandler(),
-            logging.StreamHandler()
-        ]
+        handlers=handlers
     )
     return logging.getLogger('experiment')
 
+def prepare_snapshot(input_file: str, compression: str) -> dict:
+    """读取并编码快照文件（代码、prompts、输入），在线程中运行"""
+    files = collect_snapshot_files(PROJECT_ROOT, extra_files=[input_file])
+    return prepare_files(files, PROJECT_ROOT, compression)
+
+
+async def record_run_metadata(tracker, input_file: str, logger, compression: str = "zlib"):
+    """
+    后台收集 Git 信息和快照（各只收集一次），提交给追踪后端
+    
+    快照按内容寻址存入 blobs 表，未改动的文件直接复用已有 blob。
+    与 Step 1 并发执行，不阻塞生成。
+    """
+    if tracker.name == "none":
+        return await asyncio.to_thread(collect_git_info, PROJECT_ROOT)
+    
+    git_info, prepared = await asyncio.gather(
+        asyncio.to_thread(collect_git_info, PROJECT_ROOT),
+        asyncio.to_thread(prepare_snapshot, input_file, compression)
+    )
+    tracker.log_git_info(git_info)
+    manifest, manifest_hash = build_manifest(prepared)
+    tracker.log_snapshot(prepared, compression, manifest, manifest_hash)
+    log_event('snapshot', files=len(manifest), manifest_hash=manifest_hash)
+    if git_info:
+        logger.info(f"✅ 实验元数据已提交记录 (Git: {git_info['commit'][:8]} ({git_info['branch']}))")
+        if git_info['is_dirty'] == 'True':
+            logger.warning("⚠️  警告: 代码有未提交的更改！")
+    else:
+        logger.info("✅ 实验元数据已提交记录 (无 Git 信息)")
+    
+    return git_info
+
+
+def load_source_candidates(from_version: str, db_path: str):
+    """
+    加载已有版本的 Step 1 候选（只重新评分模式）
+    
+    优先读取 Outputs/<v>/qwen_candidates_raw_<v>.json；不存在时从 SQLite 的 step1_generation 还原。
+    
+    Returns:
+        (candidates, 来源描述, 源实验配置)
+    """
+    raw_file = PROJECT_ROOT / 'Outputs' / from_version / f"qwen_candidates_raw_{from_version}.json"
+    source_config = {}
+    experiment = None
+    if Path(db_path).exists():
+        with SQLiteHandler(db_path) as db:
+            experiment = db.get_experiment(from_version)
+        if experiment and isinstance(experiment.get('config'), dict):
+            source_config = experiment['config']
+    
+    if raw_file.exists():
+        return load_json(str(raw_file)), str(raw_file), source_config
+    
+    if experiment and isinstance(experiment.get('step1_generation'), list):
+        return parse_generation_output(experiment['step1_generation']), f"sqlite:{db_path}", source_config
+    
+    raise FileNotFoundError(f"找不到版本 {from_version} 的候选: {raw_file} 不存在，SQLite ({db_path}) 中也没有 step1_generation")
+
+
 async def main_async(args):
     """异步主函数 - 集成 SQLite + MLflow"""
-    # 初始化 SQLite
-    db = SQLiteHandler(args.db_path)
     logger = None
+    tracker = None
+    metadata_task = None
+    
+    # 事件循环剖析（可选）
+    profiler = None
+    if args.profile_loop:
+        profiler = LoopProfiler(slow_callback_ms=args.slow_callback_ms)
+        profiler.start()
     
     try:
-        # 配置 MLflow
-        mlflow.set_tracking_uri("sqlite:///mlflow.db")
-        mlflow.set_experiment("ESC_Experiments")
-        
-        # 启动 MLflow run
-        with mlflow.start_run(run_name=args.version):
-            # 设置输出目录
-            output_dir = PROJECT_ROOT / 'Outputs' / args.version
-            output_dir.mkdir(parents=True, exist_ok=True)
-            output_dir = str(output_dir)
-            
-            # 设置日志（保存到 logs 目录）
-            logs_dir = PROJECT_ROOT / 'logs'
-            logs_dir.mkdir(exist_ok=True)
-            if args.log is None:
-                args.log = str(logs_dir / f'experiment_{args.version}.log')
-            logger = setup_logger(args.log)
-            
-            # 日志头
-            logger.info("="*80)
-            logger.info(f"🧪 实验配置 [{args.version}] - 异步版本 + MLflow + SQLite")
-            logger.info("="*80)
+        # 追踪后端（--no-mlflow 时去掉 MLflow）
+        tracking_mode = args.tracking
+        if args.no_mlflow:
+            tracking_mode = {"both": "sqlite", "mlflow": "none"}.get(tracking_mode, tracking_mode)
+        
+        # 设置输出目录
+        output_dir = PROJECT_ROOT / 'Outputs' / args.version
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_dir = str(output_dir)
+        
+        # 设置日志（保存到 logs 目录）
+        logs_dir = PROJECT_ROOT / 'logs'
+        logs_dir.mkdir(exist_ok=True)
+        if args.log is None:
+            args.log = str(logs_dir / f'experiment_{args.version}.log')
+        events_file = os.path.join(output_dir, f"events_{args.version}.jsonl") if args.async_log else None
+        logger = setup_logger(args.log, async_mode=args.async_log, events_file=events_file,
+                              console=not args.no_console)
+        
+        # 日志头
+        logger.info("="*80)
+        logger.info(f"🧪 实验配置 [{args.version}] - 异步版本 + MLflow + SQLite")
+        logger.info("="*80)
+        if args.from_version:
+            logger.info(f"输入: 版本 {args.from_version} 的候选（只重新评分）")
+        else:
             logger.info(f"输入: {args.input} | 问题数: {args.limit}")
-            logger.info(f"候选数: {args.candidates} | 评分轮次: {args.score_rounds} | Top-K: {args.top_k}")
-            logger.info(f"输出目录: {output_dir}")
-            logger.info(f"SQLite 数据库: {args.db_path}")
-            logger.info("="*80)
-            
-            # 加载问题
+        logger.info(f"候选数: {args.candidates} | 评分轮次: {args.score_rounds} | Top-K: {args.top_k}")
+        logger.info(f"输出目录: {output_dir}")
+        logger.info(f"SQLite 数据库: {args.db_path}")
+        logger.info("="*80)
+        
+        # 追踪后端的初始化（含 mlflow 导入）在其后台线程中进行
+        tracker = create_tracker(tracking_mode, db_path=args.db_path,
+                                 staging_dir=os.path.join(output_dir, '.mlflow_staging'))
+        
+        startup_seconds = time.perf_counter() - _PROCESS_START
+        logger.info(f"⚡ 启动耗时: {startup_seconds:.3f}s (模块导入 {IMPORT_SECONDS:.3f}s) | 追踪后端: {tracker.name}")
+        log_event('startup', import_seconds=IMPORT_SECONDS, startup_seconds=startup_seconds, tracking=tracker.name)
+        
+        # 解析/渲染卸载执行器
+        configure_offload(args.parse_executor, args.parse_workers, args.parse_batch_size)
+        
+        # 全局 API 限流 + 按模型限流（多评委时各评委独立额度）
+        configure_rate_limit(args.max_concurrency, args.rpm)
+        judges = [j.strip() for j in (args.scoring_judges or '').split(',') if j.strip()]
+        model_limits = {resolve_model(k): v for k, v in MODEL_RATE_LIMITS.items()}
+        if args.judge_concurrency or args.judge_rpm:
+            for judge in judges:
+                model_limits[resolve_model(judge)] = {"max_concurrency": args.judge_concurrency, "rpm": args.judge_rpm}
+        configure_model_limits(model_limits)
+        configure_request_policy(args.request_timeout, args.hedge, args.hedge_max_rate)
+        configure_adaptive_concurrency(args.adaptive_concurrency, args.concurrency_initial, args.concurrency_max)
+        
+        # 加载问题（只重新评分模式下问题来自源版本的候选）
+        if args.from_version:
+            candidates, candidates_source, source_config = load_source_candidates(args.from_version, args.db_path)
+            questions = list(dict.fromkeys(c['question'] for c in candidates))
+            logger.info(f"\n♻️  只重新评分: 复用版本 {args.from_version} 的 {len(candidates)} 个候选 ({candidates_source})")
+        else:
             questions = load_questions(args.input, args.limit)
-            logger.info(f"\n✅ 已加载 {len(questions)} 个问题")
-            
-            # 加载 prompts 和代码快照
-            logger.info("📝 加载 prompts 和代码快照...")
-            prompts = load_prompts_from_file('prompts.json')
-            code_snapshots = load_code_snapshots()
-            
-            # 实验配置
-            config = {
-                "limit": args.limit,
-                "candidates": args.candidates,
-                "score_rounds": args.score_rounds,
-                "top_k": args.top_k,
-                "input_file": args.input
-            }
-            
-            # 获取 Git 信息
-            git_info = None
-            try:
-                import subprocess
-                git_commit = subprocess.check_output(
-                    ['git', 'rev-parse', 'HEAD'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                git_branch = subprocess.check_output(
-                    ['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                git_status = subprocess.check_output(
-                    ['git', 'status', '--porcelain'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                git_info = {
-                    'commit': git_commit,
-                    'branch': git_branch,
-                    'is_dirty': str(len(git_status) > 0)
-                }
-            except:
-                pass
-            
-            # 保存实验到 SQLite（初始状态）
-            logger.info("💾 保存实验元数据到 SQLite...")
-            db.save_experiment(
-                version=args.version,
-                config=config,
-                input_questions=questions,
-                prompts=prompts,
-                code_snapshots=code_snapshots,
-                git_info=git_info
+        logger.info(f"\n✅ 已加载 {len(questions)} 个问题")
+        
+        # 加载 prompts（Git 信息和代码快照在后台收集）
+        prompts = load_prompts_from_file('prompts.json')
+        
+        # 实验配置
+        config = {
+            "limit": args.limit,
+            "candidates": args.candidates,
+            "score_rounds": args.score_rounds,
+            "top_k": args.top_k,
+            "input_file": args.input,
+            "scoring_model": resolve_model(args.scoring_model),
+            "prefilter": args.prefilter
+        }
+        if args.mode == 'dual' and args.dual_branching and not args.from_version:
+            config.update({"dual_branching": True, "branch_schedule": args.branch_schedule})
+        if args.mode == 'dual' and args.early_stop != 'off' and not args.from_version:
+            config.update({"early_stop": args.early_stop, "early_stop_min_rounds": args.early_stop_min_rounds})
+        if args.mode == 'dual' and args.dual_beam and not args.from_version:
+            config.update({"dual_beam": True, "beam_expand": args.beam_expand, "turn_scorer": args.turn_scorer})
+        if args.adaptive:
+            config.update({
+                "adaptive": True,
+                "adaptive_initial": args.adaptive_initial,
+                "adaptive_step": args.adaptive_step,
+                "candidate_budget": args.candidate_budget,
+                "target_total": args.target_total,
+                "max_spread": args.max_spread
+            })
+        if judges:
+            from pipeline.scoring_ensemble import parse_judge_weights
+            config.update({
+                "scoring_judges": judges,
+                "judge_weights": parse_judge_weights(args.judge_weights),
+                "judge_weighting": args.judge_weighting
+            })
+        if args.from_version:
+            # 血缘：记录源版本及其生成配置
+            config.update({
+                "limit": len(questions),
+                "candidates": source_config.get("candidates", config["candidates"]),
+                "input_file": source_config.get("input_file", args.input),
+                "from_version": args.from_version,
+                "candidates_source": candidates_source,
+                "source_config": source_config
+            })
+        
+        # 记录实验（初始状态），写入由追踪后端的后台线程完成
+        tracker.start_run(args.version, config, questions, prompts)
+        tracker.log_params({"database": args.db_path})
+        tracker.log_metrics({"startup_seconds": startup_seconds})
+        
+        # Git 信息 + 内容寻址快照，与 Step 1 并发
+        metadata_task = asyncio.create_task(
+            record_run_metadata(tracker, config['input_file'], logger, args.snapshot_compression)
+        )
+        
+        # Step 1: 生成候选答案 (根据模式选择)
+        logger.info("\n" + "="*80)
+        logger.info("🔄 Step 1: 生成候选答案")
+        logger.info("="*80)
+        
+        adaptive_scored = None
+        adaptive_stats = None
+        if args.from_version:
+            logger.info(f"⏭️  跳过生成，复用 {args.from_version} 的候选")
+        elif args.adaptive:
+            # 自适应候选预算：生成与评分交织进行，Step 2 直接使用其评分结果
+            from pipeline.adaptive_async import step12_adaptive_async
+            scoring_prompt = None
+            if args.scoring_prompt_file and Path(args.scoring_prompt_file).exists():
+                with open(args.scoring_prompt_file, 'r', encoding='utf-8') as f:
+                    scoring_prompt = f.read()
+            set_stage('generation')
+            stage_start = time.perf_counter()
+            candidates, adaptive_scored, adaptive_stats = await step12_adaptive_async(
+                questions,
+                max_candidates=args.candidates,
+                initial_candidates=args.adaptive_initial,
+                step_candidates=args.adaptive_step,
+                budget=args.candidate_budget,
+                target_total=args.target_total,
+                max_spread=args.max_spread,
+                mode=args.mode,
+                num_turns=args.num_turns,
+                user_model=args.user_model,
+                agent_model=args.agent_model,
+                dialogue_rounds=args.dialogue_rounds,
+                scoring_mode=args.scoring_mode,
+                scoring_prompt=scoring_prompt,
+                score_rounds=args.score_rounds,
+                scoring_model=resolve_model(args.scoring_model),
+                prefilter=args.prefilter,
+                top_k=args.scoring_top_k
             )
-            if git_info:
-                logger.info(f"✅ 实验元数据已保存到 SQLite (Git: {git_info['commit'][:8]})")
-            else:
-                logger.info("✅ 实验元数据已保存到 SQLite (无 Git 信息)")
-            
-            # ═══════════════════════════════════════════════════════════
-            # 📦 记录完整快照到 MLflow
-            # ═══════════════════════════════════════════════════════════
-            
-            logger.info("\n📦 开始记录完整快照到 MLflow...")
-            
-            # 1️⃣ 记录实验参数
-            logger.info("  ├─ 记录实验参数...")
-            mlflow.log_params(config)
-            mlflow.log_param("database", args.db_path)
-            mlflow.log_metric("num_questions", len(questions))
-            
-            # 2️⃣ 记录 Git 版本信息
-            logger.info("  ├─ 记录 Git 版本...")
-            try:
-                import subprocess
-                
-                git_commit = subprocess.check_output(
-                    ['git', 'rev-parse', 'HEAD'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                git_branch = subprocess.check_output(
-                    ['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                git_status = subprocess.check_output(
-                    ['git', 'status', '--porcelain'],
-                    cwd=PROJECT_ROOT
-                ).decode('utf-8').strip()
-                
-                is_dirty = len(git_status) > 0
-                
-                mlflow.log_param("git_commit", git_commit[:8])
-                mlflow.set_tag("git.commit", git_commit)
-                mlflow.set_tag("git.branch", git_branch)
-                mlflow.set_tag("git.is_dirty", str(is_dirty))
-                
-                if is_dirty:
-                    logger.warning("     ⚠️  警告: 代码有未提交的更改！")
-                    mlflow.set_tag("git.warning", "Uncommitted changes detected")
-                    
-                    git_diff = subprocess.check_output(
-                        ['git', 'diff'],
-                        cwd=PROJECT_ROOT
-                    ).decode('utf-8')
-                    
-                    diff_file = Path(output_dir) / "git_diff.patch"
-                    with open(diff_file, 'w', encoding='utf-8') as f:
-                        f.write(git_diff)
-                    mlflow.log_artifact(str(diff_file), artifact_path="code")
-                
-                logger.info(f"     ✓ Git: {git_commit[:8]} ({git_branch})")
-                
-            except Exception as e:
-                logger.warning(f"     ⚠️  Git 信息获取失败: {e}")
-                mlflow.set_tag("git.error", str(e))
-            
-            # 3️⃣ 记录代码快照（仅核心文件）
-            logger.info("  ├─ 记录代码快照...")
-            import shutil
-            
-            # 定义需要记录的核心文件
-            core_files = [
-                'pipeline/generation_async.py',
-                'pipeline/scoring_async.py', 
-                'pipeline/selection.py',
-                '运行_async_sqlite.py'
-            ]
-            
-            # 可选：config 文件（如果存在）
-            if (PROJECT_ROOT / 'config.py').exists():
-                core_files.append('config.py')
-            
-            # 直接记录文件，不创建 code_snapshot 目录
-            for file_path in core_files:
-                full_path = PROJECT_ROOT / file_path
-                if full_path.exists():
-                    mlflow.log_artifact(str(full_path), artifact_path="code")
-            
-            logger.info(f"     ✓ 已保存 {len(core_files)} 个核心代码文件")
-            
-            # 4️⃣ 记录 Prompts（直接记录源文件）
-            logger.info("  ├─ 记录 Prompts...")
-            prompts_source_file = PROJECT_ROOT / 'prompts.json'
-            if prompts_source_file.exists():
-                mlflow.log_artifact(str(prompts_source_file), artifact_path="config")
-                logger.info(f"     ✓ 已保存 prompts.json")
-            
-            # 如果有其他配置文件也可以加上
-            if (PROJECT_ROOT / 'config.py').exists():
-                mlflow.log_artifact(str(PROJECT_ROOT / 'config.py'), artifact_path="config")
-            
-            # 5️⃣ 记录输入数据（inputs 目录下的所有文件）
-            logger.info("  ├─ 记录输入数据...")
-            
-            # 记录主输入文件
-            if Path(args.input).exists():
-                mlflow.log_artifact(args.input, artifact_path="inputs")
-            
-            # 记录 inputs 目录下的其他文件（如果存在）
-            inputs_dir = PROJECT_ROOT / 'inputs'
-            if inputs_dir.exists():
-                input_files = list(inputs_dir.glob('*'))
-                input_files = [f for f in input_files if f.is_file()]  # 只要文件，不要目录
-                
-                for input_file in input_files:
-                    # 避免重复记录主输入文件
-                    if str(input_file) != str(Path(args.input).absolute()):
-                        mlflow.log_artifact(str(input_file), artifact_path="inputs")
-                
-                logger.info(f"     ✓ 已保存 {len(input_files)} 个输入文件")
-            else:
-                logger.info(f"     ✓ 已保存输入文件: {Path(args.input).name}")
-            
-            logger.info("  └─ 快照记录完成！\n")
-            
-            # Step 1: 生成候选答案 (根据模式选择)
-            logger.info("\n" + "="*80)
-            logger.info("🔄 Step 1: 生成候选答案")
-            logger.info("="*80)
-            
+            log_event('stage', stage='generation', seconds=time.perf_counter() - stage_start, count=len(candidates))
+            tracker.log_metrics({
+                "adaptive_generated": adaptive_stats['generated'],
+                "adaptive_saved_ratio": adaptive_stats['saved_ratio'],
+                "adaptive_questions_met_target": adaptive_stats['questions_met_target']
+            })
+        else:
             # 加载自定义prompt（如果提供）
             generation_prompt = None
             if args.generation_prompt_file and Path(args.generation_prompt_file).exists():
@@ -269,187 +319,327 @@ async def main_async(args):
                     generation_prompt = f.read()
                 logger.info(f"📝 使用自定义生成Prompt: {args.generation_prompt_file}")
             
-            if args.mode == 'dual':
+            set_stage('generation')
+            stage_start = time.perf_counter()
+            if args.mode == 'dual' and args.dual_beam:
+                # 双模型在线束搜索：每轮 Agent 回复即时打分，低分分支提前放弃
+                from pipeline.generation_dual_async import step1_dual_beam_generation_async
+                logger.info(f"模式: 双模型束搜索 | User: {args.user_model} | Agent: {args.agent_model} | 轮数: {args.dialogue_rounds}")
+                candidates = await step1_dual_beam_generation_async(
+                    questions,
+                    args.user_model,
+                    args.agent_model,
+                    args.candidates,
+                    args.dialogue_rounds,
+                    beam_expand=args.beam_expand,
+                    turn_scorer=args.turn_scorer,
+                    judge_model=resolve_model(args.scoring_model)
+                )
+            elif args.mode == 'dual' and args.dual_branching:
+                # 双模型树状生成：候选共享对话前缀
+                from pipeline.generation_dual_async import step1_dual_tree_generation_async
+                branch_schedule = [int(x) for x in args.branch_schedule.split(',')] if args.branch_schedule else None
+                logger.info(f"模式: 双模型树状生成 | User: {args.user_model} | Agent: {args.agent_model} | 轮数: {args.dialogue_rounds}")
+                candidates = await step1_dual_tree_generation_async(
+                    questions,
+                    args.user_model,
+                    args.agent_model,
+                    args.candidates,
+                    args.dialogue_rounds,
+                    branch_schedule
+                )
+            elif args.mode == 'dual':
                 # 双模型对话模式
+                from pipeline.generation_dual_async import step1_dual_generation_async
                 logger.info(f"模式: 双模型对话 | User: {args.user_model} | Agent: {args.agent_model} | 轮数: {args.dialogue_rounds}")
                 candidates = await step1_dual_generation_async(
                     questions, 
                     args.user_model,
                     args.agent_model,
                     args.candidates,
-                    args.dialogue_rounds
+                    args.dialogue_rounds,
+                    early_stop=args.early_stop,
+                    min_rounds=args.early_stop_min_rounds
                 )
+                if args.early_stop != 'off':
+                    rounds = [c['rounds'] for c in candidates]
+                    tracker.log_metrics({
+                        "dialogue_rounds_mean": sum(rounds) / len(rounds) if rounds else 0.0,
+                        "dialogue_early_stopped": sum(1 for c in candidates if c.get('termination'))
+                    })
             else:
                 # 单模型生成模式
+                from pipeline.generation_async import step1_qwen_generation_async
                 logger.info(f"模式: 单模型生成 | 对话轮数: {args.num_turns}")
                 candidates = await step1_qwen_generation_async(questions, args.candidates, args.num_turns)
-            
-            # 保存Step1结果到文件
-            raw_file = os.path.join(output_dir, f"qwen_candidates_raw_{args.version}.json")
-            save_json(candidates, raw_file)
-            logger.info(f"💾 已保存原始数据: {raw_file}")
-            
-            formatted_gen = format_generation_output(candidates)
-            gen_file = os.path.join(output_dir, f"1_generation_{args.version}.json")
-            save_json(formatted_gen, gen_file)
-            logger.info(f"💾 已保存生成结果: {gen_file}")
-            
-            # 更新 SQLite - Step1输出
-            logger.info("💾 保存 Step1 结果到 SQLite...")
-            db.update_experiment_outputs(
-                version=args.version,
-                step1_generation=formatted_gen
+            log_event('stage', stage='generation', seconds=time.perf_counter() - stage_start, count=len(candidates))
+        
+        # 保存Step1结果到文件
+        raw_file = os.path.join(output_dir, f"qwen_candidates_raw_{args.version}.json")
+        save_json(candidates, raw_file)
+        logger.info(f"💾 已保存原始数据: {raw_file}")
+        
+        formatted_gen = format_generation_output(candidates)
+        gen_file = os.path.join(output_dir, f"1_generation_{args.version}.json")
+        save_json(formatted_gen, gen_file)
+        logger.info(f"💾 已保存生成结果: {gen_file}")
+        
+        # 记录 Step1 输出
+        tracker.log_outputs(step1_generation=formatted_gen)
+        
+        tracker.log_metric("num_candidates_generated", len(candidates))
+        
+        # Step 1.5: 本地预筛（规则/词表，不调用 API），只有通过的候选进入评分
+        prefilter_stats = None
+        if args.prefilter != 'off' and not args.adaptive:
+            from pipeline.prefilter import prefilter_candidates, log_prefilter_stats
+            set_stage('prefilter')
+            # 只重新评分模式下不知道源版本的轮数，不检查轮数
+            expected_turns = None if args.from_version else (args.dialogue_rounds if args.mode == 'dual' else args.num_turns)
+            if args.mode == 'dual' and args.early_stop != 'off':
+                expected_turns = None  # 提前结束的对话轮数本就少于上限
+            candidates, rejected, prefilter_stats = prefilter_candidates(
+                candidates, args.prefilter, expected_turns, args.prefilter_max_per_question
             )
-            
-            mlflow.log_metric("num_candidates_generated", len(candidates))
-            
-            # Step 2: 评分 (根据模式选择)
-            logger.info("\n" + "="*80)
-            logger.info("🔄 Step 2: 评分")
-            logger.info("="*80)
-            
-            # 加载自定义prompt（如果提供）
-            scoring_prompt = None
-            if args.scoring_prompt_file and Path(args.scoring_prompt_file).exists():
-                with open(args.scoring_prompt_file, 'r', encoding='utf-8') as f:
-                    scoring_prompt = f.read()
-                logger.info(f"📝 使用自定义打分Prompt: {args.scoring_prompt_file}")
-            
-            if args.scoring_mode == 'overall':
-                # 整体打分模式
-                logger.info(f"模式: 整体打分 | 模型: {args.scoring_model} | Top-K: {args.scoring_top_k or '全部'}")
-                scored_candidates = await step2_overall_scoring_async(
-                    candidates,
-                    scoring_prompt=scoring_prompt,
-                    score_rounds=args.score_rounds,
-                    top_k=args.scoring_top_k
-                )
-            else:
-                # 逐轮打分模式
-                logger.info(f"模式: 逐轮打分 | 模型: {args.scoring_model} | Top-K: {args.scoring_top_k or '全部'}")
-                scored_candidates = await step2_gpt_scoring_async(
-                    candidates,
-                    args.score_rounds,
-                    scoring_mode=args.scoring_mode,
-                    scoring_prompt=scoring_prompt,
-                    top_k=args.scoring_top_k
-                )
-            
-            # 保存Step2结果到文件
-            raw_scores_file = os.path.join(output_dir, f"gpt_scores_raw_{args.version}.json")
-            save_json(scored_candidates, raw_scores_file)
-            logger.info(f"💾 已保存原始评分: {raw_scores_file}")
-            
-            formatted_scores = format_scoring_output(scored_candidates)
-            scores_file = os.path.join(output_dir, f"2_scores_{args.version}.json")
-            save_json(formatted_scores, scores_file)
-            logger.info(f"💾 已保存评分结果: {scores_file}")
-            
-            # 更新 SQLite - Step2输出
-            logger.info("💾 保存 Step2 结果到 SQLite...")
-            db.update_experiment_outputs(
-                version=args.version,
-                step2_scores=formatted_scores
+            log_prefilter_stats(prefilter_stats)
+            if rejected:
+                prefilter_file = os.path.join(output_dir, f"prefilter_rejected_{args.version}.json")
+                save_json(rejected, prefilter_file)
+                logger.info(f"💾 已保存预筛淘汰候选: {prefilter_file}")
+            tracker.log_metrics({
+                "prefilter_passed": prefilter_stats['passed'],
+                "prefilter_rejected": prefilter_stats['rejected'],
+                "prefilter_pass_rate": prefilter_stats['passed'] / prefilter_stats['total'] if prefilter_stats['total'] else 0.0
+            })
+        
+        # Step 2: 评分 (根据模式选择)
+        logger.info("\n" + "="*80)
+        logger.info("🔄 Step 2: 评分")
+        logger.info("="*80)
+        
+        # 加载自定义prompt（如果提供）
+        scoring_prompt = None
+        if args.scoring_prompt_file and Path(args.scoring_prompt_file).exists():
+            with open(args.scoring_prompt_file, 'r', encoding='utf-8') as f:
+                scoring_prompt = f.read()
+            logger.info(f"📝 使用自定义打分Prompt: {args.scoring_prompt_file}")
+        
+        set_stage('scoring')
+        stage_start = time.perf_counter()
+        scoring_model = resolve_model(args.scoring_model)
+        if adaptive_scored is not None:
+            logger.info(f"模式: 自适应候选预算（已在生成时流式评分） | 模型: {scoring_model}")
+            scored_candidates = adaptive_scored
+        elif judges:
+            # 多评委集成打分
+            from pipeline.scoring_ensemble import step2_ensemble_scoring_async, judge_agreement
+            logger.info(f"模式: 多评委集成 ({args.scoring_mode}) | 评委: {', '.join(judges)} | Top-K: {args.scoring_top_k or '全部'}")
+            scored_candidates = await step2_ensemble_scoring_async(
+                candidates,
+                judges,
+                scoring_mode=args.scoring_mode,
+                scoring_prompt=scoring_prompt,
+                score_rounds=args.score_rounds,
+                top_k=args.scoring_top_k,
+                weights=config["judge_weights"],
+                weighting=args.judge_weighting
             )
-            
-            # 计算统计信息
-            if scored_candidates:
-                avg_empathy = sum(c['scores']['Empathy'] for c in scored_candidates) / len(scored_candidates)
-                avg_supportiveness = sum(c['scores']['Supportiveness'] for c in scored_candidates) / len(scored_candidates)
-                avg_guidance = sum(c['scores']['Guidance'] for c in scored_candidates) / len(scored_candidates)
-                avg_safety = sum(c['scores']['Safety'] for c in scored_candidates) / len(scored_candidates)
-                avg_total = sum(c['scores']['Total'] for c in scored_candidates) / len(scored_candidates)
-                
-                statistics = {
-                    "avg_empathy": avg_empathy,
-                    "avg_supportiveness": avg_supportiveness,
-                    "avg_guidance": avg_guidance,
-                    "avg_safety": avg_safety,
-                    "avg_total_score": avg_total,
-                    "num_candidates": len(scored_candidates)
-                }
-                
-                mlflow.log_metrics({
-                    "avg_empathy": avg_empathy,
-                    "avg_supportiveness": avg_supportiveness,
-                    "avg_guidance": avg_guidance,
-                    "avg_safety": avg_safety,
-                    "avg_total_score": avg_total
-                })
-                
-                logger.info(f"\n📊 平均分数:")
-                logger.info(f"  Empathy: {avg_empathy:.2f}")
-                logger.info(f"  Supportiveness: {avg_supportiveness:.2f}")
-                logger.info(f"  Guidance: {avg_guidance:.2f}")
-                logger.info(f"  Safety: {avg_safety:.2f}")
-                logger.info(f"  Total: {avg_total:.2f}")
-            else:
-                statistics = {}
-            
-            # Step 3: 生成最终结果
-            logger.info("\n" + "="*80)
-            logger.info("🔄 Step 3: 生成最终结果")
-            logger.info("="*80)
-            final_results = format_final_output(scored_candidates)
-            final_file = os.path.join(output_dir, f"3_final_results_{args.version}.json")
-            save_json(final_results, final_file)
-            logger.info(f"💾 已保存最终结果: {final_file}")
-            
-            # 更新 SQLite - Step3输出和完成状态
-            logger.info("💾 保存 Step3 结果到 SQLite...")
-            db.update_experiment_outputs(
-                version=args.version,
-                step3_final=final_results,
-                statistics=statistics,
-                status='completed'
+            agreement = judge_agreement(scored_candidates)
+            tracker.log_metrics({
+                f"judge_{judge}_{key}": value
+                for judge, stats in agreement["judges"].items()
+                for key, value in stats.items() if value is not None
+            })
+        elif args.scoring_mode == 'listwise':
+            # 列表式打分：同一问题的候选一次请求
+            from pipeline.scoring_listwise_async import step2_listwise_scoring_async
+            logger.info(f"模式: 列表式打分 | 模型: {scoring_model} | 分块: {args.listwise_chunk_size or '整题'} | Top-K: {args.scoring_top_k or '全部'}")
+            scored_candidates = await step2_listwise_scoring_async(
+                candidates,
+                scoring_prompt=scoring_prompt,
+                score_rounds=args.score_rounds,
+                top_k=args.scoring_top_k,
+                model=scoring_model,
+                chunk_size=args.listwise_chunk_size
             )
-            
-            mlflow.log_metric("num_final_results", len(final_results))
-            
-            # 6️⃣ 记录输出结果到 MLflow（仅核心结果文件）
-            logger.info("📦 记录输出结果到 MLflow...")
-            
-            # 只记录核心输出文件
-            output_files = [
-                gen_file,           # 1_generation_xxx.json
-                scores_file,        # 2_scores_xxx.json  
-                final_file,         # 3_final_results_xxx.json
-                args.log            # 实验日志
-            ]
-            
-            for file_path in output_files:
-                if Path(file_path).exists():
-                    mlflow.log_artifact(file_path, artifact_path="outputs")
-            
-            logger.info(f"  ✓ 已记录 {len(output_files)} 个核心输出文件")
-            
-            # 7️⃣ 记录实验摘要（使用 MLflow 的 dict 功能）
-            logger.info("\n📊 记录实验摘要...")
-            summary = {
-                "version": args.version,
-                "git_commit": git_info.get('commit', 'N/A') if git_info else 'N/A',
-                "git_branch": git_info.get('branch', 'N/A') if git_info else 'N/A',
-                "config": config,
-                "statistics": statistics,
-                "num_questions": len(questions),
-                "num_prompts": len(prompts) if prompts else 0,
-                "timestamp": datetime.now().isoformat()
+        elif args.scoring_mode == 'halving':
+            # 逐次减半排序：只给 Top-K 分界线附近的候选追加轮次
+            from pipeline.scoring_halving_async import step2_halving_scoring_async
+            logger.info(f"模式: 逐次减半排序 | 模型: {scoring_model} | 最大轮次: {args.score_rounds} | Top-K: {args.scoring_top_k or '全部'}")
+            scored_candidates = await step2_halving_scoring_async(
+                candidates,
+                scoring_prompt=scoring_prompt,
+                score_rounds=args.score_rounds,
+                top_k=args.scoring_top_k,
+                model=scoring_model
+            )
+        elif args.scoring_mode == 'overall':
+            # 整体打分模式
+            from pipeline.scoring_overall_async import step2_overall_scoring_async
+            logger.info(f"模式: 整体打分 | 模型: {scoring_model} | Top-K: {args.scoring_top_k or '全部'}")
+            scored_candidates = await step2_overall_scoring_async(
+                candidates,
+                scoring_prompt=scoring_prompt,
+                score_rounds=args.score_rounds,
+                top_k=args.scoring_top_k,
+                model=scoring_model
+            )
+        else:
+            # 逐轮打分模式
+            from pipeline.scoring_async import step2_gpt_scoring_async
+            logger.info(f"模式: 逐轮打分 | 模型: {scoring_model} | Top-K: {args.scoring_top_k or '全部'}")
+            scored_candidates = await step2_gpt_scoring_async(
+                candidates,
+                args.score_rounds,
+                scoring_mode=args.scoring_mode,
+                scoring_prompt=scoring_prompt,
+                top_k=args.scoring_top_k,
+                model=scoring_model
+            )
+        
+        log_event('stage', stage='scoring', seconds=time.perf_counter() - stage_start, count=len(scored_candidates))
+        
+        # 保存Step2结果到文件
+        raw_scores_file = os.path.join(output_dir, f"gpt_scores_raw_{args.version}.json")
+        save_json(scored_candidates, raw_scores_file)
+        logger.info(f"💾 已保存原始评分: {raw_scores_file}")
+        
+        formatted_scores = format_scoring_output(scored_candidates)
+        scores_file = os.path.join(output_dir, f"2_scores_{args.version}.json")
+        save_json(formatted_scores, scores_file)
+        logger.info(f"💾 已保存评分结果: {scores_file}")
+        
+        # 记录 Step2 输出
+        tracker.log_outputs(step2_scores=formatted_scores)
+        
+        # 计算统计信息
+        if scored_candidates:
+            avg_empathy = sum(c['scores']['Empathy'] for c in scored_candidates) / len(scored_candidates)
+            avg_supportiveness = sum(c['scores']['Supportiveness'] for c in scored_candidates) / len(scored_candidates)
+            avg_guidance = sum(c['scores']['Guidance'] for c in scored_candidates) / len(scored_candidates)
+            avg_safety = sum(c['scores']['Safety'] for c in scored_candidates) / len(scored_candidates)
+            avg_total = sum(c['scores']['Total'] for c in scored_candidates) / len(scored_candidates)
+            
+            statistics = {
+                "avg_empathy": avg_empathy,
+                "avg_supportiveness": avg_supportiveness,
+                "avg_guidance": avg_guidance,
+                "avg_safety": avg_safety,
+                "avg_total_score": avg_total,
+                "num_candidates": len(scored_candidates)
             }
             
-            # 直接用 MLflow 的 log_dict，不保存到文件
-            mlflow.log_dict(summary, "summary/experiment_summary.json")
-            logger.info("  ✓ 实验摘要已记录")
-            
-            # 完成
-            logger.info("\n" + "="*80)
-            logger.info("🎉 实验完成！")
-            logger.info("="*80)
-            logger.info(f"输出目录: {output_dir}")
-            logger.info(f"📊 MLflow Run ID: {mlflow.active_run().info.run_id}")
-            logger.info(f"💾 SQLite 数据库: {args.db_path}")
-            logger.info(f"💾 实验版本: {args.version}")
-            logger.info("="*80)
-            
+            tracker.log_metrics({
+                "avg_empathy": avg_empathy,
+                "avg_supportiveness": avg_supportiveness,
+                "avg_guidance": avg_guidance,
+                "avg_safety": avg_safety,
+                "avg_total_score": avg_total
+            })
+            
+            logger.info(f"\n📊 平均分数:")
+            logger.info(f"  Empathy: {avg_empathy:.2f}")
+            logger.info(f"  Supportiveness: {avg_supportiveness:.2f}")
+            logger.info(f"  Guidance: {avg_guidance:.2f}")
+            logger.info(f"  Safety: {avg_safety:.2f}")
+            logger.info(f"  Total: {avg_total:.2f}")
+        else:
+            statistics = {}
+        if prefilter_stats:
+            statistics["prefilter"] = prefilter_stats
+        if adaptive_stats:
+            statistics["adaptive"] = adaptive_stats
+        
+        # 请求超时 / 对冲统计
+        request_stats = get_request_policy().summary()
+        statistics["requests"] = request_stats
+        log_request_stats(request_stats)
+        tracker.log_metrics({
+            "api_requests": request_stats['requests'],
+            "api_timeouts": request_stats['timeouts'],
+            "api_hedged": request_stats['hedged'],
+            "api_hedge_wins": request_stats['hedge_wins']
+        })
+        concurrency_stats = get_adaptive_stats()
+        if concurrency_stats:
+            statistics["concurrency"] = concurrency_stats
+            log_adaptive_stats(concurrency_stats)
+            tracker.log_metrics({
+                f"concurrency_{key}_{model.replace('/', '_')}": s[field]
+                for model, s in concurrency_stats.items()
+                for key, field in (("limit", "limit"), ("max", "max_limit_seen"), ("peak", "max_in_flight"))
+            })
+        
+        # Step 3: 生成最终结果
+        logger.info("\n" + "="*80)
+        logger.info("🔄 Step 3: 生成最终结果")
+        logger.info("="*80)
+        set_stage('selection')
+        final_results = format_final_output(scored_candidates)
+        final_file = os.path.join(output_dir, f"3_final_results_{args.version}.json")
+        save_json(final_results, final_file)
+        logger.info(f"💾 已保存最终结果: {final_file}")
+        
+        # 记录 Step3 输出和完成状态
+        tracker.log_outputs(step3_final=final_results, statistics=statistics, status='completed')
+        
+        tracker.log_metric("num_final_results", len(final_results))
+        set_stage('main')
+        
+        # 事件循环剖析报告
+        if profiler:
+            profile_report = await profiler.stop()
+            profiler = None
+            log_profile_report(profile_report)
+            profile_file = os.path.join(output_dir, f"loop_profile_{args.version}.json")
+            save_json(profile_report, profile_file)
+            tracker.log_metrics({
+                "loop_lag_p99_ms": profile_report['loop_lag_p99_ms'],
+                "loop_lag_max_ms": profile_report['loop_lag_max_ms'],
+                "loop_busy_ratio": profile_report['loop_busy_ratio'],
+                "slow_callback_count": profile_report['slow_callback_count'],
+                **{f"loop_cpu_{stage}": cpu for stage, cpu in profile_report['stage_cpu_seconds'].items()}
+            })
+        
+        # 等待后台元数据收集（Git 信息用于摘要）
+        git_info = await metadata_task
+        
+        # 6️⃣ 输出结果 + 7️⃣ 实验摘要，一次批量提交
+        summary = {
+            "version": args.version,
+            "git_commit": git_info.get('commit', 'N/A') if git_info else 'N/A',
+            "git_branch": git_info.get('branch', 'N/A') if git_info else 'N/A',
+            "config": config,
+            "from_version": args.from_version,
+            "statistics": statistics,
+            "num_questions": len(questions),
+            "num_prompts": len(prompts) if prompts else 0,
+            "timestamp": datetime.now().isoformat()
+        }
+        output_files = [f for f in [gen_file, scores_file, final_file, args.log] if Path(f).exists()]
+        tracker.log_artifacts(
+            {"outputs": output_files},
+            {"summary/experiment_summary.json": json.dumps(summary, ensure_ascii=False, indent=2)}
+        )
+        
+        # 等待追踪后端写完
+        logger.info(f"📦 等待追踪记录完成 ({tracker.name})...")
+        tracking_stats = await asyncio.to_thread(tracker.finish, 'completed')
+        run_id = tracker.run_id
+        tracker = None
+        logger.info(f"  ✓ 追踪记录完成: {json.dumps(tracking_stats, ensure_ascii=False)}")
+        
+        # 完成
+        logger.info("\n" + "="*80)
+        logger.info("🎉 实验完成！")
+        logger.info("="*80)
+        logger.info(f"输出目录: {output_dir}")
+        if run_id is not None:
+            logger.info(f"📊 MLflow Run ID: {run_id}")
+        logger.info(f"💾 SQLite 数据库: {args.db_path}")
+        logger.info(f"💾 实验版本: {args.version}")
+        logger.info("="*80)
+        
     except Exception as e:
         if logger:
             logger.error(f"\n❌ 实验失败: {str(e)}")
@@ -457,18 +647,20 @@ async def main_async(args):
             logger.error(traceback.format_exc())
         
         # 更新状态为失败
-        try:
-            db.update_experiment_outputs(
-                version=args.version,
-                status='failed'
-            )
-        except:
-            pass
+        if tracker is not None:
+            tracker.finish('failed', timeout=30)
+            tracker = None
         
         raise
     finally:
-        # 关闭数据库连接
-        db.close()
+        if metadata_task is not None and not metadata_task.done():
+            metadata_task.cancel()
+        if tracker is not None:
+            tracker.finish('failed', timeout=30)
+        if profiler:
+            await profiler.stop()
+        shutdown_offload()
+        stop_async_logger()
 
 def main():
     parser = argparse.ArgumentParser(description='运行实验 - 异步版本 + MLflow + SQLite')
@@ -479,6 +671,7 @@ def main():
     parser.add_argument('--top-k', type=int, default=5, help='选择Top-K')
     parser.add_argument('--input', type=str, default=str(PROJECT_ROOT / 'inputs' / 'questions.txt'), help='输入文件')
     parser.add_argument('--log', type=str, default=None, help='日志文件路径')
+    parser.add_argument('--no-console', action='store_true', help='日志只写入 --log 文件，不输出到终端（后台运行时避免重复写入）')
     parser.add_argument('--db-path', type=str, default='experiments.db', help='SQLite 数据库文件路径')
     
     # 新增：对话模式参数
@@ -487,15 +680,68 @@ def main():
     parser.add_argument('--user-model', type=str, default='qwen-max', help='双模型模式下的User模型')
     parser.add_argument('--agent-model', type=str, default='gpt-4o-mini', help='双模型模式下的Agent模型')
     parser.add_argument('--dialogue-rounds', type=int, default=3, help='双模型对话轮数')
+    parser.add_argument('--early-stop', type=str, default='off', choices=['off', 'heuristic', 'flag', 'both'], help='双模型对话提前结束: heuristic=本地关键词, flag=模型输出 [END] 标记, both=两者皆可')
+    parser.add_argument('--early-stop-min-rounds', type=int, default=1, help='提前结束前至少进行的轮数')
+    parser.add_argument('--dual-branching', action='store_true', help='双模型树状生成：同一问题的候选共享对话前缀，在靠后的轮次分叉')
+    parser.add_argument('--dual-beam', action='store_true', help='双模型在线束搜索：每轮 Agent 回复即时打分，每题只保留 --candidates 个最优部分对话')
+    parser.add_argument('--beam-expand', type=int, default=2, help='束搜索每个部分对话每轮展开的 Agent 回复数')
+    parser.add_argument('--turn-scorer', type=str, default='judge', choices=['judge', 'prefilter'], help='束搜索轮次打分: judge=短评分 prompt（--scoring-model）, prefilter=本地预筛（干净回复同分，相当于随机采样并剔除违规分支）')
+    parser.add_argument('--branch-schedule', type=str, default=None, help='每轮 Agent 回复的分叉系数，如 1,2,2（默认自动，尽量晚分叉）')
     
     # 新增：打分模式参数
-    parser.add_argument('--scoring-mode', type=str, default='per_turn', choices=['per_turn', 'overall'], help='打分模式: per_turn=逐轮打分, overall=整体打分')
-    parser.add_argument('--scoring-model', type=str, default='gpt-4o-mini', help='打分使用的模型')
+    parser.add_argument('--scoring-mode', type=str, default='per_turn', choices=['per_turn', 'overall', 'listwise', 'halving'], help='打分模式: per_turn=逐轮打分, overall=整体打分, listwise=同一问题的候选一次请求打分, halving=逐次减半排序（--score-rounds 为最大轮次）')
+    parser.add_argument('--listwise-chunk-size', type=int, default=None, help='列表式打分每次请求的最大候选数（默认一个问题的全部候选）')
+    parser.add_argument('--scoring-model', type=str, default='turing-gpt', help='打分使用的模型（AVAILABLE_MODELS 键名或模型ID）')
+    parser.add_argument('--scoring-judges', type=str, default=None, help='多评委集成打分，逗号分隔的评委模型，如 qwen-plus,turing-gpt-mini（设置后忽略 --scoring-model）')
+    parser.add_argument('--judge-weights', type=str, default=None, help='评委权重，如 qwen-plus=2,turing-gpt-mini=1（未列出的评委权重为 1）')
+    parser.add_argument('--judge-weighting', type=str, default='fixed', choices=['fixed', 'agreement'], help='评委加权: fixed=按 --judge-weights, agreement=再按与其他评委的一致性调整')
+    parser.add_argument('--judge-concurrency', type=int, default=0, help='每个评委的最大并发请求数（0=不单独限制）')
+    parser.add_argument('--judge-rpm', type=float, default=0, help='每个评委的每分钟请求数上限（0=不单独限制）')
     parser.add_argument('--scoring-top-k', type=int, default=None, help='每个问题保留前K个结果（None=全部保留）')
+    parser.add_argument('--adaptive', action='store_true', help='自适应候选预算：每题先生成少量候选并流式评分，未达标或分歧大的问题再追加（--candidates 为每题上限）')
+    parser.add_argument('--adaptive-initial', type=int, default=2, help='自适应模式每题首批候选数')
+    parser.add_argument('--adaptive-step', type=int, default=2, help='自适应模式每次追加的候选数')
+    parser.add_argument('--candidate-budget', type=int, default=None, help='自适应模式全局候选预算（默认 问题数 × --candidates）')
+    parser.add_argument('--target-total', type=float, default=32.0, help='自适应模式目标 Total：最高分达到且分歧不大时停止追加')
+    parser.add_argument('--max-spread', type=float, default=3.0, help='自适应模式分歧阈值：候选 Total 标准差超过该值时继续追加')
+    parser.add_argument('--prefilter', type=str, default='off', choices=['off', 'reject', 'rank'], help='评分前本地预筛: off=关闭, reject=淘汰格式错误/违规候选, rank=淘汰并按本地分排序')
+    parser.add_argument('--prefilter-max-per-question', type=int, default=None, help='预筛后每个问题最多送评的候选数（按本地分截断）')
     parser.add_argument('--generation-prompt-file', type=str, default=None, help='自定义生成prompt文件路径')
     parser.add_argument('--scoring-prompt-file', type=str, default=None, help='自定义打分prompt文件路径')
+    parser.add_argument('--from-version', type=str, default=None, help='只重新评分：复用该版本的候选，跳过生成，只运行 Step 2 和 Step 3')
+    
+    # 性能剖析
+    parser.add_argument('--profile-loop', action='store_true', help='剖析事件循环：采样循环延迟、记录慢回调和每阶段CPU时间')
+    parser.add_argument('--slow-callback-ms', type=float, default=100.0, help='慢回调阈值（毫秒）')
+    parser.add_argument('--async-log', action='store_true', help='异步日志：后台线程批量写入，结构化事件单独写入 events_<version>.jsonl')
+    parser.add_argument('--parse-executor', type=str, default=PARSE_EXECUTOR, choices=['none', 'thread', 'process'], help='响应解析/prompt渲染的执行器: none=事件循环, thread=线程池, process=进程池')
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS, help='解析执行器的工作线程/进程数')
+    parser.add_argument('--parse-batch-size', type=int, default=PARSE_BATCH_SIZE, help='每批提交给执行器的任务数')
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENT_REQUESTS, help='全局最大并发请求数（0=不限）')
+    parser.add_argument('--rpm', type=float, default=REQUESTS_PER_MINUTE, help='全局每分钟请求数上限（0=不限）')
+    parser.add_argument('--request-timeout', type=float, default=REQUEST_TIMEOUT, help='单次API请求超时秒数（不含限流排队，0=不限）')
+    parser.add_argument('--hedge', action='store_true', default=HEDGE_REQUESTS, help='对冲请求：请求耗时超过该模型近期p95延迟时再发一个副本，取先返回的有效响应')
+    parser.add_argument('--hedge-max-rate', type=float, default=HEDGE_MAX_RATE, help='对冲请求占总请求的比例上限')
+    parser.add_argument('--adaptive-concurrency', action='store_true', default=ADAPTIVE_CONCURRENCY, help='按模型自适应并发（AIMD）：健康时加性增加并发上限，429/5xx/超时或延迟突增时减半')
+    parser.add_argument('--concurrency-initial', type=int, default=ADAPTIVE_INITIAL_LIMIT, help='自适应并发的初始上限')
+    parser.add_argument('--concurrency-max', type=int, default=ADAPTIVE_MAX_LIMIT, help='自适应并发的最大上限')
+    parser.add_argument('--snapshot-compression', type=str, default='zlib', choices=['zlib', 'none'], help='快照 blob 压缩方式')
+    parser.add_argument('--tracking', type=str, default='both', choices=TRACKING_BACKENDS, help='追踪后端: sqlite / mlflow / both / none（sqlite 和 none 不导入 mlflow）')
+    parser.add_argument('--no-mlflow', action='store_true', help='关闭 MLflow 追踪（从 --tracking 中去掉 mlflow）')
     
     args = parser.parse_args()
+    if args.from_version and args.from_version == args.version:
+        parser.error('--from-version 不能与 --version 相同（会覆盖源版本的输出）')
+    if args.scoring_judges and args.scoring_mode in ('listwise', 'halving'):
+        parser.error(f'多评委集成打分暂不支持 {args.scoring_mode} 模式')
+    if args.dual_beam and args.dual_branching:
+        parser.error('--dual-beam 与 --dual-branching 不能同时使用')
+    if args.early_stop != 'off' and (args.mode != 'dual' or args.dual_beam or args.dual_branching or args.adaptive):
+        parser.error('--early-stop 只适用于 --mode dual 的逐条生成，不能与 --dual-beam / --dual-branching / --adaptive 同时使用')
+    if args.adaptive and (args.from_version or args.scoring_judges or args.scoring_mode in ('listwise', 'halving')):
+        parser.error('--adaptive 只支持 per_turn / overall 单评委打分，且不能与 --from-version 同时使用')
+    if args.adaptive and (args.dual_beam or args.dual_branching):
+        parser.error('--adaptive 不能与 --dual-beam / --dual-branching 同时使用（自适应模式逐条生成候选）')
     
     # 运行异步主函数
     asyncio.run(main_async(args))
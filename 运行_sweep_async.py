@@ -0,0 +1,463 @@
+#!/data/zl.zhang/Code/venv/bin/python3
+"""
+参数扫描 - 异步版本
+对一组配置（网格）构建阶段 DAG：问题加载 → 生成 → 打分 → 选择。
+上游参数相同的阶段只运行一次并在变体间共享（生成结果还会缓存到磁盘，跨扫描复用），
+下游变体在同一个全局限流下并发运行。
+
+配置文件（JSON）:
+    {
+        "base": {"limit": 10, "candidates": 4, "scoring_mode": "overall"},
+        "grid": {"score_rounds": [1, 3], "scoring_prompt_file": [null, "temp_scoring_prompt.txt"]},
+        "variants": [{"scoring_top_k": 2}]
+    }
+grid 做笛卡尔积，variants 为额外的显式变体（与 base 合并）。
+
+用法:
+    python 运行_sweep_async.py --config sweeps/example_sweep.json --name sweep_v1
+    python 运行_sweep_async.py --config sweeps/example_sweep.json --dry-run
+"""
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import itertools
+import logging
+from pathlib import Path
+from functools import lru_cache
+from datetime import datetime
+from typing import List, Dict
+
+PROJECT_ROOT = Path(__file__).parent.absolute()
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.io_handler import load_questions, save_json, load_json, format_generation_output, format_scoring_output, format_final_output
+from utils.api_client import (
+    configure_rate_limit, configure_model_limits, get_rate_limiter,
+    configure_request_policy, get_request_policy, log_request_stats,
+    configure_adaptive_concurrency, get_adaptive_stats, log_adaptive_stats
+)
+from utils.tracking import create_tracker, TRACKING_BACKENDS
+from utils.log_writer import setup_async_logger, stop_async_logger, log_event
+from config_async import (
+    MAX_CONCURRENT_REQUESTS, REQUESTS_PER_MINUTE, MODEL_RATE_LIMITS, REQUEST_TIMEOUT, HEDGE_REQUESTS, HEDGE_MAX_RATE,
+    ADAPTIVE_CONCURRENCY, ADAPTIVE_INITIAL_LIMIT, ADAPTIVE_MAX_LIMIT, resolve_model
+)
+
+logger = logging.getLogger('experiment')
+
+SWEEP_CACHE_DIR = PROJECT_ROOT / 'Outputs' / 'sweep_cache'
+
+# 与 运行_async_sqlite.py 的命令行默认值一致
+DEFAULTS = {
+    "input": str(PROJECT_ROOT / 'inputs' / 'questions.txt'),
+    "limit": 10,
+    "candidates": 2,
+    "mode": "single",
+    "num_turns": 5,
+    "user_model": "qwen-max",
+    "agent_model": "gpt-4o-mini",
+    "dialogue_rounds": 3,
+    "early_stop": "off",
+    "early_stop_min_rounds": 1,
+    "dual_branching": False,
+    "branch_schedule": None,
+    "dual_beam": False,
+    "beam_expand": 2,
+    "turn_scorer": "judge",
+    "generation_prompt_file": None,  # 生成阶段尚不支持自定义 prompt，设置即报错
+    "seed": 0,
+    "scoring_mode": "per_turn",
+    "scoring_model": "turing-gpt",
+    "scoring_judges": None,
+    "judge_weights": None,
+    "judge_weighting": "fixed",
+    "score_rounds": 3,
+    "scoring_top_k": None,
+    "scoring_prompt_file": None,
+    "listwise_chunk_size": None,
+    "prefilter": "off",
+    "prefilter_max_per_question": None,
+}
+
+# 各阶段的输入参数（决定阶段 key）
+QUESTION_FIELDS = ["input", "limit"]
+GENERATION_FIELDS = ["mode", "candidates", "num_turns", "user_model", "agent_model", "dialogue_rounds",
+                     "early_stop", "early_stop_min_rounds", "dual_branching", "branch_schedule", "dual_beam", "beam_expand", "turn_scorer"]
+# seed 只影响列表式打分的打乱顺序
+SCORING_FIELDS = ["prefilter", "prefilter_max_per_question", "scoring_mode", "scoring_model", "scoring_judges", "judge_weights", "judge_weighting",
+                  "score_rounds", "scoring_top_k", "scoring_prompt_file", "listwise_chunk_size", "seed"]
+
+
+def expand_grid(spec: Dict) -> List[Dict]:
+    """展开扫描配置为变体列表"""
+    base = {**DEFAULTS, **spec.get("base", {})}
+    unknown = set(base) - set(DEFAULTS)
+    grid = spec.get("grid", {})
+    unknown |= set(grid) - set(DEFAULTS)
+    for extra in spec.get("variants", []):
+        unknown |= set(extra) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知参数: {sorted(unknown)}")
+
+    variants = []
+    names = list(grid)
+    for values in itertools.product(*[grid[n] for n in names]) if names else [()]:
+        variants.append({**base, **dict(zip(names, values))})
+    for extra in spec.get("variants", []):
+        variants.append({**base, **extra})
+    for variant in variants:
+        if variant["dual_beam"] and variant["dual_branching"]:
+            raise ValueError("dual_beam 与 dual_branching 不能同时使用")
+        if variant["early_stop"] != 'off' and (variant["mode"] != 'dual' or variant["dual_beam"] or variant["dual_branching"]):
+            raise ValueError("early_stop 只适用于 mode=dual 的逐条生成，不能与 dual_beam / dual_branching 同时使用")
+        if variant["generation_prompt_file"]:
+            raise ValueError("generation_prompt_file 暂不支持：生成阶段不读取自定义 prompt，各变体会使用同一个默认 prompt")
+    return variants
+
+
+# 按文件内容（而非路径）参与 key 的字段
+FILE_FIELDS = {"input", "scoring_prompt_file"}
+
+
+def _file_digest(path: str) -> str:
+    """问题/prompt 文件按内容参与 key（文件名相同、内容不同视为不同阶段，磁盘缓存不会复用旧内容的结果）"""
+    if path and Path(path).exists():
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+    return None
+
+
+@lru_cache(maxsize=None)
+def generation_fingerprint(num_turns: int) -> Dict:
+    """
+    生成阶段的隐含输入：解析后的生成 prompt（prompts.json 与双模型 prompt 构造函数）和 LLM 后端
+    
+    prompt 以占位符渲染后取摘要，修改 prompts.json 后磁盘缓存失效；
+    后端含 Mock 配置，Mock/压测扫描的结果不会被真实扫描复用
+    """
+    from config_async import LLM_BACKEND, API_BASE_URL, load_mock_config, build_generation_prompt, build_turn_evaluation_prompt
+    from pipeline.generation_dual_async import build_user_prompt, build_agent_prompt, _END_INSTRUCTION
+    history = [{"speaker": "user", "content": "{user}"}, {"speaker": "agent", "content": "{agent}"},
+               {"speaker": "user", "content": "{user}"}]
+    rendered = [
+        build_generation_prompt("{question}", num_turns),
+        build_user_prompt("{question}"),
+        build_user_prompt("{question}", history[:2]),
+        build_agent_prompt("{question}", history),
+        build_turn_evaluation_prompt("{question}", "{context}", "{reply}"),
+        _END_INSTRUCTION
+    ]
+    backend = {"backend": LLM_BACKEND}
+    backend.update({"mock": load_mock_config()} if LLM_BACKEND == "mock" else {"base_url": API_BASE_URL})
+    return {
+        "prompts": hashlib.sha256("\x00".join(rendered).encode('utf-8')).hexdigest()[:16],
+        "backend": hashlib.sha256(json.dumps(backend, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    }
+
+
+def stage_key(stage: str, config: Dict, fields: List[str], parent: str = None, extra: Dict = None) -> str:
+    """阶段 key = 上游 key + 本阶段参数（+ 不在配置里的隐含输入）"""
+    payload = {"stage": stage, "parent": parent, **(extra or {})}
+    for field in fields:
+        value = config.get(field)
+        payload[field] = _file_digest(value) if field in FILE_FIELDS else value
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+
+
+class SweepDAG:
+    """阶段去重执行：相同 key 的阶段只运行一次，所有下游共享同一个任务"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {}  # 每个阶段实际执行次数
+
+    def run(self, stage: str, key: str, factory) -> asyncio.Future:
+        if key in self._tasks:
+            return self._tasks[key]
+        self.stats[stage] = self.stats.get(stage, 0) + 1
+        task = asyncio.ensure_future(factory())
+        self._tasks[key] = task
+        return task
+
+
+class SweepRunner:
+    """扫描执行器"""
+
+    def __init__(self, name: str, variants: List[Dict], output_dir: Path, tracking: str = "sqlite",
+                 db_path: str = "experiments.db", use_cache: bool = True):
+        self.name = name
+        self.variants = variants
+        self.output_dir = output_dir
+        self.tracking = tracking
+        self.db_path = db_path
+        self.use_cache = use_cache
+        self.dag = SweepDAG()
+        self.cache_hits = 0
+
+    def keys(self, config: Dict) -> Dict[str, str]:
+        q_key = stage_key("questions", config, QUESTION_FIELDS)
+        g_key = stage_key("generation", config, GENERATION_FIELDS, q_key, generation_fingerprint(config["num_turns"]))
+        s_key = stage_key("scoring", config, SCORING_FIELDS, g_key)
+        return {"questions": q_key, "generation": g_key, "scoring": s_key}
+
+    # ------------------------------------------------------------
+    # 阶段
+    # ------------------------------------------------------------
+
+    async def _questions(self, config: Dict) -> List[str]:
+        return load_questions(config["input"], config["limit"])
+
+    async def _generation(self, config: Dict, keys: Dict) -> List[Dict]:
+        questions = await self.dag.run("questions", keys["questions"], lambda: self._questions(config))
+        cache_file = SWEEP_CACHE_DIR / f"generation_{keys['generation']}.json"
+        if self.use_cache and cache_file.exists():
+            self.cache_hits += 1
+            logger.info(f"♻️  复用生成缓存: {cache_file.name}")
+            return load_json(str(cache_file))
+
+        if config["mode"] == 'dual' and config["dual_beam"]:
+            from pipeline.generation_dual_async import step1_dual_beam_generation_async
+            candidates = await step1_dual_beam_generation_async(
+                questions, config["user_model"], config["agent_model"], config["candidates"],
+                config["dialogue_rounds"], beam_expand=config["beam_expand"], turn_scorer=config["turn_scorer"],
+                judge_model=resolve_model(config["scoring_model"])
+            )
+        elif config["mode"] == 'dual' and config["dual_branching"]:
+            from pipeline.generation_dual_async import step1_dual_tree_generation_async
+            candidates = await step1_dual_tree_generation_async(
+                questions, config["user_model"], config["agent_model"],
+                config["candidates"], config["dialogue_rounds"], config["branch_schedule"]
+            )
+        elif config["mode"] == 'dual':
+            from pipeline.generation_dual_async import step1_dual_generation_async
+            candidates = await step1_dual_generation_async(
+                questions, config["user_model"], config["agent_model"],
+                config["candidates"], config["dialogue_rounds"],
+                early_stop=config["early_stop"], min_rounds=config["early_stop_min_rounds"]
+            )
+        else:
+            from pipeline.generation_async import step1_qwen_generation_async
+            candidates = await step1_qwen_generation_async(questions, config["candidates"], config["num_turns"])
+
+        SWEEP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        save_json(candidates, str(cache_file))
+        return candidates
+
+    async def _scoring(self, config: Dict, keys: Dict) -> List[Dict]:
+        candidates = await self.dag.run("generation", keys["generation"], lambda: self._generation(config, keys))
+        scoring_prompt = None
+        if config["scoring_prompt_file"] and Path(config["scoring_prompt_file"]).exists():
+            scoring_prompt = Path(config["scoring_prompt_file"]).read_text(encoding='utf-8')
+
+        if config["prefilter"] != 'off':
+            from pipeline.prefilter import prefilter_candidates, log_prefilter_stats
+            expected_turns = config["dialogue_rounds"] if config["mode"] == 'dual' else config["num_turns"]
+            if config["mode"] == 'dual' and config["early_stop"] != 'off':
+                expected_turns = None
+            candidates, _, prefilter_stats = prefilter_candidates(
+                candidates, config["prefilter"], expected_turns, config["prefilter_max_per_question"]
+            )
+            log_prefilter_stats(prefilter_stats)
+
+        if config["scoring_judges"]:
+            from pipeline.scoring_ensemble import step2_ensemble_scoring_async
+            return await step2_ensemble_scoring_async(
+                candidates, config["scoring_judges"], scoring_mode=config["scoring_mode"],
+                scoring_prompt=scoring_prompt, score_rounds=config["score_rounds"], top_k=config["scoring_top_k"],
+                weights=config["judge_weights"], weighting=config["judge_weighting"]
+            )
+        model = resolve_model(config["scoring_model"])
+        if config["scoring_mode"] == 'listwise':
+            from pipeline.scoring_listwise_async import step2_listwise_scoring_async
+            return await step2_listwise_scoring_async(
+                candidates, scoring_prompt=scoring_prompt, score_rounds=config["score_rounds"],
+                top_k=config["scoring_top_k"], model=model, chunk_size=config["listwise_chunk_size"],
+                seed=config["seed"]
+            )
+        if config["scoring_mode"] == 'halving':
+            from pipeline.scoring_halving_async import step2_halving_scoring_async
+            return await step2_halving_scoring_async(
+                candidates, scoring_prompt=scoring_prompt, score_rounds=config["score_rounds"],
+                top_k=config["scoring_top_k"], model=model
+            )
+        if config["scoring_mode"] == 'overall':
+            from pipeline.scoring_overall_async import step2_overall_scoring_async
+            return await step2_overall_scoring_async(
+                candidates, scoring_prompt=scoring_prompt,
+                score_rounds=config["score_rounds"], top_k=config["scoring_top_k"], model=model
+            )
+        from pipeline.scoring_async import step2_gpt_scoring_async
+        return await step2_gpt_scoring_async(
+            candidates, config["score_rounds"], scoring_mode=config["scoring_mode"],
+            scoring_prompt=scoring_prompt, top_k=config["scoring_top_k"], model=model
+        )
+
+    # ------------------------------------------------------------
+    # 变体
+    # ------------------------------------------------------------
+
+    async def run_variant(self, index: int, config: Dict) -> Dict:
+        variant_id = f"v{index:03d}"
+        version = f"{self.name}_{variant_id}"
+        keys = self.keys(config)
+        start = time.perf_counter()
+
+        candidates = await self.dag.run("generation", keys["generation"], lambda: self._generation(config, keys))
+        scored = await self.dag.run("scoring", keys["scoring"], lambda: self._scoring(config, keys))
+        final_results = format_final_output(scored)
+
+        variant_dir = self.output_dir / variant_id
+        variant_dir.mkdir(parents=True, exist_ok=True)
+        formatted_gen = format_generation_output(candidates)
+        formatted_scores = format_scoring_output(scored)
+        save_json(formatted_gen, str(variant_dir / f"1_generation_{version}.json"))
+        save_json(formatted_scores, str(variant_dir / f"2_scores_{version}.json"))
+        save_json(final_results, str(variant_dir / f"3_final_results_{version}.json"))
+
+        statistics = {"num_candidates": len(scored)}
+        if scored:
+            for dim in ['Empathy', 'Supportiveness', 'Guidance', 'Safety', 'Total']:
+                key = "avg_total_score" if dim == 'Total' else f"avg_{dim.lower()}"
+                statistics[key] = sum(c['scores'][dim] for c in scored) / len(scored)
+
+        tracker = create_tracker(self.tracking, db_path=self.db_path,
+                                 staging_dir=str(variant_dir / '.mlflow_staging'))
+        questions = await self.dag.run("questions", keys["questions"], lambda: self._questions(config))
+        tracker.start_run(version, {**config, "sweep": self.name, "stage_keys": keys}, questions)
+        tracker.log_outputs(step1_generation=formatted_gen)
+        tracker.log_outputs(step2_scores=formatted_scores)
+        tracker.log_outputs(step3_final=final_results, statistics=statistics, status='completed')
+        tracker.log_metrics({k: v for k, v in statistics.items()})
+        await asyncio.to_thread(tracker.finish, 'completed')
+
+        seconds = time.perf_counter() - start
+        log_event('sweep_variant', sweep=self.name, variant=variant_id, seconds=seconds, **keys, **statistics)
+        return {"variant": variant_id, "version": version, "config": config, "keys": keys,
+                "statistics": statistics, "seconds": seconds}
+
+    async def run(self) -> List[Dict]:
+        results = await asyncio.gather(
+            *[self.run_variant(i, cfg) for i, cfg in enumerate(self.variants, 1)],
+            return_exceptions=True
+        )
+        summary = []
+        for i, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                logger.error(f"❌ 变体 v{i:03d} 失败: {result}")
+                summary.append({"variant": f"v{i:03d}", "config": self.variants[i - 1], "error": str(result)})
+            else:
+                summary.append(result)
+        return summary
+
+
+def varying_fields(variants: List[Dict]) -> List[str]:
+    """变体间取值不同的参数（用于汇总表）"""
+    return [k for k in DEFAULTS if len({json.dumps(v.get(k)) for v in variants}) > 1]
+
+
+def log_plan(runner: SweepRunner, fields: List[str]):
+    """输出 DAG 计划：每个变体的阶段 key"""
+    header = f"{'Variant':<9} {'Gen':<14} {'Score':<14} " + " ".join(f"{f:<22}" for f in fields)
+    logger.info(header)
+    logger.info("-" * len(header))
+    gen_keys, score_keys = set(), set()
+    for i, cfg in enumerate(runner.variants, 1):
+        keys = runner.keys(cfg)
+        gen_keys.add(keys["generation"])
+        score_keys.add(keys["scoring"])
+        logger.info(f"{f'v{i:03d}':<9} {keys['generation']:<14} {keys['scoring']:<14} "
+                    + " ".join(f"{str(cfg.get(f)):<22}" for f in fields))
+    logger.info("-" * len(header))
+    logger.info(f"变体 {len(runner.variants)} 个 → 生成阶段 {len(gen_keys)} 个 | 打分阶段 {len(score_keys)} 个")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='参数扫描 - 共享上游阶段，全局限流并发运行')
+    parser.add_argument('--config', type=str, required=True, help='扫描配置 JSON 文件')
+    parser.add_argument('--name', type=str, default=None, help='扫描名称（默认 sweep_<时间戳>）')
+    parser.add_argument('--tracking', type=str, default='sqlite', choices=TRACKING_BACKENDS, help='每个变体的追踪后端')
+    parser.add_argument('--db-path', type=str, default='experiments.db', help='SQLite 数据库文件路径')
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENT_REQUESTS, help='全局最大并发请求数（0=不限）')
+    parser.add_argument('--rpm', type=float, default=REQUESTS_PER_MINUTE, help='全局每分钟请求数上限（0=不限）')
+    parser.add_argument('--request-timeout', type=float, default=REQUEST_TIMEOUT, help='单次API请求超时秒数（不含限流排队，0=不限）')
+    parser.add_argument('--hedge', action='store_true', default=HEDGE_REQUESTS, help='对冲请求：请求耗时超过该模型近期p95延迟时再发一个副本')
+    parser.add_argument('--hedge-max-rate', type=float, default=HEDGE_MAX_RATE, help='对冲请求占总请求的比例上限')
+    parser.add_argument('--adaptive-concurrency', action='store_true', default=ADAPTIVE_CONCURRENCY, help='按模型自适应并发（AIMD）')
+    parser.add_argument('--concurrency-initial', type=int, default=ADAPTIVE_INITIAL_LIMIT, help='自适应并发的初始上限')
+    parser.add_argument('--concurrency-max', type=int, default=ADAPTIVE_MAX_LIMIT, help='自适应并发的最大上限')
+    parser.add_argument('--no-cache', action='store_true', help='不复用磁盘上的生成缓存')
+    parser.add_argument('--dry-run', action='store_true', help='只输出 DAG 计划，不调用 API')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    variants = expand_grid(spec)
+    name = args.name or f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    output_dir = PROJECT_ROOT / 'Outputs' / name
+
+    if args.dry_run:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    else:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        setup_async_logger(str(output_dir / f"sweep_{name}.log"), str(output_dir / f"events_{name}.jsonl"))
+
+    runner = SweepRunner(name, variants, output_dir, args.tracking, args.db_path, use_cache=not args.no_cache)
+    fields = varying_fields(variants)
+
+    logger.info("=" * 80)
+    logger.info(f"🧪 参数扫描 [{name}] - {len(variants)} 个变体")
+    logger.info("=" * 80)
+    log_plan(runner, fields)
+    if args.dry_run:
+        return
+
+    try:
+        configure_rate_limit(args.max_concurrency, args.rpm)
+        configure_model_limits({resolve_model(k): v for k, v in MODEL_RATE_LIMITS.items()})
+        configure_request_policy(args.request_timeout, args.hedge, args.hedge_max_rate)
+        configure_adaptive_concurrency(args.adaptive_concurrency, args.concurrency_initial, args.concurrency_max)
+        start = time.perf_counter()
+        summary = asyncio.run(runner.run())
+        elapsed = time.perf_counter() - start
+
+        logger.info("\n" + "=" * 80)
+        logger.info(f"📊 扫描结果 [{name}]")
+        logger.info("=" * 80)
+        logger.info(f"{'Variant':<9} {'Total':<8} {'N':<5} " + " ".join(f"{f:<22}" for f in fields))
+        logger.info("-" * 80)
+        for item in summary:
+            stats = item.get("statistics", {})
+            total = f"{stats['avg_total_score']:.2f}" if 'avg_total_score' in stats else "失败"
+            logger.info(f"{item['variant']:<9} {total:<8} {stats.get('num_candidates', 0):<5} "
+                        + " ".join(f"{str(item['config'].get(f)):<22}" for f in fields))
+        logger.info("-" * 80)
+        limiter = get_rate_limiter()
+        for stage, count in runner.dag.stats.items():
+            logger.info(f"  {stage}: 执行 {count} 次 / {len(variants)} 个变体")
+        logger.info(f"  生成缓存命中: {runner.cache_hits} | API 请求: {limiter.stats['requests']} | "
+                    f"最大在途: {limiter.stats['max_in_flight']} | 总耗时: {elapsed:.1f}s")
+        request_stats = get_request_policy().summary()
+        log_request_stats(request_stats)
+        concurrency_stats = get_adaptive_stats()
+        log_adaptive_stats(concurrency_stats)
+
+        save_json({
+            "name": name,
+            "config": spec,
+            "dag": runner.dag.stats,
+            "cache_hits": runner.cache_hits,
+            "rate_limit": limiter.stats,
+            "requests": request_stats,
+            "concurrency": concurrency_stats,
+            "seconds": elapsed,
+            "variants": summary
+        }, str(output_dir / f"sweep_summary_{name}.json"))
+        logger.info(f"💾 扫描汇总: {output_dir / f'sweep_summary_{name}.json'}")
+    finally:
+        stop_async_logger()
+
+
+if __name__ == "__main__":
+    main()